@@ -0,0 +1,316 @@
+"""
+Benchmarks of the trajectory and state machine hot paths.
+
+Run with ``nox -s benchmarks`` or ``python benchmarks/run.py``. Results are
+written as JSON and compared against the limits in ``thresholds.json`` and,
+optionally, against the results of a previous run given with ``--baseline``.
+The script exits with status 1 if any benchmark regressed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import datetime as dt
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import types
+import typing
+from pathlib import Path
+
+import panda_py
+
+import trinkgelage
+from trinkgelage.demo import control, tray
+from trinkgelage.monitoring import metrics
+from trinkgelage.robot import actions, backend, sim, trajectories
+
+DIR = Path(__file__).parent.resolve()
+
+Benchmark = typing.Callable[[], typing.Tuple[typing.Callable[[], object], int, str]]
+"""Sets up a benchmark and returns the function to time, the number of
+units of work done per call and the name of the unit."""
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> typing.Callable[[Benchmark], Benchmark]:
+    def register(setup: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class InstantClock:
+    """Clock whose time only advances when slept, such that simulated
+    robots never block."""
+
+    speed = float("inf")
+
+    def __init__(self) -> None:
+        self._now = 0.0
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, duration: float) -> None:
+        if duration > 0:
+            with self._lock:
+                self._now += duration
+
+    def sleep_until(self, t: float) -> None:
+        self.sleep(t - self._now)
+
+
+class StandInController:
+    def set_control(self, position: object, velocity: object) -> None:
+        pass
+
+
+class StandInContext:
+    def __enter__(self) -> StandInContext:  # noqa: PYI034
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+    def ok(self) -> bool:
+        return True
+
+
+class StandInPanda:
+    """Robot that accepts every command and returns immediately."""
+
+    JointPosition = StandInController
+
+    def move_to_joint_position(self, *args: object, **kwargs: object) -> bool:
+        del args, kwargs
+        return True
+
+    def move_to_pose(self, *args: object, **kwargs: object) -> bool:
+        del args, kwargs
+        return True
+
+    def start_controller(self, controller: object) -> None:
+        pass
+
+    def stop_controller(self) -> None:
+        pass
+
+    def create_context(self, *args: object, **kwargs: object) -> StandInContext:
+        del args, kwargs
+        return StandInContext()
+
+    def get_state(self) -> types.SimpleNamespace:
+        return types.SimpleNamespace(q=[0.0] * 7, dq=[0.0] * 7, O_F_ext_hat_K=[0.0] * 6)
+
+
+def _data_files() -> list[str]:
+    return sorted(p.name for p in Path(trajectories.DATA_PATH).glob("*.csv"))
+
+
+def _register_load_csv() -> None:
+    for filename in _data_files():
+
+        @benchmark(f"load_csv[{filename}]")
+        def load_csv(filename: str = filename) -> tuple[typing.Any, int, str]:
+            actions.load_csv(filename)
+            return lambda: actions.load_csv(filename), 1, "call"
+
+
+_register_load_csv()
+
+
+@benchmark("load_csv[cold]")
+def load_csv_cold() -> tuple[typing.Any, int, str]:
+    files = _data_files()
+    root = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+
+    def run() -> None:
+        # Every call converts the CSV files into an empty cache, instead of
+        # memory-mapping the binary files of the previous call
+        store = trajectories.TrajectoryStore(cache_path=tempfile.mkdtemp(dir=root))
+        for filename in files:
+            store.load(filename)
+
+    return run, len(files), "file"
+
+
+@benchmark("motion_from_file[positions]")
+def motion_from_file_positions() -> tuple[typing.Any, int, str]:
+    robot = typing.cast(panda_py.Panda, StandInPanda())
+    files = ["pre_grasp_faucet.csv", "grasp_faucet.csv", "left_idle.csv"]
+    return lambda: actions.motion_from_file(robot, files), 1, "call"
+
+
+@benchmark("motion_from_file[mixed]")
+def motion_from_file_mixed() -> tuple[typing.Any, int, str]:
+    robot = typing.cast(panda_py.Panda, StandInPanda())
+    files = ["place_cup.csv", "post_place_cup.csv", "right_idle.csv"]
+    return lambda: actions.motion_from_file(robot, files), 1, "call"
+
+
+@benchmark("play_trajectory[tick]")
+def play_trajectory_tick() -> tuple[typing.Any, int, str]:
+    robot = typing.cast(panda_py.Panda, StandInPanda())
+    q, dq = trajectories.store.load_retimed("place_cup.csv", 1.0)
+    return lambda: actions.play_trajectory(robot, q, dq), len(q), "tick"
+
+
+@benchmark("slot_table[load]")
+def slot_table_load() -> tuple[typing.Any, int, str]:
+    layout = tray.TrayLayout()
+    tray.SlotTable.load(layout)
+    return lambda: tray.SlotTable.load(layout), layout.max_cups, "cup"
+
+
+@benchmark("metrics[observe]")
+def metrics_observe() -> tuple[typing.Any, int, str]:
+    registry = metrics.Registry()
+    histogram = metrics.Histogram(
+        "latency_seconds", "", [0.1, 1, 10], ["source"], metrics_registry=registry
+    )
+    return lambda: histogram.observe(0.5, source="button"), 1, "call"
+
+
+@benchmark("demo_cycle")
+def demo_cycle() -> tuple[typing.Any, int, str]:
+    world = sim.SimWorld(typing.cast(backend.Clock, InstantClock()), seed=0)
+    robot_backend = sim.SimBackend(world=world)
+    model = control.DemoModel(
+        robot_backend.left,
+        robot_backend.right,
+        enforce_rt=False,
+        robot_backend=robot_backend,
+    )
+    ctrl = control.DemoControl(model)
+
+    def run() -> None:
+        model.cups = model.max_cups
+        ctrl.start_demo()
+
+    return run, 1, "cycle"
+
+
+def measure(setup: Benchmark, rounds: int, min_time: float) -> dict[str, typing.Any]:
+    func, units, unit = setup()
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    times = [t / number / units for t in timer.repeat(rounds, number)]
+    return {
+        "unit": unit,
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rounds": rounds,
+        "number": number,
+    }
+
+
+def check(
+    results: dict[str, dict[str, typing.Any]],
+    thresholds: dict[str, float],
+    baseline: dict[str, dict[str, typing.Any]],
+    max_slowdown: float,
+) -> list[str]:
+    """Regressions of `results` as human-readable messages."""
+    regressions = []
+    for name, result in results.items():
+        median = result["median"]
+        limit = thresholds.get(name)
+        if limit is not None and median > limit:
+            regressions.append(
+                f"{name}: {median * 1e6:.1f}us exceeds threshold {limit * 1e6:.1f}us"
+            )
+        if name in baseline:
+            # The minimum is least affected by other load on the machine
+            fastest, previous = result["min"], baseline[name]["min"]
+            if fastest > previous * max_slowdown:
+                regressions.append(
+                    f"{name}: {fastest * 1e6:.1f}us is {fastest / previous:.2f}x "
+                    f"slower than baseline {previous * 1e6:.1f}us"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "-o", "--output", default="benchmarks.json", help="Result JSON file"
+    )
+    parser.add_argument(
+        "-k", dest="pattern", default="", help="Only run benchmarks containing this"
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="Repetitions")
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.1,
+        help="Minimum duration of each repetition in s",
+    )
+    parser.add_argument(
+        "--thresholds",
+        default=str(DIR / "thresholds.json"),
+        help="JSON file of maximum median time in s per unit of each benchmark",
+    )
+    parser.add_argument("--baseline", help="Result JSON file of a previous run")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="Maximum ratio of the minimum time to the baseline",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.pattern not in name:
+            continue
+        start = time.perf_counter()
+        results[name] = result = measure(setup, args.rounds, args.min_time)
+        print(
+            f"{name:40s} {result['median'] * 1e6:12.2f}us/{result['unit']:6s}"
+            f" (min {result['min'] * 1e6:.2f}us,"
+            f" {time.perf_counter() - start:.1f}s)"
+        )
+
+    with Path(args.output).open("w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": trinkgelage.__version__,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+                "benchmarks": results,
+            },
+            f,
+            indent=2,
+        )
+
+    with Path(args.thresholds).open(encoding="utf-8") as f:
+        thresholds = json.load(f)
+    baseline = {}
+    if args.baseline:
+        with Path(args.baseline).open(encoding="utf-8") as f:
+            baseline = json.load(f)["benchmarks"]
+    regressions = check(results, thresholds, baseline, args.max_slowdown)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -44,6 +44,15 @@ def tests(session: nox.Session) -> None:
     session.run("pytest", *session.posargs)
 
 
+@nox.session
+def benchmarks(session: nox.Session) -> None:
+    """
+    Run the benchmarks. Pass "--baseline <file>" to compare with a previous run.
+    """
+    session.install(".")
+    session.run("python", "benchmarks/run.py", *session.posargs)
+
+
 @nox.session(reuse_venv=True)
 def docs(session: nox.Session) -> None:
     """
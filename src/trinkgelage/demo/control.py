@@ -1,23 +1,36 @@
 from __future__ import annotations
 
+import concurrent.futures
 import logging
 import threading
-import time
-from xmlrpc import client
+import typing
 
 import numpy as np
-import panda_py
+import numpy.typing as npt
 import statemachine
 from panda_py import libfranka
 
-from ..robot import actions
+from ..monitoring import metrics, tracing
+from ..robot import actions, backend, executor, flight, recovery, sensing, trajectories
+from . import gui, orders, pour, tray
 
 log = logging.getLogger("trinkgelage")
 
 
 class DemoControl(statemachine.StateMachine):  # type: ignore[misc]
     """Control flow program of the demo.
-    Describes the possible states and transitions of the statemachine."""
+    Describes the possible states and transitions of the statemachine.
+
+    The states describe the cup, not the arms: in pipelined mode, there are
+    no separate states per arm. Work that overlaps consecutive cups runs on
+    the executors of the arms and is joined before the next transition, see
+    :meth:`DemoModel.submit`. The only resource shared across cycles, the
+    place position, is guarded by :attr:`DemoModel.place_free` instead of
+    a state, as the wait for pickup outlives the cycle that placed the cup.
+    This keeps a single chain of states, which the GUI, the tracing spans
+    and the cycle estimator rely on."""
+
+    model: DemoModel
 
     idle = statemachine.State(initial=True)
     """Idle state, wait for signal to execute demo."""
@@ -49,6 +62,11 @@ class DemoControl(statemachine.StateMachine):  # type: ignore[misc]
     return_to_idle = waiting_for_user_pickup.to(
         idle, cond="user_pickup"
     ) | waiting_for_user_pickup.to(waiting_for_user_pickup, unless="user_pickup")
+    next_order = waiting_for_user_pickup.to(start, cond="order_pending")
+    abort = idle.from_(
+        start, holding_empty_cup, pouring, holding_filled_cup, waiting_for_user_pickup
+    )
+    """Return to idle after an action failed, see :meth:`run_cycle`."""
 
     def on_enter_start(self, user: bool = False) -> None:
         self.pick_cup(user=user)
@@ -63,13 +81,91 @@ class DemoControl(statemachine.StateMachine):  # type: ignore[misc]
         self.place_cup()
 
     def on_enter_waiting_for_user_pickup(self) -> None:
-        self.return_to_idle()
+        if self.model.order_pending():
+            self.next_order()
+        else:
+            self.return_to_idle()
+
+    def order(self, source: str = "menu") -> orders.Order:
+        """Queue a cup and serve it, see :meth:`serve`."""
+        order = self.model.orders.put(source)
+        self.serve()
+        return order
+
+    def serve(self) -> None:
+        """Serve the pending orders in a background thread, unless it is
+        already running. Orders placed during a cycle are served back to
+        back, without returning to idle in between."""
+        with self.model.dispatch_lock:
+            if self.model.dispatching:
+                return
+            self.model.dispatching = True
+        threading.Thread(target=self._serve, name="orders", daemon=True).start()
+
+    def _serve(self) -> None:
+        tracing.tracer.set_process(self.model.station)
+        try:
+            while True:
+                with self.model.dispatch_lock:
+                    if not self.model.orders or self.current_state != self.idle:
+                        return
+                with self.model.run_lock:
+                    if self.current_state == self.idle and not self.run_cycle():
+                        # The failed order waits at the head of the queue
+                        # until the next order
+                        return
+                # Like order_pending, the orders wait for a refill of the tray
+                if self.model.cups < 1:
+                    return
+        finally:
+            with self.model.dispatch_lock:
+                self.model.dispatching = False
+
+    def run_cycle(self, user: bool = False) -> bool:
+        """Start the demo and return whether the cycle succeeded. If an
+        action fails, e.g. with a
+        :class:`~trinkgelage.robot.executor.MotionError`, the error is
+        logged and the demo returns to idle, putting back the order."""
+        try:
+            self.start_demo(user=user)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.exception('Demo cycle failed in state "%s"', self.current_state.id)
+            if self.current_state != self.idle:
+                self.abort()
+            return False
+        return True
 
 
 class DemoModel:
     """Implements the demo actions."""
 
-    max_cups = 12
+    trajectory_files: typing.ClassVar[dict[str, tuple[str, ...]]] = {
+        "init_robot": ("left_idle.csv", "right_idle.csv"),
+        "pick_cup": (
+            "pre_grasp_faucet.csv",
+            "grasp_faucet.csv",
+            "move_cup_to_faucet.csv",
+            "left_idle.csv",
+            "right_idle.csv",
+        ),
+        "open_faucet": (
+            "open_faucet.csv",
+            "pre_grasp_faucet.csv",
+            "left_idle.csv",
+            "post_place_cup.csv",
+            "right_idle.csv",
+        ),
+        "close_faucet": ("grasp_faucet.csv", "level_cup.csv", "pre_grasp_faucet.csv"),
+        "place_cup": ("place_cup.csv", "post_place_cup.csv"),
+        "return_to_idle": ("left_idle.csv", "right_idle.csv"),
+        "next_order": ("right_idle.csv",),
+    }
+    """Trajectory files loaded by the handler of each transition."""
+
+    speed_factor = 0.2
+    """Speed factor of the motions of trajectory files and of the moves to
+    the tray positions, the default of
+    :data:`trinkgelage.demo.estimate.PLANS`."""
 
     def __init__(
         self,
@@ -79,46 +175,131 @@ class DemoModel:
         use_gui: bool = False,
         gui_url: str = "http://garmi-gui.local:8000",
         start_position: int = 1,
+        robot_backend: backend.Backend | None = None,
+        keg: str = "default",
+        pipelined: bool = False,
+        prefetcher: trajectories.Prefetcher | None = None,
+        tray_layout: tray.TrayLayout | None = None,
+        station: str = "",
     ) -> None:
-        self.cups: int = np.clip(self.max_cups - (start_position - 1), 0, 12)
+        self.station = station
+        """Name of the station, labels the metrics and the trace of the demo."""
+        self.slots = tray.SlotTable.load(
+            tray.TrayLayout() if tray_layout is None else tray_layout
+        )
+        """Poses and motions of the tray positions, see :meth:`cup_poses`."""
+        self.max_cups = len(self.slots)
+        self.cups: int = np.clip(self.max_cups - (start_position - 1), 0, self.max_cups)
         self.bias = np.zeros(6)
         self.load = np.zeros(6)
+        self.load_time = 0.0
         if enforce_rt:
             rt = libfranka.RealtimeConfig.kEnforce
         else:
             rt = libfranka.RealtimeConfig.kIgnore
-        self.left = panda_py.Panda(left, realtime_config=rt)
-        self.left_gripper = libfranka.Gripper(left)
-        self.right = panda_py.Panda(right, realtime_config=rt)
-        self.right_gripper = libfranka.Gripper(right)
-        self.gui: client.ServerProxy | None
+        self.backend = backend.Backend() if robot_backend is None else robot_backend
+        self.clock = self.backend.clock
+        with tracing.span("connect", "startup"), concurrent.futures.ThreadPoolExecutor(
+            4, thread_name_prefix="connect"
+        ) as pool:
+            robots = [
+                pool.submit(self.backend.panda, h, realtime_config=rt)
+                for h in (left, right)
+            ]
+            grippers = [pool.submit(self.backend.gripper, h) for h in (left, right)]
+            self.left, self.right = (f.result() for f in robots)
+            self.left_gripper, self.right_gripper = (f.result() for f in grippers)
+        self.gui: gui.GuiClient | None
         if use_gui:
-            self.gui = client.ServerProxy(gui_url)
+            self.gui = gui.GuiClient(gui_url)
         else:
             self.gui = None
         self.render_text_settings = (10, (0, 255, 255), 200)
         self.show_text_settings = ((0, 255, 255), 200)
+        self.measure_period = 0.02
+        """Interval in s at which the cup is measured while pouring."""
+        self.measure_window = 0.1
+        """Duration in s of the force samples averaged per measurement."""
+        self.pickup_time = 5.0
+        """Time in s the guest is given to pick up the cup."""
+        self.right_sampler = sensing.ForceSampler(
+            self.right, self.clock, name="right-sampler"
+        )
+        self.pour = pour.PourController(keg=keg, period=self.measure_period)
+        self.pipelined = pipelined
+        """Overlap the motions of consecutive cups, see :meth:`submit`."""
+        self.arms = {
+            "left": executor.get(self.left, "left", self.left_gripper),
+            "right": executor.get(self.right, "right", self.right_gripper),
+        }
+        # Named after the hostnames, such that the arms of each station
+        # reopen their own rings after a restart
+        flight.get(self.left, left)
+        flight.get(self.right, right)
+        for robot in (self.left, self.right):
+            recovery.assign_station(robot, station)
+        self.pending: list[executor.Task] = []
+        for arm in self.arms.values():
+            # The spans of the arms belong to the trace of the station
+            self.submit(arm.submit(tracing.tracer.set_process, station))
+        self.place_free = threading.Event()
+        """Set while there is no cup waiting for pickup at the place position."""
+        self.place_free.set()
+        self.orders = orders.OrderQueue(self.clock)
+        self.current_order: orders.Order | None = None
+        self.run_lock = threading.Lock()
+        """Held while serving orders, acquire it to run the demo otherwise."""
+        self.dispatching = False
+        self.dispatch_lock = threading.Lock()
+        self.cycle_start: float | None = None
+        self.pour_start = 0.0
+        self.state_entered: tuple[str, float] | None = None
+        """Id of the current state and the time it was entered."""
+        self.prefetcher = (
+            trajectories.Prefetcher() if prefetcher is None else prefetcher
+        )
+        """Loads trajectory files ahead of time, may be shared between models."""
         self.init_robot()
 
+    def close(self) -> None:
+        """Stop the force sampler and the executors of the arms, and close
+        the connection to the GUI."""
+        self.right_sampler.stop()
+        executor.release(self.left)
+        executor.release(self.right)
+        if self.gui:
+            self.gui.close()
+
     def on_enter_idle(self) -> None:
+        self.right_sampler.stop()
         if self.gui:
             self.gui.show_image("sleep.png")
 
     def init_robot(self) -> None:
-        t1 = threading.Thread(target=self.left_gripper.homing)
-        t2 = threading.Thread(target=self.right_gripper.homing)
-        t1.start()
-        t2.start()
-        for t in [t1, t2]:
-            t.join()
-        actions.two_arm_motion_from_files(
-            self.left, self.right, "left_idle.csv", "right_idle.csv"
+        """Home the grippers and move the arms to their idle positions in
+        the background. The first transition waits until they are done,
+        see :meth:`wait_for`."""
+        self.prefetcher.prefetch(
+            f for files in self.trajectory_files.values() for f in files
         )
+        idle = {"left": "left_idle.csv", "right": "right_idle.csv"}
+        for name, arm in self.arms.items():
+            self.submit(arm.gripper_command(actions.homing))
+            self.submit(
+                arm.motion(
+                    actions.motion_from_file,
+                    idle[name],
+                    speed_factor=self.speed_factor,
+                )
+            )
 
     def on_pick_cup(self, target: statemachine.State, user: bool = False) -> None:
         if target != DemoControl.cups_empty:
+            if not user:
+                self.current_order = self.orders.take()
             self.cups -= 1
             self.cups = max(0, self.cups)
+            self.right_sampler.start()
 
             idx = self.max_cups - self.cups
             log.info("Picking up cup at position %d", idx)
@@ -128,120 +309,302 @@ class DemoModel:
                     f"Picking up cup at position #{idx}...", *self.render_text_settings
                 )
 
-            disp_x = (idx - 1) % 3 * 0.15
-            disp_z = -np.floor((idx - 1) / 3) * 0.1
-
-            q = actions.load_csv("grasp_cup_1.csv")
-            grasp_cup = panda_py.fk(q)
-            grasp_cup[0, 3] += disp_x
-            grasp_cup[2, 3] += disp_z
-
-            pre_grasp_cup = grasp_cup.copy()
-            pre_grasp_cup[2, 3] += 0.15
-
-            post_grasp_cup = grasp_cup.copy()
-            post_grasp_cup[1, 3] += 0.15
+            if self.pipelined and not user:
+                # The left arm approaches the faucet while the cup is picked up
+                self.submit(
+                    self.arms["left"].motion(
+                        actions.motion_from_file,
+                        ["pre_grasp_faucet.csv", "grasp_faucet.csv"],
+                        speed_factor=self.speed_factor,
+                    )
+                )
 
-            actions.move_to_pose(self.right, [pre_grasp_cup, grasp_cup])
+            if self.current_order is not None:
+                metrics.order_latency.observe(
+                    self.clock.time() - self.current_order.time,
+                    station=self.station,
+                    source=self.current_order.source,
+                )
+            slot = self.slots[idx]
+            actions.play_trajectory(
+                self.right, *slot.approach, speed_factor=self.speed_factor
+            )
             actions.grasp(self.right_gripper)
-            actions.move_to_pose(self.right, post_grasp_cup)
+            actions.play_trajectory(self.right, *slot.retreat)
 
             if self.gui:
                 self.gui.show_image("eyes.png")
 
             if user:
-                actions.motion_from_file(self.right, "move_cup_to_faucet.csv")
+                actions.motion_from_file(
+                    self.right, "move_cup_to_faucet.csv", speed_factor=self.speed_factor
+                )
+            elif self.pipelined:
+                self.submit(
+                    self.arms["right"].motion(
+                        actions.motion_from_file,
+                        "move_cup_to_faucet.csv",
+                        speed_factor=self.speed_factor,
+                    )
+                )
+                self.wait_for()
             else:
-                actions.two_arm_motion_from_files(
-                    self.left,
-                    self.right,
+                self.two_arm_motion(
                     ["pre_grasp_faucet.csv", "grasp_faucet.csv"],
                     "move_cup_to_faucet.csv",
                 )
 
-            self.bias = np.array(self.right.get_state().O_F_ext_hat_K)
-        elif self.gui:
-            self.gui.play_sound("attention.wav")
-            self.gui.render_text("Please refill cups!", *self.render_text_settings)
+            self.bias = self.right_sampler.median(self.measure_window)
+        else:
+            self._requeue_order()
+            if self.gui:
+                self.gui.play_sound("attention.wav")
+                self.gui.render_text("Please refill cups!", *self.render_text_settings)
+            if self.pipelined:
+                # Leave the faucet while waiting for the refill
+                self.two_arm_motion("left_idle.csv", "right_idle.csv")
+
+    def cup_poses(
+        self, idx: int
+    ) -> tuple[
+        npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]
+    ]:
+        """Pre-grasp, grasp and post-grasp pose of the cup at position `idx`."""
+        pre_grasp_cup, grasp_cup, post_grasp_cup = self.slots[idx].poses
+        return pre_grasp_cup, grasp_cup, post_grasp_cup
 
     def on_open_faucet(self, target: statemachine.State, user: bool = False) -> None:
         if target == DemoControl.pouring:
             if not user:
                 actions.grasp(self.left_gripper)
-                actions.motion_from_file(self.left, "open_faucet.csv")
+                actions.motion_from_file(
+                    self.left, "open_faucet.csv", speed_factor=self.speed_factor
+                )
+            self.pour.start()
+            self.pour_start = self.clock.time()
         else:
+            self._requeue_order()
             if self.gui:
                 self.gui.play_sound("failure.wav")
                 self.gui.render_text(
                     "I'm not holding a cup...", *self.render_text_settings
                 )
             actions.release(self.right_gripper)
-            actions.two_arm_motion_from_files(
-                self.left,
-                self.right,
+            self.two_arm_motion(
                 ["pre_grasp_faucet.csv", "left_idle.csv"],
                 ["post_place_cup.csv", "right_idle.csv"],
             )
 
     def on_close_faucet(self, target: statemachine.State, user: bool = False) -> None:
         if target == DemoControl.holding_filled_cup:
+            metrics.pour_time.observe(
+                self.clock.time() - self.pour_start, station=self.station
+            )
             if self.gui:
                 self.gui.show_image("happy.png")
                 self.gui.play_sound("success.wav")
             if not user:
-                actions.two_arm_motion_from_files(
-                    self.left, self.right, "grasp_faucet.csv", "level_cup.csv"
-                )
+                self.two_arm_motion("grasp_faucet.csv", "level_cup.csv")
+                self.measure_cup()
+                self.pour.finish(self.cup_load())
                 actions.release(self.left_gripper)
-                actions.motion_from_file(self.left, "pre_grasp_faucet.csv")
+                actions.motion_from_file(
+                    self.left, "pre_grasp_faucet.csv", speed_factor=self.speed_factor
+                )
             else:
-                actions.motion_from_file(self.right, "level_cup.csv")
+                actions.motion_from_file(
+                    self.right, "level_cup.csv", speed_factor=self.speed_factor
+                )
 
     def on_place_cup(self) -> None:
-        actions.motion_from_file(self.right, "place_cup.csv")
+        with tracing.span("wait_for_place", "demo"):
+            self.place_free.wait()
+        actions.motion_from_file(
+            self.right, "place_cup.csv", speed_factor=self.speed_factor
+        )
         actions.release(self.right_gripper)
-        actions.motion_from_file(self.right, "post_place_cup.csv")
+        metrics.cups_served.inc(station=self.station)
+        self.right_sampler.stop()
+        actions.motion_from_file(
+            self.right, "post_place_cup.csv", speed_factor=self.speed_factor
+        )
         if self.gui:
             self.gui.play_sound("attention.wav")
             self.gui.render_text(
                 "Please retrieve your cup!", *self.render_text_settings
             )
+        if self.current_order is not None:
+            self.orders.serve(self.current_order)
+            self.current_order = None
+        if self.pipelined:
+            self._start_pickup()
+
+    def _requeue_order(self) -> None:
+        """Put the current order back, such that it is served next."""
+        if self.current_order is not None:
+            self.orders.requeue(self.current_order)
+            self.current_order = None
+
+    def on_abort(self) -> None:
+        """Stop the work of the failed cycle. The arms stay where they
+        are, the next cycle starts by moving them onto its trajectories."""
+        pending, self.pending = self.pending, []
+        for task in pending:
+            task.abort()
+        self.right_sampler.stop()
+        self._requeue_order()
+        if self.gui:
+            self.gui.play_sound("failure.wav")
+            self.gui.render_text("Something went wrong...", *self.render_text_settings)
+
+    def on_next_order(self) -> None:
+        if self.place_free.is_set():
+            self._start_pickup()
+        # The left arm stays at the faucet for the next cup
+        self.submit(self.arms["right"].submit(self._approach_next_cup))
+
+    def order_pending(self) -> bool:
+        return len(self.orders) > 0 and self.cups >= 1
 
     def on_return_to_idle(self, target: statemachine.State) -> None:
-        if target != DemoControl.waiting_for_user_pickup:
-            actions.two_arm_motion_from_files(
-                self.left, self.right, "left_idle.csv", "right_idle.csv"
+        if target == DemoControl.waiting_for_user_pickup:
+            return
+        if self.pipelined:
+            # The left arm stays at the faucet for the next cup
+            self.submit(self.arms["right"].submit(self._approach_next_cup))
+        else:
+            self.two_arm_motion("left_idle.csv", "right_idle.csv")
+
+    def _approach_next_cup(self) -> None:
+        actions.motion_from_file(
+            self.right, "right_idle.csv", speed_factor=self.speed_factor
+        )
+        if self.cups >= 1:
+            slot = self.slots[self.max_cups - self.cups + 1]
+            actions.move_to_joint_position(
+                self.right, slot.q[0], speed_factor=self.speed_factor
             )
 
+    def _start_pickup(self) -> None:
+        """Wait for the pickup of the placed cup in the background,
+        see :attr:`place_free`."""
+        self.place_free.clear()
+        threading.Thread(target=self._await_pickup, name="pickup", daemon=True).start()
+
+    def _await_pickup(self) -> None:
+        tracing.tracer.set_process(self.station)
+        self.wait_for_pickup()
+        self.place_free.set()
+
+    def two_arm_motion(
+        self,
+        left_filenames: str | list[str],
+        right_filenames: str | list[str],
+    ) -> None:
+        """Move both arms at the same time, raise
+        :class:`~trinkgelage.robot.executor.MotionError` if one fails."""
+        if not actions.two_arm_motion_from_files(
+            self.left,
+            self.right,
+            left_filenames,
+            right_filenames,
+            left_speed_factor=self.speed_factor,
+            right_speed_factor=self.speed_factor,
+        ):
+            msg = f"Two-arm motion {left_filenames}, {right_filenames} failed"
+            raise executor.MotionError(msg)
+
+    def submit(self, task: executor.Task) -> None:
+        """Keep track of `task` submitted to one of :attr:`arms`. In
+        pipelined mode, this lets an arm move while the state machine
+        carries on, until the next transition or :meth:`wait_for`."""
+        self.pending.append(task)
+
+    def wait_for(self) -> None:
+        """Wait for the submitted tasks. If one fails, the work of the
+        other arm is aborted and the exception raised."""
+        pending, self.pending = self.pending, []
+        executor.all_of(*pending)
+
     def on_refill_cups(self) -> None:
         self.cups = self.max_cups
 
-    def before_transition(self, event: str) -> None:
+    def before_transition(self, event: str, target: statemachine.State) -> None:
         log.info('Action "%s" triggered', event)
+        if event != "abort":
+            self.wait_for()
+        if event == "next_order":
+            tracing.tracer.end_cycle()
+            self.end_cycle()
+        if event in ("start_demo", "next_order"):
+            tracing.tracer.begin_cycle()
+            self.cycle_start = self.clock.time()
+        tracing.tracer.end_all("state")
+        tracing.tracer.begin(event, "transition")
+        self.prefetcher.prefetch(self.next_trajectory_files(target))
+
+    def next_trajectory_files(self, state: statemachine.State) -> list[str]:
+        """Trajectory files of the transitions leaving `state`."""
+        return [
+            f
+            for transition in state.transitions.transitions
+            for event in transition.events
+            for f in self.trajectory_files.get(event, ())
+        ]
 
     def on_enter_state(self, state: statemachine.state.State) -> None:
         log.info('Entered state "%s"', state.id)
+        tracing.tracer.end_all("transition")
+        if state in (DemoControl.idle, DemoControl.cups_empty):
+            tracing.tracer.end_cycle()
+            self.end_cycle()
+        tracing.tracer.begin(state.id, "state")
+        now = self.clock.time()
+        if self.state_entered is not None:
+            previous, entered = self.state_entered
+            metrics.state_time.inc(now - entered, station=self.station, state=previous)
+        self.state_entered = (state.id, now)
+
+    def end_cycle(self) -> None:
+        if self.cycle_start is not None:
+            metrics.cycle_time.observe(
+                self.clock.time() - self.cycle_start, station=self.station
+            )
+            self.cycle_start = None
 
     def cup_available(self) -> bool:
         log.info("%d cups remaining", self.cups)
+        metrics.cups_remaining.set(self.cups, station=self.station)
         return self.cups >= 1
 
     def measure_cup(self) -> None:
-        time.sleep(1.0 / 10)
-        self.load = np.array(self.right.get_state().O_F_ext_hat_K)
+        with tracing.span("measure_cup", "demo"):
+            self.clock.sleep(self.measure_period)
+        self.load = self.right_sampler.mean(self.measure_window)
+        # The mean lags behind by half the window
+        self.load_time = self.clock.time() - self.measure_window / 2
+
+    def cup_load(self) -> float:
+        """Weight of the beer in the cup in N."""
+        return float(np.linalg.norm(self.load[:3] - self.bias[:3]))
 
     def cup_full(self) -> bool:
-        load = np.linalg.norm(self.load[:3] - self.bias[:3])
+        load = self.cup_load()
         if self.gui:
             self.gui.show_text(
-                f"measuring...\n{load*100:3.0f}ml", *self.show_text_settings
+                f"measuring...\n{load * 100:3.0f}ml", *self.show_text_settings
             )
-        return bool(load > 3.5)
+        return self.pour.update(self.load_time, load)
 
     def user_pickup(self) -> bool:
-        time.sleep(5)
+        if not self.pipelined:
+            self.wait_for_pickup()
         return True
 
+    def wait_for_pickup(self) -> None:
+        with tracing.span("user_pickup", "demo"):
+            self.clock.sleep(self.pickup_time)
+
     def cup_grasped(self) -> bool:
         gripper_state = self.right_gripper.read_once()
         return gripper_state.width > 0.02 and gripper_state.is_grasped
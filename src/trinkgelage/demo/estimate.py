@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+import dataclasses
+import math
+import typing
+
+import numpy as np
+import numpy.typing as npt
+import statemachine
+
+from ..robot import blending, trajectories
+from . import control, pour, tray
+
+GRIPPER_SPEED = 0.05
+"""Speed in m/s of :func:`trinkgelage.robot.actions.grasp` and
+:func:`trinkgelage.robot.actions.release`."""
+
+GRIPPER_WIDTH = 0.08
+"""Width in m of the open grippers."""
+
+ARMS = ("left", "right")
+
+
+@dataclasses.dataclass(frozen=True)
+class Motion:
+    """Motion of one arm, or of both arms at once as with
+    :func:`trinkgelage.robot.actions.two_arm_motion_from_files`."""
+
+    left: tuple[str, ...] = ()
+    right: tuple[str, ...] = ()
+    speed_factor: float = control.DemoModel.speed_factor
+
+
+@dataclasses.dataclass(frozen=True)
+class SlotMotion:
+    """Trajectory of the right arm to or from the current tray position,
+    or a move to the pre-grasp position of the next one."""
+
+    part: typing.Literal["approach", "retreat", "next"]
+    speed_factor: float = 0.05
+
+
+@dataclasses.dataclass(frozen=True)
+class Gripper:
+    """Grasp or release command of the gripper of `arm`."""
+
+    arm: str
+    command: typing.Literal["grasp", "release"]
+
+
+@dataclasses.dataclass(frozen=True)
+class Wait:
+    """Time spent without moving: measuring the cup, pouring or waiting
+    for the guest to pick up the cup."""
+
+    reason: typing.Literal["measure", "pour", "pickup", "await_pickup"]
+
+
+@dataclasses.dataclass(frozen=True)
+class Pickup:
+    """Give the guest time to pick up the cup in the background."""
+
+
+Step = typing.Union[Motion, SlotMotion, Gripper, Wait, Pickup]
+
+PLANS: dict[str, tuple[Step, ...]] = {
+    "start_demo": (),
+    "pick_cup": (
+        SlotMotion("approach", speed_factor=control.DemoModel.speed_factor),
+        Gripper("right", "grasp"),
+        SlotMotion("retreat"),
+        Motion(
+            left=("pre_grasp_faucet.csv", "grasp_faucet.csv"),
+            right=("move_cup_to_faucet.csv",),
+        ),
+    ),
+    "open_faucet": (
+        Wait("measure"),
+        Gripper("left", "grasp"),
+        Motion(left=("open_faucet.csv",)),
+    ),
+    "close_faucet": (
+        Wait("pour"),
+        Motion(left=("grasp_faucet.csv",), right=("level_cup.csv",)),
+        Wait("measure"),
+        Gripper("left", "release"),
+        Motion(left=("pre_grasp_faucet.csv",)),
+    ),
+    "place_cup": (
+        Wait("await_pickup"),
+        Motion(right=("place_cup.csv",)),
+        Gripper("right", "release"),
+        Motion(right=("post_place_cup.csv",)),
+    ),
+    "return_to_idle": (
+        Wait("pickup"),
+        Motion(left=("left_idle.csv",), right=("right_idle.csv",)),
+    ),
+    "next_order": (
+        Pickup(),
+        Motion(right=("right_idle.csv",)),
+        SlotMotion("next", speed_factor=control.DemoModel.speed_factor),
+    ),
+}
+"""Steps of the handlers of each transition of
+:class:`trinkgelage.demo.control.DemoModel` serving a cup, without
+pipelining, at :attr:`trinkgelage.demo.control.DemoModel.speed_factor`.
+Edit a copy to estimate the effect of other speed factors or trajectory
+files, see :func:`with_speed_factor` and :class:`CycleEstimator`."""
+
+
+@dataclasses.dataclass
+class StepEstimate:
+    """Estimated duration of one step of a path."""
+
+    event: str
+    step: Step
+    duration: float
+    """Duration in s."""
+    critical: str | None = None
+    """Arm on the critical path of a motion of both arms."""
+    slack: float = 0.0
+    """Time in s the other arm of a motion of both arms waits."""
+
+    def __str__(self) -> str:
+        text = f"{self.event:<16} {_describe(self.step):<60} {self.duration:6.2f}s"
+        if self.critical is not None:
+            text += f"  critical: {self.critical} (slack {self.slack:.2f}s)"
+        return text
+
+
+@dataclasses.dataclass
+class PathEstimate:
+    """Estimated duration of one path through the state machine."""
+
+    name: str
+    events: list[str]
+    steps: list[StepEstimate]
+
+    @property
+    def duration(self) -> float:
+        return sum(s.duration for s in self.steps)
+
+    def durations(self) -> dict[str, float]:
+        """Duration in s of each event of the path."""
+        durations = dict.fromkeys(self.events, 0.0)
+        for step in self.steps:
+            durations[step.event] += step.duration
+        return durations
+
+
+def with_speed_factor(
+    plans: dict[str, tuple[Step, ...]], speed_factor: float
+) -> dict[str, tuple[Step, ...]]:
+    """Copy of `plans` with the speed factor of the motions of trajectory
+    files and the moves to the tray positions replaced, as with setting
+    :attr:`trinkgelage.demo.control.DemoModel.speed_factor`."""
+    return {
+        event: tuple(
+            dataclasses.replace(step, speed_factor=speed_factor)
+            if isinstance(step, Motion)
+            or (isinstance(step, SlotMotion) and step.part != "retreat")
+            else step
+            for step in steps
+        )
+        for event, steps in plans.items()
+    }
+
+
+def walk(start: statemachine.State, conditions: dict[str, bool]) -> list[str]:
+    """Events of the path through :class:`trinkgelage.demo.control.DemoControl`
+    from state `start` back to a visited state, taking the transitions
+    whose conditions have the given values."""
+    events = []
+    state, visited = start, {start.id}
+    while True:
+        for transition in state.transitions.transitions:
+            if transition.target == state:
+                continue
+            if all(
+                conditions[spec.func] == spec.expected_value for spec in transition.cond
+            ):
+                break
+        else:
+            msg = f"No transition leaves state {state.id} under {conditions}"
+            raise ValueError(msg)
+        events.append(transition.event)
+        state = transition.target
+        if state.id in visited:
+            return events
+        visited.add(state.id)
+
+
+class CycleEstimator:
+    """
+    Estimates the duration of serving cups from the lengths of the
+    trajectories, the speed factors of the moves, the gripper motions,
+    the pour calibration and fixed waits, without any robot.
+
+    Moves between joint positions take :func:`trinkgelage.robot.blending.duration`
+    and trajectories one control tick per sample, the model used by the
+    simulation, see :mod:`trinkgelage.robot.sim`. The joint positions of
+    the arms and the widths of the grippers are tracked along each path.
+    """
+
+    def __init__(
+        self,
+        layout: tray.TrayLayout | None = None,
+        pour_controller: pour.PourController | None = None,
+        plans: dict[str, tuple[Step, ...]] | None = None,
+        measure_period: float = 0.02,
+        pickup_time: float = 5.0,
+        object_width: dict[str, float] | None = None,
+    ) -> None:
+        self.slots = tray.SlotTable.load(
+            tray.TrayLayout() if layout is None else layout
+        )
+        self.pour = (
+            pour.PourController() if pour_controller is None else pour_controller
+        )
+        self.plans = PLANS if plans is None else plans
+        self.measure_period = measure_period
+        """See :attr:`trinkgelage.demo.control.DemoModel.measure_period`."""
+        self.pickup_time = pickup_time
+        """See :attr:`trinkgelage.demo.control.DemoModel.pickup_time`."""
+        self.object_width = (
+            {"left": 0.03, "right": 0.07} if object_width is None else object_width
+        )
+        """Width in m of the faucet handle and the cup."""
+
+    def pour_time(self) -> float:
+        """Time in s from opening the faucet until the pour controller
+        decides to close it, in whole measurement periods."""
+        calibration = self.pour.calibration
+        lead = calibration.latency + self.pour.period / 2
+        flow = max(calibration.flow_rate, 1e-6)
+        t = max(0.0, self.pour.target / flow - lead)
+        return max(1, math.ceil(t / self.measure_period - 1e-9)) * self.measure_period
+
+    def single(self, cup: int = 1) -> PathEstimate:
+        """Serve the cup at tray position `cup` starting and ending idle."""
+        events = walk(control.DemoControl.idle, self._conditions(back_to_back=False))
+        return self._estimate("single", events, _Arms(self, cup))
+
+    def back_to_back(self, cup: int = 2) -> PathEstimate:
+        """Serve the cup at tray position `cup` right after the previous
+        cup was placed, as with orders queued while serving."""
+        conditions = self._conditions(back_to_back=True)
+        arms = _Arms(self, max(1, cup - 1))
+        warmup = walk(control.DemoControl.idle, conditions)
+        self._estimate("warmup", warmup[: warmup.index("place_cup") + 1], arms)
+        arms.cup = cup
+        events = walk(control.DemoControl.waiting_for_user_pickup, conditions)
+        return self._estimate("back_to_back", events, arms)
+
+    def cups_per_hour(self) -> float:
+        """Theoretical maximum throughput with orders queued all the
+        time, averaged over the tray positions, ignoring refills."""
+        cycles = [
+            self.back_to_back(cup).duration for cup in range(1, len(self.slots) + 1)
+        ]
+        return 3600.0 / float(np.mean(cycles))
+
+    @staticmethod
+    def _conditions(back_to_back: bool) -> dict[str, bool]:
+        return {
+            "cup_available": True,
+            "cup_grasped": True,
+            "cup_full": True,
+            "order_pending": back_to_back,
+            "user_pickup": not back_to_back,
+        }
+
+    def _estimate(self, name: str, events: list[str], arms: _Arms) -> PathEstimate:
+        steps = [
+            arms.run(event, step) for event in events for step in self.plans[event]
+        ]
+        return PathEstimate(name, events, steps)
+
+
+class _Arms:
+    """Joint positions and gripper widths of the arms along a path."""
+
+    def __init__(self, estimator: CycleEstimator, cup: int) -> None:
+        self.estimator = estimator
+        self.cup = cup
+        self.q = {arm: _end(trajectories.load(f"{arm}_idle.csv")) for arm in ARMS}
+        self.width = dict.fromkeys(ARMS, GRIPPER_WIDTH)
+        self.elapsed = 0.0
+        self.pickup_at = -math.inf
+        """Time the guest picks up the placed cup."""
+
+    def run(self, event: str, step: Step) -> StepEstimate:
+        estimate = self._run(event, step)
+        self.elapsed += estimate.duration
+        return estimate
+
+    def _run(self, event: str, step: Step) -> StepEstimate:
+        if isinstance(step, Motion):
+            durations = {
+                arm: self.files(arm, files, step.speed_factor)
+                for arm, files in (("left", step.left), ("right", step.right))
+                if files
+            }
+            duration = max(durations.values())
+            if len(durations) < 2:
+                return StepEstimate(event, step, duration)
+            critical = max(durations, key=lambda arm: durations[arm])
+            slack = duration - min(durations.values())
+            return StepEstimate(event, step, duration, critical, slack)
+        if isinstance(step, SlotMotion):
+            slot = self.estimator.slots[self.cup]
+            if step.part == "next":
+                return StepEstimate(
+                    event, step, self.move("right", slot.q[0], step.speed_factor)
+                )
+            q, _ = slot.approach if step.part == "approach" else slot.retreat
+            return StepEstimate(event, step, self.play("right", q, step.speed_factor))
+        if isinstance(step, Gripper):
+            target = (
+                self.estimator.object_width[step.arm]
+                if step.command == "grasp"
+                else GRIPPER_WIDTH
+            )
+            duration = abs(self.width[step.arm] - target) / GRIPPER_SPEED
+            self.width[step.arm] = target
+            return StepEstimate(event, step, duration)
+        if isinstance(step, Pickup):
+            self.pickup_at = self.elapsed + self.estimator.pickup_time
+            return StepEstimate(event, step, 0.0)
+        if step.reason == "measure":
+            duration = self.estimator.measure_period
+        elif step.reason == "pour":
+            duration = self.estimator.pour_time()
+        elif step.reason == "pickup":
+            duration = self.estimator.pickup_time
+        else:
+            duration = max(0.0, self.pickup_at - self.elapsed)
+        return StepEstimate(event, step, duration)
+
+    def files(self, arm: str, files: tuple[str, ...], speed_factor: float) -> float:
+        duration = 0.0
+        for fn in files:
+            data = trajectories.load(fn)
+            if data.ndim == 1:
+                duration += self.move(arm, data, speed_factor)
+            else:
+                duration += self.play(arm, data[:, :7], speed_factor)
+        return duration
+
+    def move(self, arm: str, q: npt.NDArray[np.float64], speed_factor: float) -> float:
+        duration = blending.duration(self.q[arm], q, speed_factor)
+        self.q[arm] = np.asarray(q, dtype=np.float64)
+        return duration
+
+    def play(self, arm: str, q: npt.NDArray[np.float64], speed_factor: float) -> float:
+        """Approach the start of trajectory `q` and play it back."""
+        duration = self.move(arm, q[0], speed_factor) + len(q) / 1000.0
+        self.q[arm] = _end(q)
+        return duration
+
+
+def _end(data: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Last joint position of a joint position or trajectory."""
+    data = np.asarray(data, dtype=np.float64)
+    return data if data.ndim == 1 else data[-1, :7]
+
+
+def _describe(step: Step) -> str:
+    if isinstance(step, Motion):
+        arms = [
+            f"{arm} {'+'.join(files)}"
+            for arm, files in (("left", step.left), ("right", step.right))
+            if files
+        ]
+        return f"{', '.join(arms)} @{step.speed_factor:g}"
+    if isinstance(step, SlotMotion):
+        return f"right tray {step.part} @{step.speed_factor:g}"
+    if isinstance(step, Gripper):
+        return f"{step.arm} gripper {step.command}"
+    if isinstance(step, Pickup):
+        return "pickup in background"
+    return f"wait {step.reason}"
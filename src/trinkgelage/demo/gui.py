@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import http.client
+import logging
+import threading
+import time
+import typing
+from xmlrpc import client
+
+from ..monitoring import tracing
+
+log = logging.getLogger("gui")
+
+
+class Call(typing.NamedTuple):
+    """A queued remote procedure call."""
+
+    method: str
+    args: tuple[typing.Any, ...]
+
+
+class GuiClient:
+    """Asynchronous client of the GUI's XML-RPC server.
+
+    Calls return immediately and are sent by a background thread over a
+    persistent connection. Calls issued within `linger` seconds of each
+    other are sent in a single round-trip using ``system.multicall``, if
+    the server supports it. A pending call to a method in `coalesce` is
+    replaced by a newer call to the same method, such that only the latest
+    update is displayed."""
+
+    def __init__(
+        self,
+        url: str,
+        linger: float = 0.005,
+        coalesce: typing.Collection[str] = ("show_text",),
+    ) -> None:
+        self.url = url
+        self.linger = linger
+        self.coalesce = frozenset(coalesce)
+        self.error: Exception | None = None
+        """Most recent error raised while sending calls."""
+        self._proxy = client.ServerProxy(url)
+        self._multicall = True
+        self._pending: list[Call] = []
+        self._sending = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="gui", daemon=True)
+        self._thread.start()
+
+    def call(self, method: str, *args: typing.Any) -> None:
+        """Queue a call of `method` on the GUI server."""
+        with self._condition:
+            if self._closed:
+                msg = "GUI client is closed"
+                raise RuntimeError(msg)
+            if method in self.coalesce:
+                self._pending = [c for c in self._pending if c.method != method]
+            self._pending.append(Call(method, args))
+            self._condition.notify_all()
+
+    def __getattr__(self, name: str) -> typing.Callable[..., None]:
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args: typing.Any) -> None:
+            self.call(name, *args)
+
+        return call
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Wait until all queued calls are sent and raise the error of
+        the last failed round-trip, if any."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: not self._pending and not self._sending, timeout
+            ):
+                msg = "Timed out waiting for the GUI"
+                raise TimeoutError(msg)
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def close(self, timeout: float | None = None) -> None:
+        """Send the queued calls and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+            time.sleep(self.linger)
+            with self._condition:
+                batch, self._pending = self._pending, []
+                self._sending = True
+            try:
+                self._send(batch)
+            except (OSError, ValueError, client.Error, http.client.HTTPException) as e:
+                log.warning(
+                    "Failed to send %d calls to %s: %s", len(batch), self.url, e
+                )
+                self.error = e
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send(self, batch: list[Call]) -> None:
+        with tracing.span("gui.send", "gui"):
+            if len(batch) > 1 and self._multicall:
+                multicall = client.MultiCall(self._proxy)
+                for method, args in batch:
+                    getattr(multicall, method)(*args)
+                try:
+                    results = multicall()
+                except client.Fault as e:
+                    log.info("Server does not support multicall: %s", e)
+                    self._multicall = False
+                else:
+                    for i, (method, _) in enumerate(batch):
+                        try:
+                            results[i]
+                        except client.Fault as e:
+                            log.warning("GUI call %s failed: %s", method, e.faultString)
+                    return
+            for method, args in batch:
+                try:
+                    getattr(self._proxy, method)(*args)
+                except client.Fault as e:
+                    log.warning("GUI call %s failed: %s", method, e.faultString)
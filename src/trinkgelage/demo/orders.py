@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import itertools
+import logging
+import threading
+import typing
+from xmlrpc import server
+
+from ..robot import backend
+
+log = logging.getLogger("orders")
+
+
+@dataclasses.dataclass
+class Order:
+    """A cup ordered by a guest."""
+
+    number: int
+    source: str
+    """Where the order came from, e.g. `button`, `menu` or `api`."""
+    time: float
+    """Time the order was placed."""
+    served: float | None = None
+    """Time the cup was placed for pickup."""
+
+    @property
+    def time_to_serve(self) -> float | None:
+        return None if self.served is None else self.served - self.time
+
+
+class OrderQueue:
+    """Thread-safe queue of orders, served first come first served."""
+
+    def __init__(self, clock: backend.Clock | None = None, history: int = 100) -> None:
+        self.clock = backend.Clock() if clock is None else clock
+        self.served: collections.deque[Order] = collections.deque(maxlen=history)
+        """The most recently served orders."""
+        self._pending: collections.deque[Order] = collections.deque()
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, source: str = "menu") -> Order:
+        with self._lock:
+            order = Order(next(self._numbers), source, self.clock.time())
+            self._pending.append(order)
+            depth = len(self._pending)
+        log.info("Order #%d from %s, %d pending", order.number, source, depth)
+        return order
+
+    def take(self) -> Order | None:
+        """Remove and return the oldest pending order, if any."""
+        with self._lock:
+            return self._pending.popleft() if self._pending else None
+
+    def requeue(self, order: Order) -> None:
+        """Put back `order`, taken but not served, as the next to take."""
+        with self._lock:
+            self._pending.appendleft(order)
+            depth = len(self._pending)
+        log.info("Order #%d requeued, %d pending", order.number, depth)
+
+    def serve(self, order: Order) -> None:
+        """Mark `order` as served."""
+        order.served = self.clock.time()
+        with self._lock:
+            self.served.append(order)
+            depth = len(self._pending)
+        log.info(
+            "Served order #%d from %s in %.1fs, %d pending",
+            order.number,
+            order.source,
+            order.time_to_serve,
+            depth,
+        )
+
+    def stats(self) -> dict[str, float]:
+        """Queue depth and time to serve of the recently served orders."""
+        with self._lock:
+            times = [typing.cast(float, o.time_to_serve) for o in self.served]
+            stats = {"pending": float(len(self._pending)), "served": float(len(times))}
+        if times:
+            stats["mean_time_to_serve"] = sum(times) / len(times)
+            stats["max_time_to_serve"] = max(times)
+        return stats
+
+
+class OrderApi:
+    """XML-RPC server taking orders on the local machine.
+
+    Exposes `order(source)`, which calls `place_order` and returns the
+    order number, and `stats()`, see :meth:`OrderQueue.stats`."""
+
+    def __init__(
+        self,
+        place_order: typing.Callable[[str], Order],
+        queue: OrderQueue,
+        port: int = 8001,
+        host: str = "127.0.0.1",
+    ) -> None:
+        self._server = server.SimpleXMLRPCServer(
+            (host, port), logRequests=False, allow_none=True
+        )
+        self._server.register_function(
+            lambda source="api": place_order(source).number, "order"
+        )
+        self._server.register_function(queue.stats, "stats")
+        self.port: int = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="order-api", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import dataclasses
+import fcntl
+import json
+import logging
+import os
+import pathlib
+
+import numpy as np
+
+from ..robot import trajectories
+
+log = logging.getLogger("pour")
+
+
+@dataclasses.dataclass
+class Calibration:
+    """Pour calibration of one keg."""
+
+    flow_rate: float = 0.35
+    """Flow rate in N/s."""
+    latency: float = 1.0
+    """Time in s from the decision to close the faucet until the flow stops."""
+    cups: int = 0
+    """Number of cups the calibration is based on."""
+
+
+def get_calibration_path() -> pathlib.Path:
+    return trajectories.get_cache_path() / "pour.json"
+
+
+class PourController:
+    """Decides when to close the faucet.
+
+    The flow rate is estimated online by a linear fit of the load over
+    time since the flow started, regularized towards the calibrated flow
+    rate of the keg. The faucet is closed as soon as the load predicted
+    one closing latency ahead reaches `target`. After each cup,
+    :meth:`finish` updates the flow rate and latency of the keg's
+    calibration from the final load, which is stored at `path`."""
+
+    def __init__(
+        self,
+        target: float = 3.5,
+        keg: str = "default",
+        path: str | os.PathLike[str] | None = None,
+        period: float = 0.1,
+        prior_weight: float = 10.0,
+        smoothing: float = 0.5,
+        onset: float = 0.1,
+    ) -> None:
+        self.target = target
+        self.keg = keg
+        self.path = get_calibration_path() if path is None else pathlib.Path(path)
+        self.period = period
+        """Interval in s at which :meth:`update` is called."""
+        self.prior_weight = prior_weight
+        """Weight of the calibrated flow rate in number of samples."""
+        self.smoothing = smoothing
+        """Weight of the previous calibration when updating it after a cup."""
+        self.onset = onset
+        """Load in N above which the flow is considered started."""
+        self.calibrations = self._read()
+        self.flow_rate = self.calibration.flow_rate
+        """Current estimate of the flow rate in N/s."""
+        self._times: list[float] = []
+        self._loads: list[float] = []
+        self._decided_load: float | None = None
+        self._last: tuple[float, float, bool] | None = None
+
+    @property
+    def calibration(self) -> Calibration:
+        return self.calibrations.setdefault(self.keg, Calibration())
+
+    def start(self) -> None:
+        """Start a new pour."""
+        self._times.clear()
+        self._loads.clear()
+        self._decided_load = None
+        self._last = None
+        self.flow_rate = self.calibration.flow_rate
+
+    def update(self, t: float, load: float) -> bool:
+        """Add a load measurement at time `t` and return whether
+        to close the faucet now."""
+        # The state machine may evaluate the condition twice per measurement
+        if self._last is not None and self._last[:2] == (t, load):
+            return self._last[2]
+        if load > self.onset:
+            self._times.append(t)
+            self._loads.append(load)
+        predicted = load
+        n = len(self._times)
+        if n >= 3:
+            slope, offset = np.polyfit(self._times, self._loads, 1)
+            self.flow_rate = float(
+                (self.prior_weight * self.calibration.flow_rate + n * slope)
+                / (self.prior_weight + n)
+            )
+            predicted = float(offset + slope * t)
+        lead = self.calibration.latency + self.period / 2
+        if predicted + self.flow_rate * lead < self.target and load < self.target:
+            self._last = (t, load, False)
+            return False
+        self._last = (t, load, True)
+        self._decided_load = predicted
+        log.info(
+            "Closing faucet at %.2fN, flow rate %.3fN/s, expecting %.2fN",
+            load,
+            self.flow_rate,
+            predicted + self.flow_rate * self.calibration.latency,
+        )
+        return True
+
+    def finish(self, load: float) -> None:
+        """Update the calibration with the final `load` of the cup."""
+        decided_load = self._decided_load
+        if decided_load is None:
+            return
+        calibration = self.calibration
+        a = self.smoothing if calibration.cups else 0.0
+        latency = max(0.0, (load - decided_load) / self.flow_rate)
+        calibration.flow_rate = a * calibration.flow_rate + (1 - a) * self.flow_rate
+        calibration.latency = a * calibration.latency + (1 - a) * latency
+        calibration.cups += 1
+        log.info(
+            "Poured %.2fN (target %.2fN), calibration of keg %s: %s",
+            load,
+            self.target,
+            self.keg,
+            calibration,
+        )
+        self._decided_load = None
+        self._write()
+
+    def _read(self) -> dict[str, Calibration]:
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            return {keg: Calibration(**values) for keg, values in data.items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, TypeError) as e:
+            log.warning("Ignoring invalid pour calibration %s: %s", self.path, e)
+            return {}
+
+    def _write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Controllers of other stations, possibly in other processes, share
+        # the file, so merge with their latest calibrations under a lock
+        with self.path.with_suffix(".lock").open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            calibrations = self._read()
+            calibrations[self.keg] = self.calibration
+            self.calibrations = calibrations
+            data = {keg: dataclasses.asdict(c) for keg, c in calibrations.items()}
+            trajectories.write_atomic(
+                self.path, lambda f: f.write(json.dumps(data, indent=2).encode())
+            )
@@ -1,74 +1,182 @@
 from __future__ import annotations
 
 import abc
+import collections
+import concurrent.futures
 import logging
+import pathlib
 import threading
 import time
+import typing
 
 import serial
 import serial.tools.list_ports
 
+from ..robot import trajectories
+
+log = logging.getLogger("start_button")
+
+
+def get_port_cache_path() -> pathlib.Path:
+    return trajectories.get_cache_path() / "start_button"
+
 
 class StartButton(abc.ABC):
-    """Physical start button communicating over serial port."""
+    """Physical start button communicating over serial port.
+
+    The port is discovered in the background by probing all `ttyACM`
+    devices concurrently, starting with the device found last time.
+    Presses are debounced by ignoring state changes within `debounce`
+    seconds of the previous change, and the time from receiving a press
+    until :meth:`handle_event` is called is recorded in :attr:`latencies`."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        port: str | None = None,
+        debounce: float = 0.05,
+        probe_timeout: float = 3.0,
+    ) -> None:
         self.stop_threads = threading.Event()
         self.previous_state = 1
-        self.thread = threading.Thread(target=self.loop, args=(self.find_port(),))
+        self.port = port
+        self.debounce = debounce
+        self.probe_timeout = probe_timeout
+        self.latencies: collections.deque[float] = collections.deque(maxlen=100)
+        """Seconds from receiving a press until it was handled."""
+        self._last_change = -float("inf")
+        self._received = 0.0
+        self._tty: serial.Serial | None = None
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.run, name="start_button", daemon=True
+        )
         self.thread.start()
 
+    def run(self) -> None:
+        start = time.perf_counter()
+        port = self.port or self.find_port()
+        if port is None:
+            if not self.stop_threads.is_set():
+                log.error("Start button not found")
+            return
+        log.info(
+            "Start button at %s, found in %.2fs", port, time.perf_counter() - start
+        )
+        self.port = port
+        self.loop(port)
+
     def find_port(self) -> str | None:
-        ports = serial.tools.list_ports.comports()
-        for port in ports:
-            if "ttyACM" in port.device:
-                try:
-                    with serial.Serial(port.device, 9600, timeout=1) as tty:
-                        tty.readlines(3)
-                        line = (
-                            tty.readline()
-                            .decode("utf-8", errors="ignore")
-                            .strip()
-                            .lower()
-                        )
-                        if "id=start_button" in line:
-                            return port.device  # type: ignore[no-any-return]
-                except serial.SerialException as e:
-                    logging.error("Serial exception on %s: %s", port, e)
-                except UnicodeDecodeError as e:
-                    logging.error(
-                        "Unicode exception while reading ID from %s: %s", port, e
-                    )
+        """Return the device of the start button, trying the cached device
+        first and probing the other candidates concurrently."""
+        devices: list[str] = [p.device for p in serial.tools.list_ports.comports()]
+        candidates = [d for d in devices if "ttyACM" in d]
+        cache = get_port_cache_path()
+        try:
+            cached = cache.read_text(encoding="utf-8").strip()
+        except OSError:
+            cached = ""
+        if cached in candidates:
+            if self.probe(cached):
+                log.info("Start button found at cached port %s", cached)
+                return cached
+            candidates.remove(cached)
+        if not candidates:
+            return None
+        found = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(len(candidates)) as pool:
+            futures = {pool.submit(self.probe, d, found): d for d in candidates}
+            for future in concurrent.futures.as_completed(futures):
+                if future.result():
+                    # Stops the remaining probes
+                    found.set()
+                    port = futures[future]
+                    break
+            else:
                 return None
-        return None
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            cache.write_text(port, encoding="utf-8")
+        except OSError as e:
+            log.warning("Failed to cache start button port: %s", e)
+        return port
+
+    def probe(self, port: str, stop: threading.Event | None = None) -> bool:
+        """Whether the device at `port` identifies as the start button
+        within :attr:`probe_timeout` seconds or before `stop` is set."""
+        deadline = time.monotonic() + self.probe_timeout
+        try:
+            with serial.serial_for_url(port, 9600, timeout=0.1) as tty:
+                while time.monotonic() < deadline and not (
+                    self.stop_threads.is_set() or (stop is not None and stop.is_set())
+                ):
+                    line = tty.readline().decode("utf-8", errors="ignore")
+                    if "id=start_button" in line.strip().lower():
+                        return True
+        except serial.SerialException as e:
+            log.error("Serial exception on %s: %s", port, e)
+        return False
 
     def loop(self, port: str) -> None:
+        """Handle button states sent by the device, blocking until data
+        arrives or :meth:`close` is called."""
         try:
-            with serial.Serial(port, 9600, timeout=0.1) as tty:
+            with serial.serial_for_url(port, 9600, timeout=None) as tty:
+                with self._lock:
+                    self._tty = tty
                 while not self.stop_threads.is_set():
-                    try:
-                        line = tty.readline().decode("utf-8", errors="ignore").strip()
-                        self.parse_line(line)
-                    except UnicodeDecodeError as e:
-                        logging.error("Decode error on %s: %s", port, e)
-                    time.sleep(0.01)  # Small sleep to reduce CPU usage
+                    line = tty.readline()
+                    self._received = time.perf_counter()
+                    self.parse_line(line.decode("utf-8", errors="ignore").strip())
         except serial.SerialException as e:
-            logging.error("Serial exception on %s: %s", port, e)
+            log.error("Serial exception on %s: %s", port, e)
+        finally:
+            with self._lock:
+                self._tty = None
 
     def parse_line(self, line: str) -> None:
         if line:
             for key_value in line.split(","):
                 pair = key_value.split("=")
                 if pair[0].lower() == "btn" and len(pair) == 2:
-                    state = int(pair[1])
+                    try:
+                        state = int(pair[1])
+                    except ValueError:
+                        log.warning("Invalid button state: %s", line)
+                        continue
+                    if state == self.previous_state:
+                        continue
+                    now = time.perf_counter()
+                    if now - self._last_change < self.debounce:
+                        continue
+                    self._last_change = now
                     if self.previous_state == 1 and state == 0:
+                        self.latencies.append(now - (self._received or now))
                         self.handle_event()
                     self.previous_state = state
 
     def close(self) -> None:
         self.stop_threads.set()
+        with self._lock:
+            if self._tty is not None:
+                self._tty.cancel_read()  # pylint: disable=no-member
         self.thread.join()
 
     @abc.abstractmethod
     def handle_event(self) -> None:
         pass
+
+
+class CallbackButton(StartButton):
+    """Start button calling `callback` when pressed."""
+
+    def __init__(
+        self,
+        callback: typing.Callable[[], object],
+        port: str | None = None,
+        **kwargs: typing.Any,
+    ) -> None:
+        self.callback = callback
+        super().__init__(port=port, **kwargs)
+
+    def handle_event(self) -> None:
+        self.callback()
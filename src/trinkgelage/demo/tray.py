@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import typing
+
+import numpy as np
+import numpy.typing as npt
+import panda_py
+
+from ..robot import trajectories
+
+log = logging.getLogger("tray")
+
+FORMAT_VERSION = 2
+"""Version of the cached slot table format, bump to invalidate caches."""
+
+
+@dataclasses.dataclass(frozen=True)
+class TrayLayout:
+    """Grid of cups on the tray, relative to the grasp configuration of
+    the first cup stored in `reference`."""
+
+    columns: int = 3
+    rows: int = 4
+    pitch_x: float = 0.15
+    """Distance in m between columns along x."""
+    pitch_z: float = -0.1
+    """Offset in m between rows along z."""
+    approach: float = 0.15
+    """Height in m of the pre-grasp pose above the grasp pose."""
+    retreat: float = 0.15
+    """Distance in m of the post-grasp pose from the grasp pose along y."""
+    reference: str = "grasp_cup_1.csv"
+    speed_factor: float = 0.2
+    """Speed factor of the approach and retreat trajectories."""
+    step: float = 0.01
+    """Distance in m between the waypoints of the approach and retreat."""
+
+    @property
+    def max_cups(self) -> int:
+        return self.columns * self.rows
+
+    def poses(
+        self, idx: int, grasp_1: npt.NDArray[np.float64]
+    ) -> tuple[
+        npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]
+    ]:
+        """Pre-grasp, grasp and post-grasp pose of the cup at position `idx`,
+        given the grasp pose `grasp_1` of the first cup."""
+        grasp = grasp_1.copy()
+        grasp[0, 3] += (idx - 1) % self.columns * self.pitch_x
+        grasp[2, 3] += (idx - 1) // self.columns * self.pitch_z
+        pre_grasp = grasp.copy()
+        pre_grasp[2, 3] += self.approach
+        post_grasp = grasp.copy()
+        post_grasp[1, 3] += self.retreat
+        return pre_grasp, grasp, post_grasp
+
+
+class Slot(typing.NamedTuple):
+    """Poses, joint positions and motions of one tray position."""
+
+    poses: npt.NDArray[np.float64]
+    """Pre-grasp, grasp and post-grasp pose, shape (3, 4, 4)."""
+    q: npt.NDArray[np.float64]
+    """Joint positions of the poses, shape (3, 7)."""
+    approach: tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]
+    """Joint positions and velocities moving along a line from the
+    pre-grasp to the grasp pose."""
+    retreat: tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]
+    """Joint positions and velocities moving along a line from the
+    grasp to the post-grasp pose."""
+
+
+def get_slot_table_path(layout: TrayLayout) -> pathlib.Path:
+    return trajectories.get_cache_path() / f"tray-{_key(layout)}.npz"
+
+
+class SlotTable:
+    """Motions of all tray positions of a layout, computed once and
+    cached to disk, see :meth:`load`. Positions are numbered from 1."""
+
+    def __init__(self, layout: TrayLayout, slots: list[Slot]) -> None:
+        self.layout = layout
+        self.slots = slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __getitem__(self, idx: int) -> Slot:
+        if not 1 <= idx <= len(self.slots):
+            msg = f"Tray position {idx} is not in 1..{len(self.slots)}"
+            raise IndexError(msg)
+        return self.slots[idx - 1]
+
+    @classmethod
+    def load(
+        cls, layout: TrayLayout, path: str | os.PathLike[str] | None = None
+    ) -> SlotTable:
+        """Load the table of `layout` from `path`, computing and storing
+        it first if needed. The motions are memory-mapped."""
+        path = get_slot_table_path(layout) if path is None else pathlib.Path(path)
+        try:
+            with np.load(path) as data:
+                arrays = dict(data)
+            arrays["motions"] = np.load(path.with_suffix(".npy"), mmap_mode="r")
+            return cls.from_arrays(layout, arrays)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Discarding invalid slot table %s: %s", path, e)
+        table = cls.build(layout)
+        try:
+            table.save(path)
+        except OSError as e:
+            log.warning("Unable to cache slot table: %s", e)
+        return table
+
+    @classmethod
+    def build(cls, layout: TrayLayout) -> SlotTable:
+        log.info("Computing slot table of %d tray positions", layout.max_cups)
+        q_1 = np.asarray(trajectories.load(layout.reference), dtype=np.float64)
+        grasp_1 = panda_py.fk(q_1)
+        slots = []
+        for idx in range(1, layout.max_cups + 1):
+            poses = np.stack(layout.poses(idx, grasp_1))
+            approach = _line(poses[0], poses[1], layout.step)
+            retreat = _line(poses[1], poses[2], layout.step)
+            path = _ik(np.concatenate([approach, retreat[1:]]), q_1, len(approach) - 1)
+            q_approach, q_retreat = path[: len(approach)], path[len(approach) - 1 :]
+            slots.append(
+                Slot(
+                    poses,
+                    np.stack([q_approach[0], q_approach[-1], q_retreat[-1]]),
+                    _time_path(q_approach, layout.speed_factor),
+                    _time_path(q_retreat, layout.speed_factor),
+                )
+            )
+        return cls(layout, slots)
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Store the table at `path`, an `.npz` file, with the motions
+        in an `.npy` file next to it."""
+        path = pathlib.Path(path)
+        arrays = self.to_arrays()
+        trajectories.write_atomic(
+            path.with_suffix(".npy"), lambda f: np.save(f, arrays.pop("motions"))
+        )
+        trajectories.write_atomic(path, lambda f: np.savez(f, **arrays))  # type: ignore[arg-type]
+
+    def to_arrays(self) -> dict[str, npt.NDArray[typing.Any]]:
+        motions = [m for s in self.slots for m in (s.approach, s.retreat)]
+        return {
+            "poses": np.stack([s.poses for s in self.slots]),
+            "q": np.stack([s.q for s in self.slots]),
+            "motions": np.concatenate([np.hstack(m) for m in motions]),
+            "index": np.cumsum([0] + [len(m[0]) for m in motions]),
+        }
+
+    @classmethod
+    def from_arrays(
+        cls, layout: TrayLayout, arrays: dict[str, npt.NDArray[typing.Any]]
+    ) -> SlotTable:
+        if len(arrays["poses"]) != layout.max_cups:
+            msg = f"Expected {layout.max_cups} slots, got {len(arrays['poses'])}"
+            raise ValueError(msg)
+        index, motions = arrays["index"], arrays["motions"]
+        if index[-1] != len(motions):
+            msg = f"Expected {index[-1]} samples, got {len(motions)}"
+            raise ValueError(msg)
+        positions, velocities = motions[:, :7], motions[:, 7:]
+        segments = [
+            (positions[a:b], velocities[a:b]) for a, b in zip(index[:-1], index[1:])
+        ]
+        slots = [
+            Slot(poses, q, approach, retreat)
+            for poses, q, approach, retreat in zip(
+                arrays["poses"], arrays["q"], segments[::2], segments[1::2]
+            )
+        ]
+        return cls(layout, slots)
+
+
+def _line(
+    start: npt.NDArray[np.float64], end: npt.NDArray[np.float64], step: float
+) -> npt.NDArray[np.float64]:
+    """Poses on the line from `start` to `end` keeping the orientation."""
+    distance = np.linalg.norm(end[:3, 3] - start[:3, 3])
+    n = max(2, int(np.ceil(distance / step)) + 1)
+    poses = np.repeat(start[None], n, axis=0)
+    poses[:, :3, 3] = np.linspace(start[:3, 3], end[:3, 3], n)
+    return poses
+
+
+def _ik(
+    poses: npt.NDArray[np.float64], q_init: npt.NDArray[np.float64], start: int
+) -> npt.NDArray[np.float64]:
+    """Joint positions of the path through `poses`, solved outwards from
+    pose `start`. Pose `start` takes the solution closest to `q_init` of
+    all values of the last joint, such that the reference cup reproduces
+    `q_init` and neighbouring cups use similar configurations.
+
+    Towards both ends of the path, the last joint keeps its value if there
+    is a solution along the whole path. Otherwise it moves linearly to the
+    end value with the smallest peak joint velocity along the path, which
+    also avoids large null space motions."""
+    q7s = np.concatenate([[q_init[-1]], np.linspace(-2.8, 2.8, 57)])
+    solutions = np.array([panda_py.ik(poses[start], q_init, q7) for q7 in q7s])
+    distances = np.max(np.abs(solutions - q_init), axis=1)
+    if np.all(np.isnan(distances)):
+        msg = "No inverse kinematics solution for tray position"
+        raise ValueError(msg)
+    q_start = solutions[np.nanargmin(distances)]
+    best, best_peak = None, np.inf
+    for q7_end in np.concatenate([[q_start[-1]], q7s[1:]]):
+        path = _follow(poses, q_start, start, q7_end)
+        if path is None:
+            continue
+        if q7_end == q_start[-1]:
+            return path
+        peak = np.max(np.abs(np.diff(path, axis=0)) / trajectories.MAX_JOINT_VELOCITY)
+        if peak < best_peak:
+            best, best_peak = path, peak
+    if best is None:
+        msg = "No inverse kinematics solution along the tray approach"
+        raise ValueError(msg)
+    return best
+
+
+def _follow(
+    poses: npt.NDArray[np.float64],
+    q_start: npt.NDArray[np.float64],
+    start: int,
+    q7_end: float,
+) -> npt.NDArray[np.float64] | None:
+    """Joint positions of `poses` following on from `q_start` at pose
+    `start`, with the last joint moving linearly to `q7_end` at both ends,
+    or None if there is no solution."""
+    path = [q_start] * len(poses)
+    for indices in (range(start - 1, -1, -1), range(start + 1, len(poses))):
+        q7s = np.linspace(q_start[-1], q7_end, len(indices) + 1)[1:]
+        q = q_start
+        for i, q7 in zip(indices, q7s):
+            q = np.asarray(panda_py.ik(poses[i], q, q7), dtype=np.float64)
+            if np.any(np.isnan(q)):
+                return None
+            path[i] = q
+    return np.stack(path)
+
+
+def _time_path(
+    path: npt.NDArray[np.float64], speed_factor: float, frequency: float = 1000.0
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Move along the equidistant waypoints `path` with a rest-to-rest
+    quintic time law, as fast as the joint velocity limits scaled by
+    `speed_factor` allow."""
+    s = np.linspace(0, 1, len(path))
+    slope = np.abs(np.diff(path, axis=0)) * (len(path) - 1)
+    peak = 1.875 * np.max(slope / (trajectories.MAX_JOINT_VELOCITY * speed_factor))
+    tf = max(peak, 1.0 / frequency)
+    t = np.linspace(0, 1, max(2, round(tf * frequency) + 1))
+    progress = t**3 * (10 - 15 * t + 6 * t**2)
+    rate = 30 * t**2 * (1 - t) ** 2 / tf
+    q = np.stack([np.interp(progress, s, joint) for joint in path.T], axis=1)
+    segment = np.minimum((progress * (len(path) - 1)).astype(int), len(path) - 2)
+    dq = np.diff(path, axis=0)[segment] * (len(path) - 1) * rate[:, None]
+    return q, dq
+
+
+def _key(layout: TrayLayout) -> str:
+    reference = np.ascontiguousarray(trajectories.load(layout.reference))
+    ident = json.dumps([FORMAT_VERSION, dataclasses.asdict(layout)], sort_keys=True)
+    return hashlib.sha1(ident.encode() + reference.tobytes()).hexdigest()[:16]
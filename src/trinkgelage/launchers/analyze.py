@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import pathlib
+
+import numpy as np
+
+from ..demo import estimate
+from ..robot import analysis, trajectories
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("analyze")
+
+
+def transition_savings(reports: dict[str, analysis.Report]) -> dict[str, float]:
+    """Time in s saved by retiming the trajectory files of each transition
+    serving a cup, see :data:`trinkgelage.demo.estimate.PLANS`. Motions of
+    both arms take as long as the critical arm, before and after retiming.
+    Files without a report, e.g. joint positions, count as taking no time."""
+
+    def durations(files: tuple[str, ...]) -> tuple[float, float]:
+        found = [reports[f] for f in files if f in reports]
+        return (
+            sum(r.duration for r in found),
+            sum(r.retimed_duration for r in found),
+        )
+
+    savings = dict.fromkeys(estimate.PLANS, 0.0)
+    for event, steps in estimate.PLANS.items():
+        for step in steps:
+            if isinstance(step, estimate.Motion):
+                left, left_retimed = durations(step.left)
+                right, right_retimed = durations(step.right)
+                savings[event] += max(left, right) - max(left_retimed, right_retimed)
+    return savings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Report the velocity, acceleration and jerk of the "
+        "trajectories relative to the joint limits and the time saved by "
+        "retiming them time-optimally"
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="Trajectory files, all files in the data directory by default",
+    )
+    parser.add_argument(
+        "--data",
+        default=str(trajectories.DATA_PATH),
+        help="Directory of the trajectory files",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=None,
+        help="Write the retimed trajectories as .npy files to this directory",
+    )
+    parser.add_argument(
+        "--safety",
+        type=float,
+        default=0.9,
+        help="Fraction of the joint limits the retimed trajectories may use",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=21,
+        help="Number of samples each derivative is smoothed over",
+    )
+    args = parser.parse_args()
+
+    store = trajectories.TrajectoryStore(args.data)
+    files = args.files or sorted(
+        p.name
+        for p in pathlib.Path(args.data).iterdir()
+        if p.suffix in (".csv", ".npy")
+    )
+    reports: dict[str, analysis.Report] = {}
+    for filename in files:
+        result = analysis.analyze(
+            filename, store, window=args.window, safety=args.safety
+        )
+        if result is None:
+            continue
+        report, retimed = result
+        reports[filename] = report
+        logger.info(
+            "%s: %.2fs -> %.2fs (-%.2fs), uniform time scale %.2f, %s",
+            filename,
+            report.duration,
+            report.retimed_duration,
+            report.saving,
+            report.margins.time_scale,
+            report.margins,
+        )
+        if args.output is not None:
+            path = pathlib.Path(args.output) / f"{pathlib.Path(filename).stem}.npy"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(path, retimed)
+
+    for event, saving in transition_savings(reports).items():
+        logger.info("Transition %s: -%.2fs", event, saving)
@@ -1,42 +1,96 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import http.client
 import logging
 import threading
+import time
+import typing
+from xmlrpc import client
 
-import simple_term_menu
+from ..monitoring import metrics, tracing
 
-from ..demo import control, start_button
-from ..robot import utils
+if typing.TYPE_CHECKING:
+    import simple_term_menu
+
+    from ..demo import control
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("trinkgelage")
 
 
-class StartDemo(start_button.StartButton):
-    """Physical start button communicating over serial port."""
+class Startup:
+    """Records the duration of each startup phase."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.durations: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        with tracing.span(name, "startup"):
+            yield
+        self.durations[name] = time.perf_counter() - start
+
+    def report(self) -> None:
+        phases = ", ".join(f"{k} {v:.2f}s" for k, v in self.durations.items())
+        logger.info("Started in %.2fs (%s)", time.perf_counter() - self.start, phases)
+
 
-    def __init__(
-        self, demo_control: control.DemoControl, menu: simple_term_menu.TerminalMenu
-    ) -> None:
-        self.control = demo_control
-        self.menu = menu
-        super().__init__()
+def tray_size(value: str) -> tuple[int, int]:
+    """Parse the size of the tray given as `<columns>x<rows>`."""
+    try:
+        columns, rows = (int(n) for n in value.lower().split("x"))
+    except ValueError:
+        msg = f"expected <columns>x<rows>, got {value!r}"
+        raise argparse.ArgumentTypeError(msg) from None
+    if columns < 1 or rows < 1:
+        msg = f"tray must hold at least one cup, got {value!r}"
+        raise argparse.ArgumentTypeError(msg)
+    return columns, rows
 
-    def handle_event(self) -> None:
-        logger.info("Start button pressed")
-        if self.control.current_state == control.DemoControl.idle:
-            threading.Thread(target=self.run_demo).start()
-        else:
-            logger.warning("Demo already in progress")
-            self.menu._paint_menu()  # pylint: disable=protected-access
 
-    def run_demo(self) -> None:
-        self.control.start_demo()
-        self.menu._paint_menu()  # pylint: disable=protected-access
+def add_run_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments shared by the launchers running demos."""
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Record a trace of each cycle and write it to this Chrome trace file on exit",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics over HTTP on this local port",
+    )
+    parser.add_argument(
+        "--tick-timing",
+        action="store_true",
+        help="Log control loop timing statistics of each trajectory",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Overlap the motions of consecutive cups",
+    )
+    parser.add_argument(
+        "--sim",
+        action="store_true",
+        help="Run the demo against simulated robots instead of real ones",
+    )
+    parser.add_argument(
+        "--sim-speed",
+        type=float,
+        default=10.0,
+        help="Speed of the simulation relative to real time",
+    )
 
 
 def main() -> None:
+    startup = Startup()
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--start-position",
@@ -48,31 +102,126 @@ def main() -> None:
     parser.add_argument("--gui", "-g", action="store_true", help="Connect to GUI")
     parser.add_argument("--gui-hostname", type=str, default="gap-nuc-003.local")
     parser.add_argument("--gui-port", type=int, default=8000)
+    parser.add_argument(
+        "--order-port",
+        type=int,
+        default=None,
+        help="Take orders over XML-RPC on this local port",
+    )
+    parser.add_argument(
+        "--keg",
+        default="default",
+        help="Name of the keg, each keg keeps its own pour calibration",
+    )
+    parser.add_argument(
+        "--tray",
+        type=tray_size,
+        default=(3, 4),
+        help="Columns and rows of cups on the tray, e.g. 3x4",
+    )
+    add_run_arguments(parser)
     args = parser.parse_args()
 
-    options = ["Trigger Demo", "Draw beer Manually", "Confirm cups refilled", "Exit"]
+    # Deferred, such that --help and argument errors return immediately
+    # pylint: disable=import-outside-toplevel
+    with startup.phase("import"):
+        import simple_term_menu  # noqa: PLC0415
+
+        from ..demo import control, orders, start_button, tray  # noqa: PLC0415
+        from ..robot import backend, sim, timing, utils  # noqa: PLC0415
+
+    timing.enabled = args.tick_timing
+    if args.trace:
+        tracing.tracer.enable()
+    metrics_server = serve_metrics(args.metrics_port)
+
+    options = ["Order Cup", "Draw beer Manually", "Confirm cups refilled", "Exit"]
     terminal_menu = simple_term_menu.TerminalMenu(options)
 
-    left, right = utils.get_robot_hostnames()
-    model = control.DemoModel(
-        left,
-        right,
-        use_gui=args.gui,
-        gui_url=f"http://{args.gui_hostname}:{args.gui_port}",
-        start_position=args.start_position,
-    )
+    robot_backend: backend.Backend
+    if args.sim:
+        robot_backend = sim.SimBackend(speed=args.sim_speed)
+        left, right = robot_backend.left, robot_backend.right
+    else:
+        robot_backend = backend.Backend()
+        left, right = utils.get_robot_hostnames()
+    with startup.phase("connect"):
+        model = control.DemoModel(
+            left,
+            right,
+            enforce_rt=not args.sim,
+            use_gui=args.gui,
+            gui_url=f"http://{args.gui_hostname}:{args.gui_port}",
+            start_position=args.start_position,
+            robot_backend=robot_backend,
+            keg=args.keg,
+            pipelined=args.pipelined,
+            tray_layout=tray.TrayLayout(*args.tray),
+        )
     sm = control.DemoControl(model)
-    btn = StartDemo(sm, terminal_menu)
+    # The button's port and the GUI are found while the robots are homing
+    btn = start_button.CallbackButton(lambda: button_pressed(sm, terminal_menu))
+    handshake = threading.Thread(target=gui_handshake, args=(model, startup))
+    handshake.start()
+    with startup.phase("home"):
+        model.wait_for()
+    handshake.join()
+    startup.report()
+    api = None
+    if args.order_port is not None:
+        api = orders.OrderApi(sm.order, model.orders, args.order_port)
+        logger.info("Taking orders on port %d", api.port)
 
     while True:
         choice = terminal_menu.show()
-        if choice == 0 and sm.current_state == control.DemoControl.idle:
-            sm.start_demo()
-        elif choice == 1 and sm.current_state == control.DemoControl.idle:
-            sm.start_demo(user=True)
-        elif choice == 2 and sm.current_state == control.DemoControl.cups_empty:
-            sm.refill_cups()
+        if choice == 0:
+            sm.order("menu")
+        elif choice == 1:
+            with model.run_lock:
+                if sm.current_state == control.DemoControl.idle:
+                    sm.run_cycle(user=True)
+        elif choice == 2:
+            with model.run_lock:
+                if sm.current_state == control.DemoControl.cups_empty:
+                    sm.refill_cups()
+            sm.serve()
         elif choice == 3:
             break
 
-    btn.close()
+    if api is not None:
+        api.close()
+    if metrics_server is not None:
+        metrics_server.close()
+    if model.orders:
+        logger.warning("Exiting with %d orders pending", len(model.orders))
+    with model.run_lock:
+        btn.close()
+    model.close()
+    if args.trace:
+        tracing.tracer.export(args.trace)
+
+
+def button_pressed(
+    demo_control: control.DemoControl, menu: simple_term_menu.TerminalMenu
+) -> None:
+    logger.info("Start button pressed")
+    demo_control.order("button")
+    menu._paint_menu()  # pylint: disable=protected-access
+
+
+def serve_metrics(port: int | None) -> metrics.MetricsServer | None:
+    if port is None:
+        return None
+    server = metrics.MetricsServer(port)
+    logger.info("Serving metrics on http://127.0.0.1:%d/metrics", server.port)
+    return server
+
+
+def gui_handshake(model: control.DemoModel, startup: Startup) -> None:
+    if not model.gui:
+        return
+    with startup.phase("gui"):
+        try:
+            model.gui.flush(timeout=5.0)
+        except (OSError, ValueError, client.Error, http.client.HTTPException) as e:
+            logger.warning("GUI not reachable: %s", e)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+from ..demo import control, estimate, pour, tray
+from . import demo
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("estimate")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Estimate the time to serve a cup and the maximum number "
+        "of cups per hour from the trajectories, without any robot"
+    )
+    parser.add_argument(
+        "--cup",
+        "-n",
+        type=int,
+        default=2,
+        help="Tray position of the cup to estimate the paths for",
+    )
+    parser.add_argument(
+        "--tray",
+        type=demo.tray_size,
+        default=(3, 4),
+        help="Columns and rows of cups on the tray, e.g. 3x4",
+    )
+    parser.add_argument(
+        "--keg",
+        default="default",
+        help="Name of the keg whose pour calibration is used",
+    )
+    parser.add_argument(
+        "--speed-factor",
+        type=float,
+        default=None,
+        help="Speed factor of the motions of trajectory files and the moves "
+        f"to the tray positions, {control.DemoModel.speed_factor} by default",
+    )
+    args = parser.parse_args()
+
+    plans = estimate.PLANS
+    if args.speed_factor is not None:
+        plans = estimate.with_speed_factor(plans, args.speed_factor)
+    estimator = estimate.CycleEstimator(
+        tray.TrayLayout(*args.tray), pour.PourController(keg=args.keg), plans
+    )
+    for path in (estimator.single(args.cup), estimator.back_to_back(args.cup)):
+        logger.info("Path %s: %s", path.name, " -> ".join(path.events))
+        for step in path.steps:
+            logger.info("  %s", step)
+        logger.info("  %-16s %67.2fs", "total", path.duration)
+    logger.info(
+        "Maximum throughput %.1f cups/h with orders queued all the time",
+        estimator.cups_per_hour(),
+    )
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import pathlib
+import time
+
+from panda_py import libfranka
+
+from ..robot import backend, recorder, sim, utils
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("record")
+
+
+def output_paths(name: str, arms: list[str], output: str) -> list[pathlib.Path]:
+    """Files of a recording, `<name>.npy` for a single arm and
+    `<arm>_<name>.npy` for each arm otherwise."""
+    if len(arms) == 1:
+        return [pathlib.Path(output) / f"{name}.npy"]
+    return [pathlib.Path(output) / f"{arm}_{name}.npy" for arm in arms]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Record the joint positions and velocities of the robots "
+        "at 1 kHz, e.g. while guiding them by hand, to trajectory files"
+    )
+    parser.add_argument("name", help="Name of the recorded motion")
+    parser.add_argument(
+        "--arm",
+        choices=["left", "right", "both"],
+        default="both",
+        help="Record one arm or both arms aligned in time",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=".",
+        help="Directory to write the trajectory files to",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Record for this many seconds instead of until Enter is pressed",
+    )
+    parser.add_argument(
+        "--no-teaching",
+        dest="teaching",
+        action="store_false",
+        help="Don't enable teaching mode, e.g. to record a motion "
+        "commanded by another program",
+    )
+    parser.add_argument(
+        "--sim",
+        action="store_true",
+        help="Record simulated robots instead of real ones",
+    )
+    args = parser.parse_args()
+
+    robot_backend: backend.Backend
+    if args.sim:
+        robot_backend = sim.SimBackend(speed=1.0)
+        hostnames = {"left": robot_backend.left, "right": robot_backend.right}
+        rt = libfranka.RealtimeConfig.kIgnore
+    else:
+        robot_backend = backend.Backend()
+        hostnames = dict(zip(("left", "right"), utils.get_robot_hostnames()))
+        rt = libfranka.RealtimeConfig.kEnforce
+    arms = ["left", "right"] if args.arm == "both" else [args.arm]
+    robots = [robot_backend.panda(hostnames[arm], realtime_config=rt) for arm in arms]
+    paths = output_paths(args.name, arms, args.output)
+
+    if args.teaching:
+        for robot in robots:
+            robot.teaching_mode(True)
+    try:
+        with recorder.Recorder(robots, paths):
+            if args.duration is None:
+                input("Recording, press Enter to stop")
+            else:
+                logger.info("Recording for %.1fs", args.duration)
+                time.sleep(args.duration)
+    finally:
+        if args.teaching:
+            for robot in robots:
+                robot.teaching_mode(False)
@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+from ..demo import tray
+from ..monitoring import tracing
+from ..robot import backend, sim, timing, trajectories
+from . import demo
+
+if typing.TYPE_CHECKING:
+    from ..demo import control, start_button
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("stations")
+
+
+@dataclasses.dataclass
+class StationConfig:
+    """Configuration of one tapping station."""
+
+    name: str
+    left: str
+    """Hostname of the robot operating the faucet."""
+    right: str
+    """Hostname of the robot holding the cup."""
+    button: str | None = None
+    """Serial port of the start button, the station has no button if unset."""
+    gui: str | None = None
+    """URL of the GUI server, the station has no GUI if unset."""
+    keg: str = "default"
+    start_position: int = 1
+    tray: tuple[int, int] = (3, 4)
+    """Columns and rows of cups on the tray."""
+
+
+def load_stations(path: str | os.PathLike[str]) -> list[StationConfig]:
+    """
+    Read the stations from a JSON file containing a list of objects
+    with the fields of :class:`StationConfig`.
+    """
+    with open(path, encoding="utf-8") as f:  # noqa: PTH123
+        configs = [StationConfig(**station) for station in json.load(f)]
+    names = [c.name for c in configs]
+    if len(set(names)) != len(names):
+        msg = f"Station names must be unique, got {names}"
+        raise ValueError(msg)
+    return configs
+
+
+class Station:
+    """
+    Runs the demo of one station. Events run on a thread of the station,
+    such that an error only stops the station it occurred in, until it
+    is restarted.
+    """
+
+    def __init__(
+        self,
+        config: StationConfig,
+        robot_backend: backend.Backend,
+        prefetcher: trajectories.Prefetcher | None = None,
+        pipelined: bool = False,
+    ) -> None:
+        self.config = config
+        self.backend = robot_backend
+        self.prefetcher = prefetcher
+        self.pipelined = pipelined
+        self.model: control.DemoModel | None = None
+        self.control: control.DemoControl | None = None
+        self.button: start_button.StartButton | None = None
+        self.error: Exception | None = None
+        """Error that stopped the station, if any."""
+        self._busy = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return f"failed ({self.error})"
+        if self.control is None:
+            return "offline"
+        state = self.control.current_state.id
+        busy = not self._idle.is_set() or (
+            self.model is not None and self.model.dispatching
+        )
+        return f"busy ({state})" if busy else state
+
+    def connect(self) -> bool:
+        """Connect to and initialize the robots, and return whether
+        the station is ready."""
+        # Deferred until a station connects, such that --help and argument
+        # errors return immediately
+        # pylint: disable=import-outside-toplevel
+        from ..demo import control, start_button  # noqa: PLC0415
+
+        self.close()
+        self.error = None
+        tracing.tracer.set_process(self.config.name)
+        try:
+            self.model = control.DemoModel(
+                self.config.left,
+                self.config.right,
+                enforce_rt=not isinstance(self.backend, sim.SimBackend),
+                use_gui=self.config.gui is not None,
+                gui_url=self.config.gui or "",
+                start_position=self.config.start_position,
+                robot_backend=self.backend,
+                keg=self.config.keg,
+                pipelined=self.pipelined,
+                prefetcher=self.prefetcher,
+                tray_layout=tray.TrayLayout(*self.config.tray),
+                station=self.config.name,
+            )
+            self.control = control.DemoControl(self.model)
+            self.model.wait_for()
+        except Exception as e:  # noqa: BLE001  # pylint: disable=broad-exception-caught
+            self.fail(e)
+            return False
+        if self.config.button is not None:
+            self.button = start_button.CallbackButton(
+                self.button_pressed, port=self.config.button
+            )
+        logger.info("Station %s is ready", self.config.name)
+        return True
+
+    def button_pressed(self) -> None:
+        logger.info("Start button of %s pressed", self.config.name)
+        self.order("button")
+
+    def order(self, source: str) -> bool:
+        """Queue a cup, see :meth:`trinkgelage.demo.control.DemoControl.order`,
+        and return whether it was accepted, which it is not while the
+        station is offline or failed."""
+        if self.control is None or self.error is not None:
+            logger.warning("Station %s is %s", self.config.name, self.status)
+            return False
+        self.control.order(source)
+        return True
+
+    def send(self, event: str, **kwargs: typing.Any) -> bool:
+        """Run `event` in the background and return whether it was
+        accepted, which it is not while the station is busy or failed."""
+        if self.control is None or self.error is not None:
+            logger.warning("Station %s is %s", self.config.name, self.status)
+            return False
+        with self._busy:
+            if not self._idle.is_set():
+                logger.warning("Station %s is busy", self.config.name)
+                return False
+            self._idle.clear()
+        threading.Thread(
+            target=self._run, args=(event, kwargs), name=self.config.name, daemon=True
+        ).start()
+        return True
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait until the station finished its current event and orders."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._idle.wait(timeout):
+            return False
+        while self.model is not None and self.model.dispatching:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def fail(self, error: Exception) -> None:
+        self.error = error
+        logger.error("Station %s failed: %s", self.config.name, error, exc_info=error)
+
+    def close(self) -> None:
+        if self.button is not None:
+            self.button.close()
+            self.button = None
+        if self.model is not None:
+            self.model.close()
+        self.model = None
+        self.control = None
+
+    def _run(self, event: str, kwargs: dict[str, typing.Any]) -> None:
+        import statemachine  # noqa: PLC0415  # pylint: disable=import-outside-toplevel
+
+        assert self.control is not None
+        assert self.model is not None
+        tracing.tracer.set_process(self.config.name)
+        try:
+            # Like the menu of the demo, events wait for the orders being
+            # served, and a failed cycle returns to idle
+            with self.model.run_lock:
+                if event != "start_demo":
+                    self.control.send(event, **kwargs)
+                elif self.control.current_state == self.control.idle:
+                    self.control.run_cycle(**kwargs)
+                else:
+                    logger.warning("Station %s is %s", self.config.name, self.status)
+            if event == "refill_cups":
+                # Serve the orders waiting for the refill
+                self.control.serve()
+        except statemachine.exceptions.TransitionNotAllowed as e:
+            logger.warning("Station %s: %s", self.config.name, e)
+        except Exception as e:  # noqa: BLE001  # pylint: disable=broad-exception-caught
+            self.fail(e)
+        finally:
+            self._idle.set()
+
+
+def real_backend(config: StationConfig) -> backend.Backend:
+    del config
+    return backend.Backend()
+
+
+class Orchestrator:
+    """Runs several stations from one process. The stations share the
+    loaded trajectory data, see :data:`trinkgelage.robot.trajectories.store`."""
+
+    def __init__(
+        self,
+        configs: typing.Iterable[StationConfig],
+        backend_factory: typing.Callable[[StationConfig], backend.Backend]
+        | None = None,
+        pipelined: bool = False,
+    ) -> None:
+        if backend_factory is None:
+            backend_factory = real_backend
+        self.prefetcher = trajectories.Prefetcher()
+        self.stations = [
+            Station(config, backend_factory(config), self.prefetcher, pipelined)
+            for config in configs
+        ]
+
+    def __getitem__(self, name: str) -> Station:
+        for station in self.stations:
+            if station.config.name == name:
+                return station
+        raise KeyError(name)
+
+    def connect(self) -> list[Station]:
+        """Connect all stations concurrently and return the ready ones."""
+        with concurrent.futures.ThreadPoolExecutor(
+            max(1, len(self.stations)), thread_name_prefix="connect"
+        ) as pool:
+            ready = list(pool.map(Station.connect, self.stations))
+        return [s for s, r in zip(self.stations, ready) if r]
+
+    def status(self) -> str:
+        return "\n".join(f"{s.config.name}: {s.status}" for s in self.stations)
+
+    def close(self) -> None:
+        for station in self.stations:
+            station.wait()
+            station.close()
+        self.prefetcher.shutdown()
+
+
+def station_actions(
+    station: Station,
+) -> list[tuple[str, typing.Callable[[], object]]]:
+    """Menu entries of `station`."""
+
+    def restart() -> None:
+        station.wait()
+        threading.Thread(target=station.connect, daemon=True).start()
+
+    return [
+        ("Trigger demo", lambda: station.order("menu")),
+        ("Draw beer manually", lambda: station.send("start_demo", user=True)),
+        ("Confirm cups refilled", lambda: station.send("refill_cups")),
+        ("Restart", restart),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run several tapping stations from one process"
+    )
+    parser.add_argument(
+        "stations",
+        help="JSON file with a list of stations, each with a name, left and "
+        "right robot hostname and optionally a button port, GUI URL and keg",
+    )
+    demo.add_run_arguments(parser)
+    args = parser.parse_args()
+
+    # pylint: disable-next=import-outside-toplevel
+    import simple_term_menu  # noqa: PLC0415
+
+    timing.enabled = args.tick_timing
+    if args.trace:
+        tracing.tracer.enable()
+    metrics_server = demo.serve_metrics(args.metrics_port)
+
+    def sim_backend(config: StationConfig) -> backend.Backend:
+        return sim.SimBackend(config.left, config.right, speed=args.sim_speed)
+
+    orchestrator = Orchestrator(
+        load_stations(args.stations),
+        backend_factory=sim_backend if args.sim else None,
+        pipelined=args.pipelined,
+    )
+    orchestrator.connect()
+
+    while True:
+        entries: list[tuple[str, typing.Callable[[], object] | None]] = [
+            (f"{station.config.name}: {label}", action)
+            for station in orchestrator.stations
+            for label, action in station_actions(station)
+        ]
+        entries += [("Refresh status", lambda: None), ("Exit", None)]
+        menu = simple_term_menu.TerminalMenu(
+            [label for label, _ in entries], title=orchestrator.status()
+        )
+        choice = menu.show()
+        if not isinstance(choice, int):
+            break
+        action = entries[choice][1]
+        if action is None:
+            break
+        action()
+
+    orchestrator.close()
+    if metrics_server is not None:
+        metrics_server.close()
+    if args.trace:
+        tracing.tracer.export(args.trace)
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import bisect
+import http.server
+import logging
+import math
+import threading
+import typing
+
+log = logging.getLogger("metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""Content type of the Prometheus text exposition format."""
+
+
+class Metric:
+    """A named metric with one value per combination of the values of
+    its `labels`, exposed in the Prometheus text format.
+
+    Updates take a lock held for a few dictionary operations, such that
+    they can be made from any thread, including the control threads."""
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: typing.Sequence[str] = (),
+        metrics_registry: Registry | None = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._label_set = frozenset(self.labels)
+        self._lock = threading.Lock()
+        (registry if metrics_registry is None else metrics_registry).register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if labels.keys() != self._label_set:
+            msg = f"{self.name} expects labels {self.labels}, got {tuple(labels)}"
+            raise ValueError(msg)
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        """Name, labels and value of each sample of the metric."""
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation, help_text=True)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, labels, value in self.samples():
+            sample = name
+            if labels:
+                pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                sample = f"{name}{{{pairs}}}"
+            lines.append(f"{sample} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """A total that only increases, e.g. the number of cups served."""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: typing.Sequence[str] = (),
+        metrics_registry: Registry | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labels, metrics_registry)
+        self._values: dict[tuple[str, ...], float] = {}
+        if not self.labels:
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            msg = f"{self.name} can only increase, got {amount}"
+            raise ValueError(msg)
+        self._add(amount, self._key(labels))
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, dict(zip(self.labels, k)), v) for k, v in values]
+
+    def _add(self, amount: float, key: tuple[str, ...]) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Counter):
+    """A value that can go up and down, e.g. the number of cups left."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._add(amount, self._key(labels))
+
+
+class Histogram(Metric):
+    """Counts observations, e.g. durations, in cumulative buckets with
+    the upper bounds `buckets`."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: typing.Sequence[float],
+        labels: typing.Sequence[str] = (),
+        metrics_registry: Registry | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labels, metrics_registry)
+        self.buckets = sorted(float(b) for b in buckets if b != math.inf)
+        # Per label values, the count of each bucket and +Inf, and the sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        if not self.labels:
+            self._values[()] = ([0] * (len(self.buckets) + 1), [0.0])
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][i] += 1
+            entry[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return 0 if entry is None else sum(entry[0])
+
+    def total(self, **labels: str) -> float:
+        """Sum of the observations."""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return 0.0 if entry is None else entry[1][0]
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            values = [
+                (k, list(counts), total[0])
+                for k, (counts, total) in self._values.items()
+            ]
+        samples: list[tuple[str, dict[str, str], float]] = []
+        for key, counts, total in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        {**labels, "le": _format(bound)},
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """Collection of metrics exposed together."""
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        with self._lock:
+            if metric.name in self.metrics:
+                msg = f"Metric {metric.name} already registered"
+                raise ValueError(msg)
+            self.metrics[metric.name] = metric
+
+    def expose(self) -> str:
+        """All metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "".join(m.expose() for m in metrics)
+
+
+class MetricsServer:
+    """HTTP server exposing the metrics of a registry at `/metrics`
+    on the local machine, to be scraped by Prometheus."""
+
+    def __init__(
+        self,
+        port: int = 8002,
+        host: str = "127.0.0.1",
+        metrics_registry: Registry | None = None,
+    ) -> None:
+        source = registry if metrics_registry is None else metrics_registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Serves the metrics at `/metrics`."""
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = source.expose().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: typing.Any) -> None:  # pylint: disable=redefined-builtin
+                log.debug(format, *args)
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port: int = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def _escape(value: str, help_text: bool = False) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+registry = Registry()
+"""Registry shared by the whole package."""
+
+cups_served = Counter(
+    "trinkgelage_cups_served_total", "Cups placed for pickup.", labels=["station"]
+)
+cups_remaining = Gauge(
+    "trinkgelage_cups_remaining", "Cups left on the tray.", labels=["station"]
+)
+cycle_time = Histogram(
+    "trinkgelage_cycle_seconds",
+    "Duration of a demo cycle, from starting the demo or the next order "
+    "until the next order or returning to idle.",
+    [10, 15, 20, 25, 30, 40, 50, 60, 90, 120],
+    labels=["station"],
+)
+pour_time = Histogram(
+    "trinkgelage_pour_seconds",
+    "Duration from opening to closing the faucet.",
+    [2, 4, 6, 8, 10, 12, 15, 20, 30],
+    labels=["station"],
+)
+order_latency = Histogram(
+    "trinkgelage_order_latency_seconds",
+    "Time from placing an order until the robot starts picking up its cup.",
+    [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300],
+    labels=["station", "source"],
+)
+state_time = Counter(
+    "trinkgelage_state_seconds_total",
+    "Time spent in each state of the demo.",
+    labels=["station", "state"],
+)
+retries = Counter(
+    "trinkgelage_retries_total",
+    "Robot actions retried after an error.",
+    labels=["station", "action"],
+)
+failures = Counter(
+    "trinkgelage_failures_total",
+    "Robot actions that failed after the last retry.",
+    labels=["station", "action"],
+)
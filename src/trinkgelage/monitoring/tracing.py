@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+log = logging.getLogger("tracing")
+
+F = typing.TypeVar("F", bound=typing.Callable[..., typing.Any])
+
+
+class Event(typing.NamedTuple):
+    """A completed span."""
+
+    name: str
+    category: str
+    thread: int
+    start: int
+    """Start time in ns."""
+    duration: int
+    """Duration in ns."""
+    process: str = ""
+    """Process the span is attributed to, see :meth:`Tracer.set_process`."""
+
+
+class Cycle(typing.NamedTuple):
+    """Time window of one demo cycle."""
+
+    start: int
+    end: int
+    process: str = ""
+
+
+class Tracer:
+    """Records nested spans of named work per thread.
+
+    The tracer is disabled by default, in which case spans cost a single
+    attribute lookup. Completed spans are kept in a bounded buffer and
+    can be exported as Chrome/Perfetto trace JSON with :meth:`export`.
+    Spans are attributed to the process of their thread, e.g. a station,
+    such that the demos of several stations are traced separately."""
+
+    def __init__(self, max_events: int = 1_000_000) -> None:
+        self.enabled = False
+        self.events: collections.deque[Event] = collections.deque(maxlen=max_events)
+        self.cycles: collections.deque[Cycle] = collections.deque(maxlen=max_events)
+        self.thread_names: dict[int, str] = {}
+        self._open: dict[tuple[str, str, str], tuple[int, int]] = {}
+        self._cycle_start: dict[str, int] = {}
+        self._local = threading.local()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        self.events.clear()
+        self.thread_names.clear()
+        self.cycles.clear()
+        self._open.clear()
+        self._cycle_start.clear()
+
+    def set_process(self, process: str) -> None:
+        """Attribute the spans of the current thread to `process`."""
+        self._local.process = process
+
+    @property
+    def process(self) -> str:
+        """Process the spans of the current thread are attributed to."""
+        return str(getattr(self._local, "process", ""))
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "") -> typing.Iterator[None]:
+        """Record the enclosed block as span `name`."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._record(name, category, start, time.perf_counter_ns())
+
+    def traced(self, func: F) -> F:
+        """Decorator recording each call of `func` as a span."""
+        name = func.__qualname__
+        category = func.__module__.rsplit(".", 1)[-1]
+
+        @functools.wraps(func)
+        def wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record(name, category, start, time.perf_counter_ns())
+
+        return typing.cast(F, wrapper)
+
+    def begin(self, name: str, category: str = "") -> None:
+        """Open a span that is closed by a later call to :meth:`end`,
+        possibly from a different callback."""
+        if self.enabled:
+            self._open[(self.process, name, category)] = (
+                threading.get_ident(),
+                time.perf_counter_ns(),
+            )
+
+    def end(self, name: str, category: str = "") -> None:
+        opened = self._open.pop((self.process, name, category), None)
+        if opened is not None:
+            thread, start = opened
+            self._record(name, category, start, time.perf_counter_ns(), thread)
+
+    def end_all(self, category: str) -> None:
+        """Close all open spans of `category` of the current process."""
+        process = self.process
+        for proc, name, cat in list(self._open):
+            if proc == process and cat == category:
+                self.end(name, cat)
+
+    def begin_cycle(self) -> None:
+        if self.enabled:
+            self._cycle_start.setdefault(self.process, time.perf_counter_ns())
+
+    def end_cycle(self) -> None:
+        process = self.process
+        start = self._cycle_start.pop(process, None)
+        if start is None:
+            return
+        cycle = Cycle(start, time.perf_counter_ns(), process)
+        self.cycles.append(cycle)
+        self._record("cycle", "demo", cycle.start, cycle.end)
+        log.info("Cycle finished in %.2fs", (cycle.end - cycle.start) * 1e-9)
+        for name, total in self.summary(cycle)[:5]:
+            log.info("  %-40s %8.2fs", name, total)
+
+    def summary(self, cycle: Cycle) -> list[tuple[str, float]]:
+        """Total time in s spent in each span during `cycle`, longest first.
+        Spans running in parallel on different threads are counted
+        separately, spans of other processes are not."""
+        totals: collections.defaultdict[str, float] = collections.defaultdict(float)
+        for event in self.events:
+            if event.name == "cycle" or event.process != cycle.process:
+                continue
+            if cycle.start <= event.start and event.start + event.duration <= cycle.end:
+                totals[event.name] += event.duration * 1e-9
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    def export(self, path: str | os.PathLike[str]) -> None:
+        """Write all recorded spans to a Chrome/Perfetto trace JSON file.
+        Each process of the spans is exported with its own process id."""
+        processes = sorted({event.process for event in self.events})
+        pids = {process: os.getpid() + i for i, process in enumerate(processes)}
+        trace: list[dict[str, typing.Any]] = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": process or "trinkgelage"},
+            }
+            for process, pid in pids.items()
+        ]
+        threads = sorted({(event.process, event.thread) for event in self.events})
+        trace.extend(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pids[process],
+                "tid": tid,
+                "args": {"name": self.thread_names[tid]},
+            }
+            for process, tid in threads
+            if tid in self.thread_names
+        )
+        trace.extend(
+            {
+                "name": event.name,
+                "cat": event.category,
+                "ph": "X",
+                "pid": pids[event.process],
+                "tid": event.thread,
+                "ts": event.start / 1000,
+                "dur": event.duration / 1000,
+            }
+            for event in self.events
+        )
+        cycles = [
+            {
+                "process": cycle.process,
+                "duration": (cycle.end - cycle.start) * 1e-9,
+                "spans": dict(self.summary(cycle)),
+            }
+            for cycle in self.cycles
+        ]
+        with open(path, "w", encoding="utf-8") as f:  # noqa: PTH123
+            json.dump({"traceEvents": trace, "cycles": cycles}, f)
+
+    def _record(
+        self,
+        name: str,
+        category: str,
+        start: int,
+        end: int,
+        thread: int | None = None,
+    ) -> None:
+        current = threading.get_ident()
+        if thread is None:
+            thread = current
+        if thread == current and thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.events.append(
+            Event(name, category, thread, start, end - start, self.process)
+        )
+
+
+class TracedProxy:
+    """Wraps an object such that calls to its methods are recorded
+    as spans, e.g. remote procedure calls through a server proxy."""
+
+    def __init__(
+        self, target: typing.Any, category: str, span_tracer: Tracer | None = None
+    ) -> None:
+        self._target = target
+        self._category = category
+        self._tracer = tracer if span_tracer is None else span_tracer
+
+    def __getattr__(self, name: str) -> typing.Callable[..., typing.Any]:
+        method = getattr(self._target, name)
+        span_name = f"{self._category}.{name}"
+
+        def call(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            with self._tracer.span(span_name, self._category):
+                return method(*args, **kwargs)
+
+        return call
+
+
+tracer = Tracer()
+"""Tracer shared by the whole package."""
+
+span = tracer.span
+traced = tracer.traced
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import logging
-import pathlib
 import threading
 import typing
 
@@ -10,11 +9,28 @@ import numpy.typing as npt
 import panda_py
 from panda_py import controllers, libfranka
 
+from ..monitoring import metrics, tracing
+from . import (
+    blending,
+    compression,
+    executor,
+    flight,
+    recovery,
+    timing,
+    trajectories,
+)
+
 log = logging.getLogger("actions")
 
-DATA_PATH = pathlib.Path(pathlib.Path(__file__).parent.parent) / "data"
+Trajectory = typing.Union[npt.NDArray[np.float64], compression.CompressedTrajectory]
+
+DATA_PATH = trajectories.DATA_PATH
 
+PLAYBACK_CHUNK = 1000
+"""Number of samples expanded at once when playing compressed trajectories."""
 
+
+@tracing.traced
 def two_arm_motion_from_files(
     left: panda_py.Panda,
     right: panda_py.Panda,
@@ -23,61 +39,119 @@ def two_arm_motion_from_files(
     left_speed_factor: float = 0.2,
     right_speed_factor: float = 0.2,
     max_retries: int = 3,
-) -> None:
-    t_left = threading.Thread(
-        target=motion_from_file,
-        args=(left, left_filenames),
-        kwargs={"speed_factor": left_speed_factor, "max_retries": max_retries},
-    )
-    t_right = threading.Thread(
-        target=motion_from_file,
-        args=(right, right_filenames),
-        kwargs={"speed_factor": right_speed_factor, "max_retries": max_retries},
+    left_time_scale: float = 1.0,
+    right_time_scale: float = 1.0,
+    blend: bool = False,
+) -> bool:
+    """
+    Execute the motions of both arms simultaneously on their executors,
+    see :func:`trinkgelage.robot.executor.get`. If one arm fails, the
+    other arm is stopped and `False` is returned.
+    """
+    kwargs = {"max_retries": max_retries, "blend": blend}
+    tasks = (
+        executor.get(left, "left").motion(
+            motion_from_file,
+            left_filenames,
+            speed_factor=left_speed_factor,
+            time_scale=left_time_scale,
+            **kwargs,
+        ),
+        executor.get(right, "right").motion(
+            motion_from_file,
+            right_filenames,
+            speed_factor=right_speed_factor,
+            time_scale=right_time_scale,
+            **kwargs,
+        ),
     )
-    t_left.start()
-    t_right.start()
-    for t in [t_left, t_right]:
-        t.join()
+    try:
+        executor.all_of(*tasks)
+    except executor.MotionError as e:
+        log.error(e)
+        return False
+    return True
 
 
+@tracing.traced
 def motion_from_file(
     robot: panda_py.Panda,
     filenames: str | typing.Iterable[str],
     speed_factor: float = 0.2,
     max_retries: int = 3,
+    time_scale: float = 1.0,
+    tolerance: float | None = None,
+    blend: bool = False,
+    cancel: threading.Event | None = None,
 ) -> bool:
+    """
+    Execute the joint positions and trajectories stored in `filenames`.
+    `speed_factor` applies to joint position moves, including the approach
+    to the start of each trajectory, while `time_scale` speeds up
+    (or slows down for values below 1) the playback of trajectories.
+    Trajectories stored as `.npz` files, and all trajectories if a joint
+    position `tolerance` is given, are played back from their compressed
+    representation, see :class:`trinkgelage.robot.compression.CompressedTrajectory`.
+    With `blend` set, all files are joined into one continuous trajectory
+    instead, see :func:`blended_motion_from_file`. Setting `cancel` stops
+    the motion at the next control tick and returns `False`.
+    """
     items = [filenames] if isinstance(filenames, str) else list(filenames)
+    if blend:
+        return blended_motion_from_file(
+            robot,
+            items,
+            speed_factor=speed_factor,
+            max_retries=max_retries,
+            time_scale=time_scale,
+            cancel=cancel,
+        )
 
-    queue: list[npt.NDArray[np.float64]] = []
+    queue: list[tuple[str, Trajectory]] = []
     last_shape = None
 
-    def process_queue(queue: list[npt.NDArray[np.float64]]) -> bool:
+    def process_queue(queue: list[tuple[str, Trajectory]]) -> bool:
         if not queue:
             return True
-        shape = queue[0].shape
+        shape = queue[0][1].shape
         if len(shape) == 1:
-            for q in queue:  # type: ignore[unreachable]
-                assert q.shape[0] == 7
+            positions = [np.asarray(data) for _, data in queue]
+            for position in positions:
+                assert position.shape[0] == 7
             return move_to_joint_position(
-                robot, queue, speed_factor=speed_factor, max_retries=max_retries
+                robot,
+                positions,
+                speed_factor=speed_factor,
+                max_retries=max_retries,
+                cancel=cancel,
             )
         if len(shape) == 2:
             success = True
-            for q in queue:
-                assert q.shape[1] == 14
+            for fn, data in queue:
+                assert data.shape[1] == 14
+                q: npt.NDArray[np.float64] | compression.TrajectoryColumns
+                dq: npt.NDArray[np.float64] | compression.TrajectoryColumns
+                if tolerance is None and isinstance(data, np.ndarray):
+                    q, dq = trajectories.store.load_retimed(fn, time_scale)
+                else:
+                    compressed = load_compressed(fn, tolerance).retime(time_scale)
+                    q, dq = compressed.q, compressed.dq
                 success = success and play_trajectory(
                     robot,
-                    q[:, :7],
-                    q[:, 7:],
+                    q,
+                    dq,
                     speed_factor=speed_factor,
                     max_retries=max_retries,
+                    cancel=cancel,
                 )
             return success
         raise RuntimeError()
 
     success = True
     for fn in items:
-        data = load_csv(fn)
+        if cancelled(cancel):
+            return False
+        data = load_compressed(fn) if fn.endswith(".npz") else load_csv(fn)
         if last_shape is None:
             last_shape = data.shape
         if data.shape != last_shape:
@@ -85,102 +159,220 @@ def motion_from_file(
                 success = success and process_queue(queue)
                 queue = []
             last_shape = data.shape
-        queue.append(data)
+        queue.append((fn, data))
     if queue:
         success = success and process_queue(queue)
     return success
 
 
+@tracing.traced
+def blended_motion_from_file(
+    robot: panda_py.Panda,
+    filenames: str | typing.Iterable[str],
+    speed_factor: float = 0.2,
+    max_retries: int = 3,
+    time_scale: float = 1.0,
+    cancel: threading.Event | None = None,
+) -> bool:
+    """
+    Join the joint positions and trajectories stored in `filenames` into
+    one trajectory with blends at the boundaries, see
+    :func:`trinkgelage.robot.blending.blend`, and play it back under
+    a single controller.
+    """
+    items = [filenames] if isinstance(filenames, str) else list(filenames)
+    segments: list[blending.Segment] = []
+    for fn in items:
+        data = load_csv(fn)
+        if data.ndim == 1:
+            segments.append(np.asarray(data))
+        else:
+            segments.append(trajectories.store.load_retimed(fn, time_scale))
+    q, dq = blending.blend(segments, speed_factor=speed_factor)
+    return play_trajectory(
+        robot, q, dq, speed_factor=speed_factor, max_retries=max_retries, cancel=cancel
+    )
+
+
+@tracing.traced
 def load_csv(filename: str) -> npt.NDArray[np.float64]:
-    return np.loadtxt(DATA_PATH / filename, delimiter=",")
+    return trajectories.load(filename)
+
+
+@tracing.traced
+def load_compressed(
+    filename: str, tolerance: float | None = None
+) -> compression.CompressedTrajectory:
+    if tolerance is None:
+        return trajectories.store.load_compressed(filename)
+    return trajectories.store.load_compressed(filename, tolerance)
 
 
+@tracing.traced
 def move_to_pose(
     robot: panda_py.Panda,
     poses: npt.NDArray[np.float64] | list[npt.NDArray[np.float64]],
     speed_factor: float = 0.2,
     max_retries: int = 3,
+    cancel: threading.Event | None = None,
 ) -> bool:
-    try:
-        return robot.move_to_pose(
+    if cancelled(cancel):
+        return False
+    return recovery.retry(
+        robot,
+        "move_to_pose",
+        lambda: robot.move_to_pose(
             poses,
             speed_factor=speed_factor,
             impedance=np.diag([600, 600, 600, 30, 30, 30]),
-        )
-    except RuntimeError as e:
-        log.error(e)
-        if max_retries > 0:
-            return move_to_pose(
-                robot,
-                poses,
-                speed_factor=speed_factor,
-                max_retries=max_retries - 1,
-            )
-        log.error("Maximum retries reached for move_to_joint_position")
-        return False
+        ),
+        max_retries,
+    )
 
 
+@tracing.traced
 def move_to_joint_position(
     robot: panda_py.Panda,
     joint_positions: npt.NDArray[np.float64] | list[npt.NDArray[np.float64]],
     speed_factor: float = 0.2,
     max_retries: int = 3,
+    cancel: threading.Event | None = None,
 ) -> bool:
-    try:
-        return robot.move_to_joint_position(joint_positions, speed_factor=speed_factor)
-    except RuntimeError as e:
-        log.error(e)
-        if max_retries > 0:
-            return move_to_joint_position(
-                robot,
-                joint_positions,
-                speed_factor=speed_factor,
-                max_retries=max_retries - 1,
-            )
-        log.error("Maximum retries reached for move_to_joint_position")
+    if cancelled(cancel):
         return False
+    return recovery.retry(
+        robot,
+        "move_to_joint_position",
+        lambda: robot.move_to_joint_position(
+            joint_positions, speed_factor=speed_factor
+        ),
+        max_retries,
+    )
 
 
+@tracing.traced
 def play_trajectory(
     robot: panda_py.Panda,
-    q: npt.NDArray[np.float64],
-    dq: npt.NDArray[np.float64],
+    q: npt.NDArray[np.float64] | compression.TrajectoryColumns,
+    dq: npt.NDArray[np.float64] | compression.TrajectoryColumns,
     at_index: int = 0,
     speed_factor: float = 0.05,
     max_retries: int = 3,
+    timer: timing.TickTimer | None = None,
+    cancel: threading.Event | None = None,
 ) -> bool:
+    """
+    Play back a trajectory at 1 kHz. Pass a `timer`, or set
+    :data:`trinkgelage.robot.timing.enabled`, to record the time of each
+    control tick. If the robot stops with an error, e.g. a reflex, the
+    error is cleared and playback resumes shortly before the sample it
+    was interrupted at, see :mod:`trinkgelage.robot.recovery`.
+    """
+    if timer is None and timing.enabled:
+        replays = max_retries * (recovery.policy.backoff + 1)
+        timer = timing.TickTimer(len(q) - at_index + replays + 1)
+        success = play_trajectory(
+            robot, q, dq, at_index, speed_factor, max_retries, timer, cancel
+        )
+        report = timer.report()
+        timing.reports.append(report)
+        log.info("Trajectory timing: %s", report)
+        return success
+    if cancelled(cancel):
+        return False
     i = at_index
-    robot.move_to_joint_position(q[i], speed_factor=speed_factor)
-    ctrl = controllers.JointPosition()
-    robot.start_controller(ctrl)
-    try:
-        with robot.create_context(frequency=1000, max_runtime=len(q) / 1000.0) as ctx:
-            while ctx.ok():
-                if i >= len(q):
-                    break
-                ctrl.set_control(q[i], dq[i])
-                i += 1
-        return True
-    except RuntimeError as e:
-        log.error(e)
-        if max_retries > 0:
-            return play_trajectory(
-                robot,
-                q,
-                dq,
-                at_index=i,
-                speed_factor=speed_factor,
-                max_retries=max_retries - 1,
-            )
-        log.error("Maximum retries reached for play_trajectory")
+    n = len(q)
+    if not move_to_joint_position(robot, q[i], speed_factor, max_retries, cancel):
         return False
+    # Move back onto the trajectory after an error
+    q_entry = dq_entry = np.zeros((0, 7))
+    recorder = None
+    if flight.enabled and flight.recordable(robot.get_state()):
+        recorder = flight.get(robot)
+    for attempt in range(max_retries + 1):
+        ctrl = joint_position_controller(robot)
+        robot.start_controller(ctrl)
+        try:
+            with robot.create_context(
+                frequency=1000, max_runtime=(n + len(q_entry)) / 1000.0
+            ) as ctx:
+                k = 0
+                start = i
+                # Indexing a memory-mapped chunk sample by sample is several
+                # times slower than indexing a plain array
+                q_chunk, dq_chunk = (
+                    np.asarray(q[start : start + PLAYBACK_CHUNK]),
+                    np.asarray(dq[start : start + PLAYBACK_CHUNK]),
+                )
+                while ctx.ok():
+                    if cancel is not None and cancel.is_set():
+                        log.info("Trajectory cancelled at %d/%d", i, n)
+                        return False
+                    if k < len(q_entry):
+                        ctrl.set_control(q_entry[k], dq_entry[k])
+                        if recorder is not None:
+                            recorder.record(robot.get_state(), q_entry[k], dq_entry[k])
+                        k += 1
+                        continue
+                    if i >= n:
+                        break
+                    if timer is not None:
+                        timer.tick(i)
+                    if i - start >= PLAYBACK_CHUNK:
+                        start = i
+                        q_chunk = np.asarray(q[start : start + PLAYBACK_CHUNK])
+                        dq_chunk = np.asarray(dq[start : start + PLAYBACK_CHUNK])
+                    q_d, dq_d = q_chunk[i - start], dq_chunk[i - start]
+                    ctrl.set_control(q_d, dq_d)
+                    if recorder is not None:
+                        recorder.record(robot.get_state(), q_d, dq_d, i)
+                    i += 1
+            return True
+        except RuntimeError as e:
+            log.error(e)
+            flight.dump(robot, f"play_trajectory: {e}")
+            if attempt == max_retries:
+                break
+            cost = recovery.recover(robot, "play_trajectory", e, attempt + 1)
+            q_current = np.asarray(robot.get_state().q, dtype=np.float64)
+            q_entry, dq_entry, resume = recovery.reentry(q_current, q, dq, i, at_index)
+            cost.interrupted_at, cost.resumed_at = i, resume
+            cost.reapproach_time = len(q_entry) / 1000.0
+            cost.replay_time = max(0, i - resume) / 1000.0
+            recovery.record(cost)
+            i = resume
+    log.error("Maximum retries reached for play_trajectory")
+    metrics.failures.inc(station=recovery.station_of(robot), action="play_trajectory")
+    return False
 
 
+def cancelled(cancel: threading.Event | None) -> bool:
+    return cancel is not None and cancel.is_set()
+
+
+def joint_position_controller(robot: panda_py.Panda) -> controllers.JointPosition:
+    """
+    Create a joint position controller for `robot`. Robot types other than
+    `panda_py.Panda`, e.g. :class:`trinkgelage.robot.sim.SimPanda`, provide
+    their controller type as class attribute `JointPosition`.
+    """
+    factory = getattr(type(robot), "JointPosition", None) or controllers.JointPosition
+    return factory()
+
+
+@tracing.traced
 def release(gripper: libfranka.Gripper) -> None:
     if not gripper.move(0.08, 0.05):
         raise RuntimeError()
 
 
+@tracing.traced
 def grasp(gripper: libfranka.Gripper) -> None:
     if not gripper.grasp(0, 0.05, 20, 0.08, 0.08):
         raise RuntimeError()
+
+
+@tracing.traced
+def homing(gripper: libfranka.Gripper) -> None:
+    if not gripper.homing():
+        raise RuntimeError()
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import dataclasses
+import logging
+
+import numpy as np
+import numpy.typing as npt
+
+from . import trajectories
+
+log = logging.getLogger("analysis")
+
+LIMITS = np.stack(
+    [
+        trajectories.MAX_JOINT_VELOCITY,
+        trajectories.MAX_JOINT_ACCELERATION,
+        trajectories.MAX_JOINT_JERK,
+    ]
+)
+"""Joint velocity, acceleration and jerk limits, shape (3, 7)."""
+
+DERIVATIVES = ("velocity", "acceleration", "jerk")
+
+_ORDER = np.arange(1, 4)
+
+
+def smooth(x: npt.NDArray[np.float64], window: int) -> npt.NDArray[np.float64]:
+    """Centered moving average of `x` over `window` samples along the
+    first axis, repeating the first and last sample at the ends."""
+    if window <= 1:
+        return x
+    padded = np.pad(
+        x, [(window // 2, window - 1 - window // 2)] + [(0, 0)] * (x.ndim - 1), "edge"
+    )
+    total = np.cumsum(padded, axis=0)
+    total = np.concatenate([np.zeros_like(total[:1]), total])
+    return (total[window:] - total[:-window]) / window
+
+
+def derivatives(
+    q: npt.NDArray[np.float64], frequency: float = 1000.0, window: int = 21
+) -> npt.NDArray[np.float64]:
+    """
+    Velocity, acceleration and jerk of the joint positions `q` sampled at
+    `frequency`, shape (3, len(q), 7). Each derivative is smoothed over
+    `window` samples, as the jitter of recorded positions would otherwise
+    dominate the higher derivatives.
+    """
+    profile = np.empty((3, *np.shape(q)))
+    x = np.asarray(q, dtype=np.float64)
+    for k in range(3):
+        x = smooth(np.gradient(x, 1.0 / frequency, axis=0), window)
+        profile[k] = x
+    return profile
+
+
+@dataclasses.dataclass
+class Margins:
+    """Peak derivatives of a trajectory relative to the joint limits."""
+
+    utilization: npt.NDArray[np.float64]
+    """Peak velocity, acceleration and jerk of each joint divided by its
+    limit, shape (3, 7)."""
+
+    @classmethod
+    def of(cls, profile: npt.NDArray[np.float64]) -> Margins:
+        """Margins of a profile computed by :func:`derivatives`."""
+        return cls(np.abs(profile).max(axis=1) / LIMITS)
+
+    @property
+    def peak(self) -> float:
+        return float(self.utilization.max())
+
+    @property
+    def time_scale(self) -> float:
+        """Largest time scale of :func:`trinkgelage.robot.trajectories.retime`
+        keeping all derivatives within the limits."""
+        return float(_time_scale(self.utilization.max(axis=1)))
+
+    def __str__(self) -> str:
+        peaks = self.utilization.max(axis=1)
+        return ", ".join(f"{d} {p:.0%}" for d, p in zip(DERIVATIVES, peaks))
+
+
+def time_optimal(
+    q: npt.NDArray[np.float64],
+    dq: npt.NDArray[np.float64],
+    frequency: float = 1000.0,
+    window: int = 21,
+    safety: float = 0.9,
+    span: float = 0.2,
+    max_time_scale: float = 4.0,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Retime a trajectory to move along the same path as fast as the joint
+    limits scaled by `safety` allow. The path is sped up or slowed down
+    by a time scale that varies along it, limited by the derivatives
+    within `span` seconds and at most `max_time_scale`. Returns the joint
+    positions and velocities sampled at `frequency`.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    dq = np.asarray(dq, dtype=np.float64)
+    if len(q) < 2:
+        return q, dq
+    utilization = np.abs(derivatives(q, frequency, window)) / LIMITS[:, None]
+    local = np.minimum(safety * _time_scale(utilization.max(axis=2)), max_time_scale)
+    n = max(1, round(span * frequency))
+    padded = np.pad(local, (n // 2, n - 1 - n // 2), "edge")
+    local = np.lib.stride_tricks.sliding_window_view(padded, n).min(axis=1)
+    scale = smooth(local, n)
+    for _ in range(50):
+        q_new, dq_new = warp(q, dq, scale)
+        peak = Margins.of(derivatives(q_new, frequency, window)).peak
+        if peak <= safety:
+            break
+        scale *= 0.97
+    else:
+        log.warning("Retimed trajectory exceeds %.0f%% of the limits", peak * 100)
+    return q_new, dq_new
+
+
+def warp(
+    q: npt.NDArray[np.float64],
+    dq: npt.NDArray[np.float64],
+    scale: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Resample a trajectory such that it plays back `scale[i]` times
+    faster around sample `i`, generalizing
+    :func:`trinkgelage.robot.trajectories.retime`. The first and last
+    samples are preserved."""
+    n = len(q)
+    index = np.arange(n)
+    # Time of each original sample in samples of the retimed trajectory
+    times = np.concatenate([[0.0], np.cumsum(2.0 / (scale[:-1] + scale[1:]))])
+    t = np.interp(np.append(np.arange(np.ceil(times[-1])), times[-1]), times, index)
+    i0 = np.minimum(t.astype(np.intp), n - 2)
+    w = (t - i0)[:, None]
+    q_new = q[i0] * (1 - w) + q[i0 + 1] * w
+    dq_new = (dq[i0] * (1 - w) + dq[i0 + 1] * w) * np.interp(t, index, scale)[:, None]
+    return q_new, dq_new
+
+
+@dataclasses.dataclass
+class Report:
+    """Analysis of one trajectory file."""
+
+    filename: str
+    duration: float
+    margins: Margins
+    retimed_duration: float
+    retimed_margins: Margins
+
+    @property
+    def saving(self) -> float:
+        """Time in s saved by the time-optimal retiming."""
+        return self.duration - self.retimed_duration
+
+
+def analyze(
+    filename: str,
+    store: trajectories.TrajectoryStore | None = None,
+    frequency: float = 1000.0,
+    window: int = 21,
+    safety: float = 0.9,
+) -> tuple[Report, npt.NDArray[np.float64]] | None:
+    """Analyze the trajectory in `filename` and retime it, see
+    :func:`time_optimal`. Returns the report and the retimed trajectory,
+    or `None` if the file holds a single joint position."""
+    data = (trajectories.store if store is None else store).load(filename)
+    if data.ndim != 2:
+        return None
+    q, dq = data[:, :7], data[:, 7:]
+    q_new, dq_new = time_optimal(q, dq, frequency, window, safety)
+    report = Report(
+        filename,
+        (len(q) - 1) / frequency,
+        Margins.of(derivatives(q, frequency, window)),
+        (len(q_new) - 1) / frequency,
+        Margins.of(derivatives(q_new, frequency, window)),
+    )
+    return report, np.hstack([q_new, dq_new])
+
+
+def _time_scale(utilization: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Largest time scale keeping derivatives of orders 1 to 3 with the
+    given utilization, along the first axis, within the limits."""
+    with np.errstate(divide="ignore"):
+        scales = utilization ** (
+            -1.0 / _ORDER.reshape(-1, *[1] * (utilization.ndim - 1))
+        )
+    return np.min(scales, axis=0)  # type: ignore[no-any-return]
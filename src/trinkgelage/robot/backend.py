@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import time
+
+import panda_py
+from panda_py import libfranka
+
+
+class Clock:
+    """Clock running `speed` times faster than real time."""
+
+    def __init__(self, speed: float = 1.0) -> None:
+        if speed <= 0:
+            msg = f"Clock speed must be positive, got {speed}"
+            raise ValueError(msg)
+        self.speed = speed
+        self._start = time.monotonic()
+
+    def time(self) -> float:
+        """Time in s since the clock was created."""
+        return (time.monotonic() - self._start) * self.speed
+
+    def sleep(self, duration: float) -> None:
+        if duration > 0:
+            time.sleep(duration / self.speed)
+
+    def sleep_until(self, t: float) -> None:
+        self.sleep(t - self.time())
+
+
+class Backend:
+    """Creates the robots and grippers used by the demo.
+    This backend connects to real robots using panda-py."""
+
+    def __init__(self) -> None:
+        self.clock = Clock()
+
+    def panda(
+        self, hostname: str, realtime_config: libfranka.RealtimeConfig
+    ) -> panda_py.Panda:
+        return panda_py.Panda(hostname, realtime_config=realtime_config)
+
+    def gripper(self, hostname: str) -> libfranka.Gripper:
+        return libfranka.Gripper(hostname)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+from .trajectories import MAX_JOINT_VELOCITY
+
+Segment = typing.Union[
+    npt.NDArray[np.float64],
+    typing.Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]],
+]
+"""Either a joint position waypoint or joint positions and velocities
+of a trajectory."""
+
+
+def duration(
+    q0: npt.NDArray[np.float64],
+    q1: npt.NDArray[np.float64],
+    speed_factor: float = 0.2,
+    min_duration: float = 0.1,
+) -> float:
+    """
+    Duration of a rest-to-rest quintic move from `q0` to `q1` whose peak
+    joint velocities stay below `speed_factor` times the velocity limits.
+    """
+    peak = 1.875 * np.abs(np.asarray(q1) - np.asarray(q0))
+    return max(min_duration, float(np.max(peak / (MAX_JOINT_VELOCITY * speed_factor))))
+
+
+def quintic(
+    q0: npt.NDArray[np.float64],
+    q1: npt.NDArray[np.float64],
+    dq0: npt.NDArray[np.float64],
+    dq1: npt.NDArray[np.float64],
+    move_duration: float,
+    frequency: float = 1000.0,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Sample a quintic polynomial from (`q0`, `dq0`) to (`q1`, `dq1`) with zero
+    boundary accelerations. The samples exclude the start and include the
+    end of the move.
+    """
+    tf = max(move_duration, 1.0 / frequency)
+    n = max(1, round(tf * frequency))
+    t = (np.arange(1, n + 1) * (tf / n))[:, None]
+    d = np.asarray(q1) - np.asarray(q0)
+    a3 = (20 * d - (8 * dq1 + 12 * dq0) * tf) / (2 * tf**3)
+    a4 = (-30 * d + (14 * dq1 + 16 * dq0) * tf) / (2 * tf**4)
+    a5 = (12 * d - 6 * (dq1 + dq0) * tf) / (2 * tf**5)
+    q = q0 + dq0 * t + a3 * t**3 + a4 * t**4 + a5 * t**5
+    dq = dq0 + 3 * a3 * t**2 + 4 * a4 * t**3 + 5 * a5 * t**4
+    return q, dq
+
+
+def blend(
+    segments: typing.Sequence[Segment],
+    speed_factor: float = 0.2,
+    min_duration: float = 0.1,
+    tolerance: float = 1e-4,
+    frequency: float = 1000.0,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Join waypoints and trajectories into one continuous trajectory.
+
+    Consecutive segments are connected with quintic moves that match
+    position and velocity on both ends, unless a trajectory already starts
+    within `tolerance` of where the previous segment ends. The robot passes
+    through intermediate waypoints without stopping, using the common
+    heuristic of averaging the adjacent segment velocities of each joint
+    (or zero if the joint reverses direction). Only the last waypoint,
+    if any, is reached at rest. Moves are stretched until their joint
+    velocities stay within `speed_factor` times the limits, or within the
+    velocities they start or end with if these are higher.
+    """
+    starts = [_start(s) for s in segments]
+    q_parts: list[npt.NDArray[np.float64]] = []
+    dq_parts: list[npt.NDArray[np.float64]] = []
+    for k, segment in enumerate(segments):
+        if isinstance(segment, tuple) or segment.ndim == 2:
+            q, dq = _split(segment)
+            if q_parts and not (
+                np.allclose(q_parts[-1][-1], q[0], rtol=0, atol=tolerance)
+                and np.allclose(
+                    dq_parts[-1][-1], dq[0], rtol=0, atol=tolerance * frequency
+                )
+            ):
+                q_blend, dq_blend = _move(
+                    q_parts[-1][-1],
+                    q[0],
+                    dq_parts[-1][-1],
+                    dq[0],
+                    duration(q_parts[-1][-1], q[0], speed_factor, min_duration),
+                    speed_factor,
+                    frequency,
+                )
+                q_parts.append(q_blend[:-1])
+                dq_parts.append(dq_blend[:-1])
+            q_parts.append(np.asarray(q))
+            dq_parts.append(np.asarray(dq))
+            continue
+        waypoint = np.asarray(segment, dtype=np.float64)
+        if not q_parts:
+            q_parts.append(waypoint[None])
+            dq_parts.append(np.zeros((1, len(waypoint))))
+            continue
+        q0, dq0 = q_parts[-1][-1], dq_parts[-1][-1]
+        tf = duration(q0, waypoint, speed_factor, min_duration)
+        velocity = np.zeros(len(waypoint))
+        if k + 1 < len(segments):
+            after = starts[k + 1]
+            v_in = (waypoint - q0) / tf
+            v_out = (after - waypoint) / duration(
+                waypoint, after, speed_factor, min_duration
+            )
+            velocity = np.where(np.sign(v_in) == np.sign(v_out), (v_in + v_out) / 2, 0)
+        q_blend, dq_blend = _move(
+            q0, waypoint, dq0, velocity, tf, speed_factor, frequency
+        )
+        q_parts.append(q_blend)
+        dq_parts.append(dq_blend)
+    if not q_parts:
+        msg = "Cannot blend an empty list of segments"
+        raise ValueError(msg)
+    return np.concatenate(q_parts), np.concatenate(dq_parts)
+
+
+def _move(
+    q0: npt.NDArray[np.float64],
+    q1: npt.NDArray[np.float64],
+    dq0: npt.NDArray[np.float64],
+    dq1: npt.NDArray[np.float64],
+    move_duration: float,
+    speed_factor: float,
+    frequency: float,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    # The rest-to-rest duration can be too short if the move starts or
+    # ends in motion, so stretch it until the velocities stay within the
+    # scaled limits, or the boundary velocities if these are higher.
+    boundary = np.maximum(np.abs(dq0), np.abs(dq1)) / MAX_JOINT_VELOCITY
+    limit = MAX_JOINT_VELOCITY * max(speed_factor, float(np.max(boundary)))
+    tf = move_duration
+    for _ in range(100):
+        q, dq = quintic(q0, q1, dq0, dq1, tf, frequency)
+        if np.all(np.abs(dq) <= limit * 1.001):
+            break
+        tf *= 1.1
+    return q, dq
+
+
+def _split(
+    segment: Segment,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    if isinstance(segment, tuple):
+        return segment
+    return segment[:, :7], segment[:, 7:]
+
+
+def _start(segment: Segment) -> npt.NDArray[np.float64]:
+    if isinstance(segment, tuple) or segment.ndim == 2:
+        return np.asarray(_split(segment)[0][0])
+    return np.asarray(segment)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import os
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+POSITION_TOLERANCE = 1e-4
+"""Default maximum joint position error in rad."""
+VELOCITY_TOLERANCE = 1e-2
+"""Default maximum joint velocity error in rad/s."""
+
+
+class CompressedTrajectory:
+    """Piecewise linear approximation of a trajectory.
+
+    Only the knots of the approximation are stored, in single precision.
+    Samples are reconstructed on demand, see :meth:`expand`."""
+
+    def __init__(
+        self, times: npt.NDArray[np.float64], values: npt.NDArray[np.float32]
+    ) -> None:
+        self.times = np.asarray(times, dtype=np.float64)
+        """Sample time of each knot in units of the control period."""
+        self.values = np.asarray(values, dtype=np.float32)
+        """Joint positions and velocities at the knots."""
+        self.q = TrajectoryColumns(self, slice(0, 7))
+        """Lazily expanded joint positions."""
+        self.dq = TrajectoryColumns(self, slice(7, 14))
+        """Lazily expanded joint velocities."""
+        self._chunk: tuple[int, int, npt.NDArray[np.float64]] | None = None
+
+    @classmethod
+    def compress(
+        cls,
+        trajectory: npt.NDArray[np.float64],
+        tolerance: float = POSITION_TOLERANCE,
+        velocity_tolerance: float = VELOCITY_TOLERANCE,
+    ) -> CompressedTrajectory:
+        """
+        Compress a trajectory with joint positions and velocities in its
+        columns. Knots are chosen greedily such that the reconstruction
+        error stays below `tolerance` for positions and
+        `velocity_tolerance` for velocities.
+        """
+        trajectory = np.asarray(trajectory, dtype=np.float64)
+        n = len(trajectory)
+        half = trajectory.shape[1] // 2
+        scale = np.empty(trajectory.shape[1])
+        scale[:half] = 1.0 / tolerance
+        scale[half:] = 1.0 / velocity_tolerance
+        rounded = trajectory.astype(np.float32).astype(np.float64)
+
+        def fits(a: int, b: int) -> bool:
+            w = np.linspace(0, 1, b - a + 1)[:, None]
+            approx = rounded[a] * (1 - w) + rounded[b] * w
+            return bool(np.max(np.abs(approx - trajectory[a : b + 1]) * scale) <= 1)
+
+        knots = [0]
+        a = 0
+        while a < n - 1:
+            good, step = a + 1, 1
+            bad = None
+            while good < n - 1:
+                candidate = min(good + step, n - 1)
+                if not fits(a, candidate):
+                    bad = candidate
+                    break
+                good, step = candidate, step * 2
+            while bad is not None and bad - good > 1:
+                mid = (good + bad) // 2
+                if fits(a, mid):
+                    good = mid
+                else:
+                    bad = mid
+            knots.append(good)
+            a = good
+        index = np.array(knots)
+        return cls(index.astype(np.float64), trajectory[index].astype(np.float32))
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> CompressedTrajectory:
+        with np.load(path) as data:
+            return cls(data["times"], data["values"])
+
+    def save(self, file: str | os.PathLike[str] | typing.BinaryIO) -> None:
+        """Save to a `.npz` file that can be played back by
+        :func:`trinkgelage.robot.actions.motion_from_file`."""
+        np.savez_compressed(file, times=self.times, values=self.values)
+
+    def __len__(self) -> int:
+        return int(np.ceil(self.times[-1] - 1e-9)) + 1
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self), self.values.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.values.nbytes
+
+    def expand(
+        self, start: int = 0, stop: int | None = None
+    ) -> npt.NDArray[np.float64]:
+        """Reconstruct the samples in the range [`start`, `stop`)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if self._chunk is not None and self._chunk[:2] == (start, stop):
+            return self._chunk[2]
+        t = np.minimum(np.arange(start, stop, dtype=np.float64), self.times[-1])
+        if len(self.times) == 1:
+            samples = np.repeat(self.values.astype(np.float64), len(t), axis=0)
+        else:
+            i = np.searchsorted(self.times, t, side="right") - 1
+            i = np.clip(i, 0, len(self.times) - 2)
+            w = ((t - self.times[i]) / (self.times[i + 1] - self.times[i]))[:, None]
+            samples = self.values[i] * (1 - w) + self.values[i + 1] * w
+        samples.setflags(write=False)
+        self._chunk = (start, stop, samples)
+        return samples
+
+    def retime(self, time_scale: float) -> CompressedTrajectory:
+        """
+        Return a copy that plays back `time_scale` times faster,
+        see :func:`trinkgelage.robot.trajectories.retime`.
+        """
+        if time_scale <= 0:
+            msg = f"time_scale must be positive, got {time_scale}"
+            raise ValueError(msg)
+        if time_scale == 1.0:
+            return self
+        values = self.values.copy()
+        values[:, self.values.shape[1] // 2 :] *= time_scale
+        return CompressedTrajectory(self.times / time_scale, values)
+
+    def max_error(self, trajectory: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """Maximum absolute reconstruction error of each column."""
+        return np.max(np.abs(self.expand() - trajectory), axis=0)  # type: ignore[no-any-return]
+
+
+class TrajectoryColumns:
+    """Read-only view on a subset of columns of a compressed trajectory.
+    Supports `len` as well as integer and slice indexing."""
+
+    def __init__(self, trajectory: CompressedTrajectory, columns: slice) -> None:
+        self.trajectory = trajectory
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.trajectory)
+
+    def __getitem__(self, index: int | slice) -> npt.NDArray[np.float64]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self.trajectory.expand(start, stop)[::step, self.columns]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            msg = "trajectory index out of range"
+            raise IndexError(msg)
+        return self.trajectory.expand(index, index + 1)[0, self.columns]
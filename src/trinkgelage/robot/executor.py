@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import queue
+import threading
+import typing
+
+import panda_py
+from panda_py import libfranka
+
+log = logging.getLogger("executor")
+
+_executors: dict[tuple[int, str], ArmExecutor] = {}
+_lock = threading.Lock()
+
+
+class MotionError(RuntimeError):
+    """An arm failed to execute a motion, even after retries."""
+
+
+class Task(concurrent.futures.Future):  # type: ignore[type-arg]
+    """Future of work submitted to an :class:`ArmExecutor`."""
+
+    def __init__(self, arm: str) -> None:
+        super().__init__()
+        self.arm = arm
+        self.cancel_event = threading.Event()
+        """Set to stop the task if it is already running."""
+
+    def abort(self) -> None:
+        """Cancel the task if it has not started yet, stop it at the next
+        opportunity otherwise."""
+        self.cancel_event.set()
+        self.cancel()
+
+
+class ArmExecutor:
+    """Runs the work of one arm in order on a persistent worker thread
+    named after the arm."""
+
+    def __init__(
+        self,
+        robot: panda_py.Panda,
+        name: str = "arm",
+        gripper: libfranka.Gripper | None = None,
+    ) -> None:
+        self.robot = robot
+        self.name = name
+        self.gripper = gripper
+        self._queue: queue.SimpleQueue[tuple[Task, typing.Callable[[], object]] | None]
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        func: typing.Callable[..., typing.Any],
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> Task:
+        """Run `func(*args, **kwargs)` after the previously submitted work."""
+        task = Task(self.name)
+        self._queue.put((task, lambda: func(*args, **kwargs)))
+        return task
+
+    def motion(
+        self,
+        func: typing.Callable[..., bool],
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> Task:
+        """
+        Run the motion `func(robot, *args, cancel=..., **kwargs)`, e.g.
+        :func:`trinkgelage.robot.actions.motion_from_file`. The motion
+        stops when its task is aborted. The task raises
+        :class:`MotionError` if the motion returns `False`.
+        """
+        task = Task(self.name)
+
+        def run() -> None:
+            if not func(self.robot, *args, cancel=task.cancel_event, **kwargs):
+                if task.cancel_event.is_set():
+                    raise concurrent.futures.CancelledError
+                msg = f"{self.name} arm failed to execute {func.__name__}"
+                raise MotionError(msg)
+
+        self._queue.put((task, run))
+        return task
+
+    def gripper_command(
+        self,
+        func: typing.Callable[..., typing.Any],
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> Task:
+        """Run `func(gripper, *args, **kwargs)`, e.g.
+        :func:`trinkgelage.robot.actions.grasp`."""
+        gripper = self.gripper
+        if gripper is None:
+            msg = f"{self.name} arm has no gripper"
+            raise RuntimeError(msg)
+        return self.submit(func, gripper, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker thread once the submitted work is done."""
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            task, func = item
+            if not task.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func()
+            except BaseException as e:  # noqa: BLE001  # pylint: disable=broad-exception-caught
+                task.set_exception(e)
+            else:
+                task.set_result(result)
+
+
+def get(
+    robot: panda_py.Panda,
+    name: str = "arm",
+    gripper: libfranka.Gripper | None = None,
+) -> ArmExecutor:
+    """Executor of the arm `name` of `robot`, created on first use."""
+    with _lock:
+        arm = _executors.get((id(robot), name))
+        if arm is None:
+            arm = _executors[id(robot), name] = ArmExecutor(robot, name, gripper)
+        elif gripper is not None:
+            arm.gripper = gripper
+        return arm
+
+
+def release(robot: panda_py.Panda) -> None:
+    """Shut down the executors of `robot` once their submitted work is
+    done. :func:`get` creates new ones if the robot is used again."""
+    with _lock:
+        keys = [k for k in _executors if k[0] == id(robot)]
+        arms = [_executors.pop(k) for k in keys]
+    for arm in arms:
+        arm.shutdown()
+
+
+def all_of(
+    *tasks: concurrent.futures.Future[typing.Any],
+    cancel_on_failure: bool = True,
+    timeout: float | None = None,
+) -> list[typing.Any]:
+    """
+    Wait for all `tasks` and return their results. As soon as one task
+    fails, the others are aborted if `cancel_on_failure` is set, and the
+    exception of the failed task is raised once they stopped.
+    """
+    done, pending = concurrent.futures.wait(
+        tasks, timeout, concurrent.futures.FIRST_EXCEPTION
+    )
+    failed = [t for t in tasks if t in done and not t.cancelled() and t.exception()]
+    if not failed:
+        if pending:
+            msg = f"{len(pending)} tasks did not finish within {timeout}s"
+            raise TimeoutError(msg)
+        return [t.result() for t in tasks]
+    if cancel_on_failure:
+        for task in pending:
+            if isinstance(task, Task):
+                log.warning("Aborting work of %s arm", task.arm)
+                task.abort()
+            else:
+                task.cancel()
+    concurrent.futures.wait(pending, timeout)
+    raise typing.cast(BaseException, failed[0].exception())
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import os
+import pathlib
+import struct
+import threading
+import time
+import typing
+import weakref
+
+import numpy as np
+import numpy.typing as npt
+import panda_py
+
+from . import trajectories
+
+log = logging.getLogger("flight")
+
+enabled = True  # pylint: disable=invalid-name
+"""Record the state of the robots while playing trajectories."""
+
+COLUMNS = {
+    "time": slice(0, 1),
+    "tick": slice(1, 2),
+    "index": slice(2, 3),
+    "q": slice(3, 10),
+    "dq": slice(10, 17),
+    "q_d": slice(17, 24),
+    "dq_d": slice(24, 31),
+    "wrench": slice(31, 37),
+}
+"""Columns of a record, the time in s, the running number of the record,
+the trajectory sample, the measured and commanded joint positions and
+velocities and the estimated external wrench."""
+
+WIDTH = 37
+
+_RECORD = struct.Struct(f"{WIDTH}d")
+
+_recorders: weakref.WeakKeyDictionary[panda_py.Panda, FlightRecorder] = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def get_flight_path() -> pathlib.Path:
+    return trajectories.get_cache_path() / "flight"
+
+
+class FlightRecorder:
+    """
+    Keeps the last `seconds` of the state of one arm in a ring buffer
+    memory-mapped to `<name>.ring` in `path`, such that it survives
+    a crash of the process. A recorder of the same name and capacity
+    reopens the ring and continues after its last record, a ring of
+    another capacity is dumped before it is replaced. :meth:`dump` writes
+    the buffer's contents to a separate file for diagnosis, see :func:`load`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        seconds: float = 10.0,
+        frequency: float = 1000.0,
+        path: str | os.PathLike[str] | None = None,
+        keep: int = 20,
+    ) -> None:
+        self.name = name
+        self.path = get_flight_path() if path is None else pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.capacity = max(1, round(seconds * frequency))
+        self.keep = keep
+        """Number of dumps kept per arm, older dumps are deleted."""
+        ring = self.path / f"{name}.ring"
+        size = ring.stat().st_size if ring.exists() else 0
+        if size == self.capacity * _RECORD.size:
+            self.buffer = np.memmap(
+                ring, dtype=np.float64, mode="r+", shape=(self.capacity, WIDTH)
+            )
+        else:
+            # Keep the records of a ring of another capacity
+            previous = np.fromfile(ring, dtype=np.float64) if size else np.zeros(0)
+            records = _ordered(previous[: size // _RECORD.size * WIDTH])
+            if len(records):
+                self._save(records, f"previous ring of {name}")
+            self.buffer = np.memmap(
+                ring, dtype=np.float64, mode="w+", shape=(self.capacity, WIDTH)
+            )
+            self.buffer[:, COLUMNS["tick"]] = -1
+        # Indexing a plain array is several times faster than a memmap
+        self._rows = self.buffer.view(np.ndarray)
+        self._bytes = self._rows.data.cast("B")
+        # The running number of the last record is the write position
+        self.ticks = int(self._rows[:, COLUMNS["tick"]].max()) + 1
+
+    def record(
+        self,
+        state: typing.Any,
+        q_d: npt.NDArray[np.float64],
+        dq_d: npt.NDArray[np.float64],
+        index: int = -1,
+    ) -> None:
+        """Record the robot `state` and the commanded joint positions
+        `q_d` and velocities `dq_d` of trajectory sample `index`."""
+        # Packing the record into the buffer at once takes half the time
+        # of assigning it to a row, which converts every value in numpy
+        _RECORD.pack_into(
+            self._bytes,
+            self.ticks % self.capacity * _RECORD.size,
+            time.perf_counter(),
+            self.ticks,
+            index,
+            *state.q,
+            *state.dq,
+            *q_d.tolist(),
+            *dq_d.tolist(),
+            *state.O_F_ext_hat_K,
+        )
+        self.ticks += 1
+
+    def snapshot(self) -> npt.NDArray[np.float64]:
+        """The records in the buffer, oldest first."""
+        return _ordered(self._rows)
+
+    def dump(self, reason: str) -> pathlib.Path | None:
+        """Write the records in the buffer to a new file and return its path."""
+        if not self.ticks:
+            return None
+        return self._save(self.snapshot(), reason)
+
+    def _save(
+        self, records: npt.NDArray[np.float64], reason: str
+    ) -> pathlib.Path | None:
+        stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = self.path / f"{self.name}-{stamp}.npz"
+        try:
+            np.savez(path, records=records, reason=np.array(reason))
+        except OSError as e:
+            log.warning("Unable to dump flight recorder of %s: %s", self.name, e)
+            return None
+        dumps = sorted(self.path.glob(f"{self.name}-*.npz"))
+        for stale in dumps[: -self.keep] if self.keep > 0 else dumps:
+            stale.unlink(missing_ok=True)
+        log.info("Dumped flight recorder of %s to %s", self.name, path)
+        return path
+
+
+def _ordered(buffer: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """The records in the ring `buffer`, oldest first."""
+    rows = buffer.reshape(-1, WIDTH)
+    ticks = rows[:, COLUMNS["tick"].start]
+    return rows[ticks >= 0][np.argsort(ticks[ticks >= 0])]
+
+
+def recordable(state: typing.Any) -> bool:
+    """Whether `state` holds the joint and wrench readings of a record."""
+    try:
+        return len(state.q) == len(state.dq) == 7 and len(state.O_F_ext_hat_K) == 6
+    except (AttributeError, TypeError):
+        return False
+
+
+def get(robot: panda_py.Panda, name: str | None = None) -> FlightRecorder:
+    """Flight recorder of `robot`, created on first use. The recorder is
+    released with the robot, such that a later robot of the same `name`
+    reopens its ring."""
+    with _lock:
+        recorder = _recorders.get(robot)
+        if recorder is None:
+            if name is None:
+                name = str(getattr(robot, "hostname", f"robot-{id(robot):x}"))
+            names = {r.name for r in _recorders.values()}
+            unique, k = name, 1
+            while unique in names:
+                k += 1
+                unique = f"{name}-{k}"
+            recorder = _recorders[robot] = FlightRecorder(unique)
+        return recorder
+
+
+def dump(robot: panda_py.Panda, reason: str) -> None:
+    """Dump the flight recorder of `robot`, if enabled and it recorded."""
+    recorder = _recorders.get(robot)
+    if enabled and recorder is not None:
+        recorder.dump(reason)
+
+
+def load(path: str | os.PathLike[str]) -> dict[str, npt.NDArray[np.float64]]:
+    """Load a dump as a dictionary of the columns in :data:`COLUMNS`."""
+    with np.load(path) as data:
+        records = np.asarray(data["records"], dtype=np.float64)
+        columns = {name: records[:, s] for name, s in COLUMNS.items()}
+        for name in ("time", "tick", "index"):
+            columns[name] = columns[name][:, 0]
+        columns["reason"] = data["reason"]
+        return columns
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import pathlib
+import queue
+import struct
+import threading
+import typing
+
+import numpy as np
+import panda_py
+
+log = logging.getLogger("recorder")
+
+HEADER_SIZE = 128
+"""Size in bytes of the `.npy` header reserved at the start of each file."""
+
+
+class Recorder:
+    """
+    Records the joint positions and velocities of `robots` at `frequency`
+    to `.npy` files at `paths`, one row of `q` and `dq` per control tick,
+    the layout played back by :func:`trinkgelage.robot.actions.motion_from_file`.
+
+    All robots are sampled on the same tick of the first robot's control
+    loop, such that the rows of the files are aligned in time. Samples are
+    written to preallocated chunks of `chunk_size` rows, which a background
+    thread flushes to the files while the next chunk is filled.
+    """
+
+    def __init__(
+        self,
+        robots: typing.Sequence[panda_py.Panda],
+        paths: typing.Sequence[str | os.PathLike[str]],
+        chunk_size: int = 1000,
+        chunks: int = 4,
+        frequency: float = 1000.0,
+    ) -> None:
+        if len(robots) != len(paths) or not robots:
+            msg = "Expected one path per robot"
+            raise ValueError(msg)
+        self.robots = list(robots)
+        self.paths = [pathlib.Path(p) for p in paths]
+        self.frequency = frequency
+        self.samples = 0
+        """Number of samples recorded per robot."""
+        self.stalls = 0
+        """Number of times sampling waited for a chunk to be flushed."""
+        self._buffers = np.zeros((chunks, len(robots), chunk_size, 14))
+        self._free: queue.SimpleQueue[int] = queue.SimpleQueue()
+        for chunk in range(chunks):
+            self._free.put(chunk)
+        self._full: queue.SimpleQueue[tuple[int, int] | None] = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._started = threading.Event()
+        self._error: BaseException | None = None
+        self._sampler = threading.Thread(target=self._sample, name="recorder")
+        self._writer = threading.Thread(target=self._write, name="recorder-writer")
+
+    def __enter__(self) -> Recorder:  # noqa: PYI034
+        self.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        for path in self.paths:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer.start()
+        self._sampler.start()
+        self._started.wait()
+
+    def stop(self) -> int:
+        """Stop recording, finish the files and return the number of samples."""
+        self._stop.set()
+        self._sampler.join()
+        self._writer.join()
+        if self._error is not None:
+            raise self._error
+        log.info(
+            "Recorded %d samples (%.1fs) to %s",
+            self.samples,
+            self.samples / self.frequency,
+            ", ".join(str(p) for p in self.paths),
+        )
+        return self.samples
+
+    def _sample(self) -> None:
+        buffers = self._buffers
+        chunk_size = buffers.shape[2]
+        chunk = self._free.get()
+        k = 0
+        try:
+            with self.robots[0].create_context(frequency=self.frequency) as ctx:
+                self._started.set()
+                while ctx.ok() and not self._stop.is_set():
+                    rows = buffers[chunk, :, k]
+                    for r, robot in enumerate(self.robots):
+                        state = robot.get_state()
+                        rows[r, :7] = state.q
+                        rows[r, 7:] = state.dq
+                    k += 1
+                    if k == chunk_size:
+                        self._full.put((chunk, k))
+                        self.samples += k
+                        k = 0
+                        try:
+                            chunk = self._free.get_nowait()
+                        except queue.Empty:
+                            self.stalls += 1
+                            log.warning("Recorder waiting for chunk to be written")
+                            chunk = self._free.get()
+        except RuntimeError as e:
+            self._error = e
+        finally:
+            self._started.set()
+            if k:
+                self._full.put((chunk, k))
+                self.samples += k
+            self._full.put(None)
+
+    def _write(self) -> None:
+        tmp = [p.with_name(p.name + ".tmp") for p in self.paths]
+        rows = 0
+        flushed = False
+        try:
+            with contextlib.ExitStack() as stack:
+                files = [stack.enter_context(t.open("wb")) for t in tmp]
+                for f in files:
+                    f.write(_header(0))
+                while (item := self._full.get()) is not None:
+                    chunk, n = item
+                    for r, f in enumerate(files):
+                        f.write(self._buffers[chunk, r, :n].data)
+                    rows += n
+                    self._free.put(chunk)
+                flushed = True
+                for f in files:
+                    f.seek(0)
+                    f.write(_header(rows))
+        except OSError as e:
+            self._error = e
+            self._stop.set()
+            # Release the sampler until it stops
+            while not flushed and (item := self._full.get()) is not None:
+                self._free.put(item[0])
+            for t in tmp:
+                t.unlink(missing_ok=True)
+            return
+        for t, path in zip(tmp, self.paths):
+            t.replace(path)
+
+
+def _header(rows: int) -> bytes:
+    """`.npy` header of `rows` samples padded to :data:`HEADER_SIZE`."""
+    header = repr({"descr": "<f8", "fortran_order": False, "shape": (rows, 14)})
+    header = header.ljust(HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import logging
+import time
+import typing
+import weakref
+
+import numpy as np
+import numpy.typing as npt
+import panda_py
+
+from ..monitoring import metrics
+from . import blending, compression, trajectories
+
+log = logging.getLogger("recovery")
+
+
+@dataclasses.dataclass
+class RecoveryPolicy:
+    """How :mod:`trinkgelage.robot.actions` recover from errors of the
+    robot, e.g. a reflex, before retrying a motion."""
+
+    backoff: int = 100
+    """Number of samples a trajectory is resumed before the sample it
+    was interrupted at."""
+    speed_factor: float = 0.5
+    """Speed factor of the move back onto the trajectory."""
+    min_duration: float = 0.05
+    """Minimum duration in s of the move back onto the trajectory."""
+    frequency: float = 1000.0
+
+
+policy = RecoveryPolicy()
+"""Policy used by :mod:`trinkgelage.robot.actions`."""
+
+_stations: weakref.WeakKeyDictionary[panda_py.Panda, str] = weakref.WeakKeyDictionary()
+
+
+def assign_station(robot: panda_py.Panda, station: str) -> None:
+    """Label the retries and failures of `robot` in
+    :mod:`trinkgelage.monitoring.metrics` with `station`."""
+    _stations[robot] = station
+
+
+def station_of(robot: panda_py.Panda) -> str:
+    """Station `robot` is assigned to, empty if none."""
+    return _stations.get(robot, "")
+
+
+@dataclasses.dataclass
+class Recovery:
+    """Cost of recovering from one error."""
+
+    action: str
+    error: str
+    attempt: int
+    recover_time: float
+    """Time in s spent clearing the error of the robot."""
+    reapproach_time: float = 0.0
+    """Duration in s of the move back onto the trajectory."""
+    replay_time: float = 0.0
+    """Duration in s of the samples played again after backing off."""
+    interrupted_at: int | None = None
+    """Trajectory sample the error occurred at."""
+    resumed_at: int | None = None
+    """Trajectory sample the playback resumed at."""
+
+    @property
+    def cost(self) -> float:
+        """Time in s added to the motion by the error."""
+        return self.recover_time + self.reapproach_time + self.replay_time
+
+    def __str__(self) -> str:
+        text = f"{self.action} after {self.error!r} (attempt {self.attempt})"
+        if self.interrupted_at is not None:
+            text += f", interrupted at sample {self.interrupted_at}"
+            text += f" and resumed at {self.resumed_at}"
+        return (
+            f"{text}: recover {self.recover_time:.3f}s,"
+            f" re-approach {self.reapproach_time:.3f}s,"
+            f" replay {self.replay_time:.3f}s, cost {self.cost:.3f}s"
+        )
+
+
+history: collections.deque[Recovery] = collections.deque(maxlen=100)
+"""The most recent recoveries."""
+
+
+def recover(
+    robot: panda_py.Panda, action: str, error: Exception, attempt: int
+) -> Recovery:
+    """Clear the error of `robot` after `action` failed with `error`."""
+    metrics.retries.inc(station=station_of(robot), action=action)
+    start = time.perf_counter()
+    try:
+        robot.recover()
+    except RuntimeError as e:
+        log.error("Error recovery failed: %s", e)
+    return Recovery(action, str(error), attempt, time.perf_counter() - start)
+
+
+def reentry(
+    q_current: npt.NDArray[np.float64],
+    q: npt.NDArray[np.float64] | compression.TrajectoryColumns,
+    dq: npt.NDArray[np.float64] | compression.TrajectoryColumns,
+    index: int,
+    start: int = 0,
+    recovery_policy: RecoveryPolicy | None = None,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], int]:
+    """
+    Move from rest at `q_current` back onto the trajectory (`q`, `dq`)
+    interrupted at sample `index`, backing off by the policy's number of
+    samples but not before `start`. The move is the shortest quintic
+    whose velocities stay within the scaled limits and whose
+    accelerations stay within the limits, and ends at the position and
+    velocity of the trajectory. Returns the samples of the move and the
+    sample of the trajectory to continue at.
+    """
+    p = policy if recovery_policy is None else recovery_policy
+    target = min(max(start, index - p.backoff), len(q) - 1)
+    q1 = np.asarray(q[target], dtype=np.float64)
+    dq1 = np.asarray(dq[target], dtype=np.float64)
+    zero = np.zeros_like(q1)
+    limit = trajectories.MAX_JOINT_VELOCITY * max(
+        p.speed_factor, float(np.max(np.abs(dq1) / trajectories.MAX_JOINT_VELOCITY))
+    )
+    # Durations at which the peak velocity, acceleration and jerk of a
+    # rest-to-rest quintic over the distance reach the limits
+    distance = np.abs(q1 - np.asarray(q_current, dtype=np.float64))
+    tf = max(
+        p.min_duration,
+        float(np.max(1.875 * distance / limit)),
+        float(np.max(np.sqrt(5.77 * distance / trajectories.MAX_JOINT_ACCELERATION))),
+        float(np.max(np.cbrt(60 * distance / trajectories.MAX_JOINT_JERK))),
+    )
+    # The velocity at the end of the move may need a longer one
+    for _ in range(100):
+        q_move, dq_move = blending.quintic(q_current, q1, zero, dq1, tf, p.frequency)
+        ddq_move = np.diff(dq_move, axis=0, prepend=zero[None]) * p.frequency
+        if np.all(np.abs(dq_move) <= limit * 1.001) and np.all(
+            np.abs(ddq_move) <= trajectories.MAX_JOINT_ACCELERATION * 1.001
+        ):
+            break
+        tf *= 1.1
+    return q_move, dq_move, target + 1
+
+
+def record(recovery: Recovery) -> None:
+    history.append(recovery)
+    log.warning("Recovered %s", recovery)
+
+
+def retry(
+    robot: panda_py.Panda,
+    action: str,
+    motion: typing.Callable[[], bool],
+    max_retries: int,
+) -> bool:
+    """Run `motion`, recovering from errors and retrying up to
+    `max_retries` times."""
+    for attempt in range(max_retries + 1):
+        try:
+            return motion()
+        except RuntimeError as e:
+            log.error(e)
+            if attempt == max_retries:
+                break
+            record(recover(robot, action, e, attempt + 1))
+    log.error("Maximum retries reached for %s", action)
+    metrics.failures.inc(station=station_of(robot), action=action)
+    return False
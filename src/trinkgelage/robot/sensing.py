@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import logging
+import threading
+
+import numpy as np
+import numpy.typing as npt
+import panda_py
+
+from .backend import Clock
+
+log = logging.getLogger("sensing")
+
+
+class RingBuffer:
+    """Fixed-size buffer of timestamped samples, overwriting the oldest
+    sample when full. Appending never allocates."""
+
+    def __init__(self, capacity: int, width: int) -> None:
+        self.capacity = capacity
+        self._times = np.zeros(capacity)
+        self._values = np.zeros((capacity, width))
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, t: float, value: npt.ArrayLike) -> None:
+        with self._lock:
+            self._times[self._head] = t
+            self._values[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._head = 0
+            self._count = 0
+
+    def last(
+        self, n: int | None = None
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """Copy of the times and values of the last `n` samples, oldest first."""
+        with self._lock:
+            n = self._count if n is None else min(n, self._count)
+            index = np.arange(self._head - n, self._head) % self.capacity
+            return self._times[index], self._values[index]
+
+    def since(
+        self, t: float
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """Copy of the times and values of the samples recorded at or after `t`."""
+        times, values = self.last()
+        start = np.searchsorted(times, t)
+        return times[start:], values[start:]
+
+
+class ForceSampler:
+    """Samples the estimated external wrench `O_F_ext_hat_K` of a robot
+    at `rate` Hz in a background thread.
+
+    Queries are computed over the samples of the most recent `duration`
+    seconds. If there are none, e.g. because the sampler is not running,
+    the wrench is read once instead."""
+
+    def __init__(
+        self,
+        robot: panda_py.Panda,
+        clock: Clock | None = None,
+        rate: float = 250.0,
+        capacity: int = 1024,
+        name: str = "sampler",
+    ) -> None:
+        self.robot = robot
+        self.clock = Clock() if clock is None else clock
+        self.rate = rate
+        self.name = name
+        self.buffer = RingBuffer(capacity, 6)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling into an empty buffer, unless already running."""
+        if self.running:
+            return
+        self.buffer.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def read(self) -> npt.NDArray[np.float64]:
+        """Read the wrench once."""
+        return np.asarray(self.robot.get_state().O_F_ext_hat_K, dtype=np.float64)
+
+    def window(self, duration: float) -> npt.NDArray[np.float64]:
+        """Wrench samples of the last `duration` seconds, oldest first."""
+        _, values = self.buffer.since(self.clock.time() - duration)
+        if len(values) == 0:
+            return self.read()[None]
+        return values
+
+    def mean(self, duration: float = 0.1) -> npt.NDArray[np.float64]:
+        return np.mean(self.window(duration), axis=0)  # type: ignore[no-any-return]
+
+    def median(self, duration: float = 0.1) -> npt.NDArray[np.float64]:
+        return np.median(self.window(duration), axis=0)
+
+    def lowpass(
+        self, cutoff: float = 5.0, duration: float = 0.5
+    ) -> npt.NDArray[np.float64]:
+        """Latest output of a first-order low-pass filter with `cutoff`
+        frequency in Hz, run over the window."""
+        values = self.window(duration)
+        alpha = 1 - np.exp(-2 * np.pi * cutoff / self.rate)
+        n = len(values)
+        # Closed form of y[k] = y[k-1] + alpha * (x[k] - y[k-1]) with y[0] = x[0]
+        weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1)
+        weights[0] = (1 - alpha) ** (n - 1)
+        return weights @ values  # type: ignore[no-any-return]
+
+    def _run(self) -> None:
+        period = 1.0 / self.rate
+        next_sample = self.clock.time()
+        while not self._stop.is_set():
+            try:
+                wrench = self.read()
+            except RuntimeError as e:
+                log.warning("%s failed to read robot state: %s", self.name, e)
+                self._stop.wait(0.1)
+                continue
+            if wrench.shape == (6,):
+                self.buffer.append(self.clock.time(), wrench)
+            # Skip samples rather than catching up after falling behind
+            next_sample = max(next_sample + period, self.clock.time())
+            self.clock.sleep_until(next_sample)
@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import logging
+import threading
+import types
+import typing
+
+import numpy as np
+import numpy.typing as npt
+import panda_py
+from panda_py import libfranka
+
+from . import blending, trajectories
+from .backend import Backend, Clock
+
+log = logging.getLogger("sim")
+
+START_POSITION = np.array(
+    [0.0, -np.pi / 4, 0.0, -3 * np.pi / 4, 0.0, np.pi / 2, np.pi / 4]
+)
+"""Joint positions of a simulated robot after connecting."""
+
+
+class SimWorld:
+    """Shared state of the simulated demo: the faucet and the cup.
+
+    The faucet is open while the left arm rests within `faucet_tolerance`
+    of the joint positions in `open_faucet.csv`. While it is open, beer
+    flows into the cup held by the right gripper at `flow_rate` N/s."""
+
+    def __init__(
+        self,
+        clock: Clock,
+        flow_rate: float = 0.35,
+        cup_weight: float = 1.0,
+        noise: float = 0.02,
+        faucet_tolerance: float = 0.05,
+        seed: int | None = None,
+    ) -> None:
+        self.clock = clock
+        self.flow_rate = flow_rate
+        self.cup_weight = cup_weight
+        self.noise = noise
+        self.faucet_tolerance = faucet_tolerance
+        self.open_faucet_q = np.asarray(trajectories.load("open_faucet.csv"))
+        self.holding_cup = False
+        self._poured = 0.0
+        self._opened_at: float | None = None
+        self._rng = np.random.default_rng(seed)
+        self._noise: typing.Iterator[npt.NDArray[np.float64]] = iter(())
+        self._lock = threading.Lock()
+
+    @property
+    def faucet_open(self) -> bool:
+        return self._opened_at is not None
+
+    def beer(self) -> float:
+        """Weight of the beer in the cup in N."""
+        with self._lock:
+            poured = self._poured
+            if self._opened_at is not None and self.holding_cup:
+                poured += (self.clock.time() - self._opened_at) * self.flow_rate
+            return poured
+
+    def update_faucet(self, q: npt.NDArray[np.float64]) -> None:
+        """Update the faucet given the joint positions of the left arm."""
+        is_open = bool(np.all(np.abs(q - self.open_faucet_q) < self.faucet_tolerance))
+        with self._lock:
+            if is_open and self._opened_at is None:
+                self._opened_at = self.clock.time()
+                log.info("Faucet opened")
+            elif not is_open and self._opened_at is not None:
+                if self.holding_cup:
+                    self._poured += (
+                        self.clock.time() - self._opened_at
+                    ) * self.flow_rate
+                self._opened_at = None
+                log.info("Faucet closed")
+
+    def grasp_cup(self) -> None:
+        with self._lock:
+            self.holding_cup = True
+            self._poured = 0.0
+
+    def release_cup(self) -> None:
+        with self._lock:
+            self.holding_cup = False
+            self._poured = 0.0
+
+    def wrench(self, holds_cup: bool) -> list[float]:
+        """External wrench in the base frame, see `O_F_ext_hat_K`."""
+        # Drawing the noise of a thousand reads at once keeps reading the
+        # state in every control tick, e.g. by the flight recorder, cheap
+        noise = next(self._noise, None)
+        if noise is None:
+            with self._lock:
+                self._noise = iter(self._rng.normal(0, self.noise, (1000, 6)))
+            noise = next(self._noise)
+        wrench: list[float] = noise.tolist()
+        if holds_cup and self.holding_cup:
+            wrench[2] -= self.cup_weight + self.beer()
+        return wrench
+
+
+class SimJointPosition:
+    """Simulated counterpart of `panda_py.controllers.JointPosition`."""
+
+    def __init__(self) -> None:
+        self.q: npt.NDArray[np.float64] | None = None
+        self.dq: npt.NDArray[np.float64] | None = None
+
+    def set_control(
+        self, position: npt.NDArray[np.float64], velocity: npt.NDArray[np.float64]
+    ) -> None:
+        self.q = position
+        self.dq = velocity
+
+
+class SimContext:
+    """Simulated control context that ticks at `frequency` on the
+    simulation clock and applies the controller command every tick."""
+
+    def __init__(self, robot: SimPanda, frequency: float, max_runtime: float) -> None:
+        self.robot = robot
+        self.period = 1.0 / frequency
+        self.max_ticks = round(max_runtime * frequency) if max_runtime > 0 else None
+        self.ticks = 0
+        self._start = 0.0
+
+    def __enter__(self) -> SimContext:  # noqa: PYI034
+        self._start = self.robot.clock.time()
+        self.ticks = 0
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.robot.settle()
+
+    def ok(self) -> bool:
+        if self.ticks > 0:
+            self.robot.apply_control()
+        if self.ticks == self.robot.fault_at:
+            self.robot.fault_at = None
+            self.robot.error = "cartesian_reflex"
+            msg = "Motion aborted by reflex! ['cartesian_reflex']"
+            raise RuntimeError(msg)
+        if self.max_ticks is not None and self.ticks >= self.max_ticks:
+            return False
+        self.ticks += 1
+        self.robot.clock.sleep_until(self._start + self.ticks * self.period)
+        return True
+
+
+class SimPanda:
+    """Simulated subset of `panda_py.Panda` used by the demo.
+    Motions take the time they would take on the real robot,
+    measured on the simulation clock."""
+
+    JointPosition = SimJointPosition
+    """Controller type used by :mod:`trinkgelage.robot.actions`."""
+
+    def __init__(
+        self,
+        hostname: str,
+        world: SimWorld,
+        operates_faucet: bool = False,
+        holds_cup: bool = False,
+    ) -> None:
+        self.hostname = hostname
+        self.world = world
+        self.clock = world.clock
+        self.operates_faucet = operates_faucet
+        self.holds_cup = holds_cup
+        self._q: npt.NDArray[np.float64] = START_POSITION.copy()
+        self._dq = np.zeros(7)
+        self._controller: SimJointPosition | None = None
+        self.fault_at: int | None = None
+        """Control tick at which the next control context fails with
+        a reflex, for testing error recovery."""
+        self.error: str | None = None
+        """Error that stopped the robot, until it is recovered."""
+
+    @property
+    def q(self) -> npt.NDArray[np.float64]:
+        return np.array(self._q)
+
+    def get_state(self) -> types.SimpleNamespace:
+        return types.SimpleNamespace(
+            q=self._q.tolist(),
+            dq=self._dq.tolist(),
+            O_F_ext_hat_K=self.world.wrench(self.holds_cup),
+            time=self.clock.time(),
+        )
+
+    def move_to_joint_position(
+        self,
+        positions: npt.NDArray[np.float64] | typing.Sequence[npt.NDArray[np.float64]],
+        speed_factor: float = 0.2,
+        **kwargs: typing.Any,
+    ) -> bool:
+        del kwargs
+        self._check_error()
+        waypoints = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        for waypoint in waypoints:
+            self.clock.sleep(blending.duration(self._q, waypoint, speed_factor))
+            self._q = waypoint.copy()
+        self.settle()
+        return True
+
+    def move_to_pose(
+        self,
+        poses: npt.NDArray[np.float64] | typing.Sequence[npt.NDArray[np.float64]],
+        speed_factor: float = 0.2,
+        **kwargs: typing.Any,
+    ) -> bool:
+        del kwargs
+        self._check_error()
+        targets = np.asarray(poses, dtype=np.float64).reshape(-1, 4, 4)
+        for pose in targets:
+            q = self._ik(pose)
+            if np.any(np.isnan(q)):
+                log.warning("No inverse kinematics solution, keeping configuration")
+                q = self._q
+            self.clock.sleep(blending.duration(self._q, q, speed_factor))
+            self._q = q.copy()
+        self.settle()
+        return True
+
+    def _ik(self, pose: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """Solve the inverse kinematics closest to the current configuration,
+        trying other values of the last joint if there is no solution."""
+        for q7 in np.concatenate([[self._q[-1]], np.linspace(-2.8, 2.8, 15)]):
+            q = np.asarray(panda_py.ik(pose, self._q, q7), dtype=np.float64)
+            if not np.any(np.isnan(q)):
+                return q
+        return q
+
+    def start_controller(self, controller: SimJointPosition) -> None:
+        self._check_error()
+        self._controller = controller
+
+    def stop_controller(self) -> None:
+        self._controller = None
+
+    def create_context(
+        self, frequency: float = 1000.0, max_runtime: float = 0.0
+    ) -> SimContext:
+        return SimContext(self, frequency, max_runtime)
+
+    def recover(self) -> None:
+        self.error = None
+
+    def teaching_mode(
+        self, active: bool, damping: npt.NDArray[np.float64] | None = None
+    ) -> None:
+        del active, damping
+
+    def _check_error(self) -> None:
+        if self.error is not None:
+            msg = f"command rejected due to activated safety function! {self.error}"
+            raise RuntimeError(msg)
+
+    def apply_control(self) -> None:
+        controller = self._controller
+        if controller is not None and controller.q is not None:
+            self._q = np.asarray(controller.q, dtype=np.float64)
+            self._dq = np.asarray(controller.dq, dtype=np.float64)
+
+    def settle(self) -> None:
+        """Bring the robot to rest after a motion."""
+        self._dq = np.zeros(7)
+        if self.operates_faucet:
+            self.world.update_faucet(self._q)
+
+
+class SimGripper:
+    """Simulated subset of `libfranka.Gripper` used by the demo."""
+
+    max_width = 0.08
+
+    def __init__(
+        self, hostname: str, world: SimWorld, object_width: float, holds_cup: bool
+    ) -> None:
+        self.hostname = hostname
+        self.world = world
+        self.clock = world.clock
+        self.object_width = object_width
+        self.holds_cup = holds_cup
+        self.width = self.max_width
+        self.is_grasped = False
+
+    def homing(self) -> bool:
+        self.clock.sleep(2 * self.max_width / 0.1)
+        self.width = self.max_width
+        self.is_grasped = False
+        return True
+
+    def move(self, width: float, speed: float) -> bool:
+        self.clock.sleep(abs(self.width - width) / speed)
+        self.width = width
+        self.is_grasped = False
+        if self.holds_cup:
+            self.world.release_cup()
+        return True
+
+    def grasp(
+        self,
+        width: float,
+        speed: float,
+        force: float,
+        epsilon_inner: float = 0.005,
+        epsilon_outer: float = 0.005,
+    ) -> bool:
+        del force
+        self.clock.sleep(abs(self.width - self.object_width) / speed)
+        self.width = self.object_width
+        self.is_grasped = (
+            width - epsilon_inner <= self.object_width <= width + epsilon_outer
+        )
+        if self.is_grasped and self.holds_cup:
+            self.world.grasp_cup()
+        return self.is_grasped
+
+    def read_once(self) -> types.SimpleNamespace:
+        return types.SimpleNamespace(
+            width=self.width,
+            is_grasped=self.is_grasped,
+            max_width=self.max_width,
+            temperature=30,
+            time=self.clock.time(),
+        )
+
+    def stop(self) -> bool:
+        return True
+
+
+class SimBackend(Backend):
+    """Backend creating simulated robots and grippers.
+
+    The robot and gripper connecting to `left` operate the faucet, the
+    ones connecting to `right` hold the cup. The simulation clock runs
+    `speed` times faster than real time."""
+
+    def __init__(
+        self,
+        left: str = "sim-left",
+        right: str = "sim-right",
+        speed: float = 10.0,
+        world: SimWorld | None = None,
+    ) -> None:
+        super().__init__()
+        self.clock = Clock(speed) if world is None else world.clock
+        self.world = SimWorld(self.clock) if world is None else world
+        self.left = left
+        self.right = right
+
+    def panda(
+        self, hostname: str, realtime_config: libfranka.RealtimeConfig
+    ) -> panda_py.Panda:
+        del realtime_config
+        robot = SimPanda(
+            hostname,
+            self.world,
+            operates_faucet=hostname == self.left,
+            holds_cup=hostname == self.right,
+        )
+        return typing.cast(panda_py.Panda, robot)
+
+    def gripper(self, hostname: str) -> libfranka.Gripper:
+        gripper = SimGripper(
+            hostname,
+            self.world,
+            object_width=0.07 if hostname == self.right else 0.03,
+            holds_cup=hostname == self.right,
+        )
+        return typing.cast(libfranka.Gripper, gripper)
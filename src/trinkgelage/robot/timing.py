@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import logging
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+log = logging.getLogger("timing")
+
+enabled = False  # pylint: disable=invalid-name
+"""Instrument every call to :func:`trinkgelage.robot.actions.play_trajectory`."""
+
+reports: collections.deque[TickReport] = collections.deque(maxlen=100)
+"""Reports of the most recent instrumented trajectories."""
+
+
+@dataclasses.dataclass
+class TickReport:
+    """Timing statistics of a control loop."""
+
+    ticks: int
+    """Number of recorded ticks."""
+    percentiles: dict[float, float]
+    """Tick interval percentiles in ms."""
+    overruns: int
+    """Number of ticks that exceeded the deadline."""
+    overrun_indices: npt.NDArray[np.int64]
+    """Trajectory sample index of each overrun."""
+    max_lag: float
+    """Maximum number of samples the loop lagged behind wall-clock time."""
+
+    def __str__(self) -> str:
+        percentiles = ", ".join(
+            f"p{p:g}={v:.3f}ms" for p, v in self.percentiles.items()
+        )
+        text = f"{self.ticks} ticks, {percentiles}, {self.overruns} overruns"
+        if self.overruns:
+            text += f" at samples {self.overrun_indices[:10].tolist()}"
+            if self.overruns > 10:
+                text += " ..."
+        return f"{text}, max lag {self.max_lag:.0f} samples"
+
+
+class TickTimer:
+    """Records the time of each control tick into a preallocated buffer.
+
+    Recording a tick only writes to the buffer, statistics are computed
+    afterwards by :meth:`report`."""
+
+    def __init__(
+        self, capacity: int, frequency: float = 1000.0, tolerance: float = 0.5
+    ) -> None:
+        self.period = 1.0 / frequency
+        self.tolerance = tolerance
+        """Ticks longer than (1 + `tolerance`) periods count as overruns."""
+        self.count = 0
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._indices = np.zeros(capacity, dtype=np.int64)
+        self._capacity = capacity
+
+    def tick(self, index: int) -> None:
+        """Record a tick that commands trajectory sample `index`."""
+        k = self.count
+        if k < self._capacity:
+            self._times[k] = time.perf_counter_ns()
+            self._indices[k] = index
+            self.count = k + 1
+
+    def reset(self) -> None:
+        self.count = 0
+
+    def report(
+        self, percentiles: tuple[float, ...] = (50, 90, 99, 99.9, 100)
+    ) -> TickReport:
+        """Compute statistics over consecutive ticks. Ticks where playback
+        restarted, e.g. after a retry, are excluded."""
+        times = self._times[: self.count]
+        indices = self._indices[: self.count]
+        consecutive = np.diff(indices) == 1
+        intervals = np.diff(times)[consecutive] * 1e-6
+        overrun = intervals > self.period * 1e3 * (1 + self.tolerance)
+        lag = 0.0
+        if self.count:
+            restart = np.flatnonzero(np.concatenate([[True], ~consecutive]))
+            run = np.cumsum(np.isin(np.arange(self.count), restart)) - 1
+            elapsed = (times - times[restart][run]) * 1e-9 / self.period
+            lag = float(np.max(elapsed - (indices - indices[restart][run])))
+        return TickReport(
+            ticks=self.count,
+            percentiles={
+                p: float(np.percentile(intervals, p)) if len(intervals) else 0.0
+                for p in percentiles
+            },
+            overruns=int(np.count_nonzero(overrun)),
+            overrun_indices=indices[1:][consecutive][overrun],
+            max_lag=lag,
+        )
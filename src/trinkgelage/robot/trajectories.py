@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+from .compression import POSITION_TOLERANCE, VELOCITY_TOLERANCE, CompressedTrajectory
+
+log = logging.getLogger("trajectories")
+
+DATA_PATH = pathlib.Path(pathlib.Path(__file__).parent.parent) / "data"
+
+MAX_JOINT_VELOCITY = np.array([2.175, 2.175, 2.175, 2.175, 2.61, 2.61, 2.61])
+"""Joint velocity limits of the Franka Emika Robot in rad/s."""
+
+MAX_JOINT_ACCELERATION = np.array([15.0, 7.5, 10.0, 12.5, 15.0, 20.0, 20.0])
+"""Joint acceleration limits of the Franka Emika Robot in rad/s^2."""
+
+MAX_JOINT_JERK = np.array([7500.0, 3750.0, 5000.0, 6250.0, 7500.0, 10000.0, 10000.0])
+"""Joint jerk limits of the Franka Emika Robot in rad/s^3."""
+
+
+def get_cache_path() -> pathlib.Path:
+    """
+    Retrieve the directory used to store binary trajectory files.
+    Uses the environment variable `TRINKGELAGE_CACHE` if set and
+    falls back to `$XDG_CACHE_HOME/trinkgelage` otherwise.
+    """
+    cache = os.environ.get("TRINKGELAGE_CACHE")
+    if cache:
+        return pathlib.Path(cache)
+    xdg = os.environ.get("XDG_CACHE_HOME")
+    base = pathlib.Path(xdg) if xdg else pathlib.Path.home() / ".cache"
+    return base / "trinkgelage"
+
+
+class TrajectoryStore:
+    """Loads trajectory files as read-only memory maps.
+
+    CSV files are parsed once and converted to `.npy` files in the cache
+    directory. Binary files are keyed on the path, modification time and
+    size of their source, so editing a CSV invalidates its binary copy."""
+
+    def __init__(
+        self,
+        data_path: str | os.PathLike[str] = DATA_PATH,
+        cache_path: str | os.PathLike[str] | None = None,
+    ) -> None:
+        self.data_path = pathlib.Path(data_path)
+        self._cache_path = None if cache_path is None else pathlib.Path(cache_path)
+        self._arrays: dict[str, tuple[str, npt.NDArray[np.float64]]] = {}
+        self._retimed: dict[
+            tuple[str, float],
+            tuple[npt.NDArray[np.float64], tuple[npt.NDArray[np.float64], ...]],
+        ] = {}
+        self._compressed: dict[
+            tuple[str, float, float], tuple[str, CompressedTrajectory]
+        ] = {}
+        self._locks: collections.defaultdict[str, threading.Lock] = (
+            collections.defaultdict(threading.Lock)
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def cache_path(self) -> pathlib.Path:
+        if self._cache_path is None:
+            return get_cache_path()
+        return self._cache_path
+
+    def load(self, filename: str) -> npt.NDArray[np.float64]:
+        """Load a trajectory file relative to the data path."""
+        source = self.data_path / filename
+        key = self._key(source)
+        with self._lock:
+            cached = self._arrays.get(filename)
+            lock = self._locks[filename]
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with lock:
+            cached = self._arrays.get(filename)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            array: npt.NDArray[np.float64]
+            if source.suffix == ".npy":
+                array = np.load(source, mmap_mode="r")
+            else:
+                array = self._load_binary(source, key)
+            with self._lock:
+                self._arrays[filename] = (key, array)
+            return array
+
+    def load_retimed(
+        self, filename: str, time_scale: float = 1.0
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """Load the joint positions and velocities of a trajectory file
+        retimed by `time_scale`, see :func:`retime`."""
+        trajectory = self.load(filename)
+        if time_scale == 1.0:
+            return trajectory[:, :7], trajectory[:, 7:]
+        key = (filename, float(time_scale))
+        with self._lock:
+            cached = self._retimed.get(key)
+        if cached is None or cached[0] is not trajectory:
+            retimed = retime(trajectory[:, :7], trajectory[:, 7:], time_scale)
+            cached = (trajectory, retimed)
+            with self._lock:
+                self._retimed[key] = cached
+        return cached[1][0], cached[1][1]
+
+    def load_compressed(
+        self,
+        filename: str,
+        tolerance: float = POSITION_TOLERANCE,
+        velocity_tolerance: float = VELOCITY_TOLERANCE,
+    ) -> CompressedTrajectory:
+        """
+        Load a trajectory file as :class:`CompressedTrajectory`.
+        `.npz` files are loaded as is, other files are compressed with
+        the given tolerances once and cached.
+        """
+        source = self.data_path / filename
+        if source.suffix == ".npz":
+            tolerance = velocity_tolerance = 0.0
+        key = self._key(source, f"{tolerance}:{velocity_tolerance}")
+        index = (filename, tolerance, velocity_tolerance)
+        with self._lock:
+            cached = self._compressed.get(index)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if source.suffix == ".npz":
+            trajectory = CompressedTrajectory.load(source)
+        else:
+            binary = self.cache_path / f"{source.stem}-{key}.npz"
+            if binary.exists():
+                trajectory = CompressedTrajectory.load(binary)
+            else:
+                trajectory = CompressedTrajectory.compress(
+                    self.load(filename), tolerance, velocity_tolerance
+                )
+                try:
+                    self._write(binary, trajectory.save)
+                except OSError as e:
+                    log.warning("Unable to cache %s: %s", binary.name, e)
+        with self._lock:
+            self._compressed[index] = (key, trajectory)
+        return trajectory
+
+    def clear(self) -> None:
+        """Drop all arrays held by this store. Binary files are kept."""
+        with self._lock:
+            self._arrays.clear()
+            self._retimed.clear()
+            self._compressed.clear()
+
+    def _key(self, source: pathlib.Path, *extra: str) -> str:
+        stat = source.stat()
+        ident = ":".join(
+            [str(source.resolve()), str(stat.st_mtime_ns), str(stat.st_size), *extra]
+        )
+        return hashlib.sha1(ident.encode()).hexdigest()[:16]
+
+    def _load_binary(self, source: pathlib.Path, key: str) -> npt.NDArray[np.float64]:
+        binary = self.cache_path / f"{source.stem}-{key}.npy"
+        if binary.exists():
+            try:
+                return np.load(binary, mmap_mode="r")  # type: ignore[no-any-return]
+            except ValueError as e:
+                log.warning("Discarding corrupt trajectory cache %s: %s", binary, e)
+        log.info("Converting %s to binary", source.name)
+        array = np.loadtxt(source, delimiter=",")
+        try:
+            self._write(binary, lambda f: np.save(f, array))
+        except OSError as e:
+            log.warning("Unable to cache %s: %s", source.name, e)
+            array.setflags(write=False)
+            return array
+        return np.load(binary, mmap_mode="r")  # type: ignore[no-any-return]
+
+    def _write(
+        self, binary: pathlib.Path, write: typing.Callable[[typing.BinaryIO], object]
+    ) -> None:
+        write_atomic(binary, write)
+        stem = binary.stem.rsplit("-", 1)[0]
+        for stale in binary.parent.glob(f"{stem}-*{binary.suffix}"):
+            if stale != binary and stale.stem.rsplit("-", 1)[0] == stem:
+                stale.unlink(missing_ok=True)
+
+
+def retime(
+    q: npt.NDArray[np.float64],
+    dq: npt.NDArray[np.float64],
+    time_scale: float,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Resample a trajectory such that it plays back `time_scale` times
+    faster at the same control rate. Positions are interpolated linearly and
+    velocities are interpolated and scaled by `time_scale`. The first and
+    last samples are preserved.
+    """
+    if time_scale <= 0:
+        msg = f"time_scale must be positive, got {time_scale}"
+        raise ValueError(msg)
+    n = len(q)
+    t = np.arange(0, n - 1, time_scale)
+    if n == 1 or t[-1] < n - 1:
+        t = np.append(t, n - 1)
+    i0 = np.minimum(t.astype(np.intp), n - 1)
+    i1 = np.minimum(i0 + 1, n - 1)
+    w = (t - i0)[:, None]
+    q_new = q[i0] * (1 - w) + q[i1] * w
+    dq_new = (dq[i0] * (1 - w) + dq[i1] * w) * time_scale
+    q_new.setflags(write=False)
+    dq_new.setflags(write=False)
+    return q_new, dq_new
+
+
+class Prefetcher:
+    """Loads trajectories in a background worker.
+
+    Prefetched files are read in full once so their pages are resident
+    by the time a motion starts playing them."""
+
+    def __init__(self, trajectory_store: TrajectoryStore | None = None) -> None:
+        self.store = store if trajectory_store is None else trajectory_store
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="prefetch"
+        )
+        self._warm: dict[str, int] = {}
+
+    def prefetch(
+        self, filenames: typing.Iterable[str]
+    ) -> concurrent.futures.Future[None]:
+        """Schedule loading of `filenames` and return a future that
+        completes once all of them are resident."""
+        return self._executor.submit(self._load, list(dict.fromkeys(filenames)))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _load(self, filenames: list[str]) -> None:
+        for filename in filenames:
+            try:
+                array = self.store.load(filename)
+            except (OSError, ValueError) as e:
+                log.error("Unable to prefetch %s: %s", filename, e)
+                continue
+            if self._warm.get(filename) != id(array):
+                np.add.reduce(array, axis=None)
+                self._warm[filename] = id(array)
+
+
+store = TrajectoryStore()
+"""Trajectory store shared by all robot actions."""
+
+
+def write_atomic(
+    path: pathlib.Path, write: typing.Callable[[typing.BinaryIO], object]
+) -> None:
+    """Write a file by calling `write` with a temporary file next to `path`,
+    which then replaces `path`. Readers see either the old or the complete
+    new file, never a partial one."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        pathlib.Path(tmp).replace(path)
+    except BaseException:
+        pathlib.Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def load(filename: str) -> npt.NDArray[np.float64]:
+    """Load a trajectory from the shared store."""
+    return store.load(filename)
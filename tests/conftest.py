@@ -6,12 +6,13 @@ import pytest
 
 
 @pytest.fixture(autouse=True)
-def _mock_environ():
+def _mock_environ(tmp_path_factory):
     with mock.patch.dict(
         "os.environ",
         {
             "PANDA_LEFT": "left",
             "PANDA_RIGHT": "right",
+            "TRINKGELAGE_CACHE": str(tmp_path_factory.getbasetemp() / "cache"),
         },
     ):
         yield
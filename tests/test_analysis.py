@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import sys
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from trinkgelage.launchers import analyze
+from trinkgelage.robot import analysis, blending, trajectories
+
+
+@pytest.fixture
+def trajectory():
+    q0 = np.zeros(7)
+    q1 = np.array([0.5, -0.3, 0.2, -0.4, 0.3, 0.6, -0.5])
+    q, dq = blending.quintic(q0, q1, q0, q0, 4.0)
+    return np.vstack([q0, q]), np.vstack([q0, dq])
+
+
+def test_derivatives(trajectory):
+    q, dq = trajectory
+    profile = analysis.derivatives(q, window=1)
+    np.testing.assert_allclose(profile[0], dq, atol=1e-5)
+    # The acceleration of the quintic is zero at the start, middle and end
+    np.testing.assert_allclose(profile[1][[0, 2000, -1]], 0, atol=1e-3)
+    assert np.all(np.abs(profile[2]) < 1.0)
+
+    margins = analysis.Margins.of(profile)
+    assert margins.utilization.shape == (3, 7)
+    np.testing.assert_allclose(
+        margins.utilization[0],
+        np.abs(dq).max(axis=0) / trajectories.MAX_JOINT_VELOCITY,
+        rtol=1e-5,
+    )
+    assert "velocity" in str(margins)
+    # Playing back faster by the uniform time scale reaches the limits
+    fast = trajectories.retime(q, dq, margins.time_scale)[0]
+    assert analysis.Margins.of(analysis.derivatives(fast)).peak == pytest.approx(
+        1.0, rel=0.02
+    )
+
+
+def test_time_optimal(trajectory):
+    q, dq = trajectory
+    q_new, dq_new = analysis.time_optimal(q, dq, safety=0.8)
+    assert len(q_new) < len(q) / 2
+    np.testing.assert_array_equal(q_new[[0, -1]], q[[0, -1]])
+    assert analysis.Margins.of(analysis.derivatives(q_new)).peak <= 0.8
+    # The retimed trajectory follows the same path
+    progress = np.interp(q_new[:, 0], q[:, 0], np.arange(len(q)))
+    for joint in range(7):
+        np.testing.assert_allclose(
+            q_new[:, joint],
+            np.interp(progress, np.arange(len(q)), q[:, joint]),
+            atol=1e-6,
+        )
+    np.testing.assert_allclose(
+        dq_new[1:-1], np.gradient(q_new, 1e-3, axis=0)[1:-1], atol=0.05
+    )
+
+
+def test_analyze(tmp_path):
+    for filename in ("place_cup.csv", "left_idle.csv"):
+        (tmp_path / filename).write_bytes(
+            (trajectories.DATA_PATH / filename).read_bytes()
+        )
+    store = trajectories.TrajectoryStore(tmp_path, tmp_path / "cache")
+    assert analysis.analyze("left_idle.csv", store) is None
+    result = analysis.analyze("place_cup.csv", store)
+    assert result is not None
+    report, retimed = result
+    assert retimed.shape[1] == 14
+    assert report.retimed_duration == (len(retimed) - 1) / 1000
+    assert report.saving > 0
+    assert report.retimed_margins.peak <= 0.9
+
+    savings = analyze.transition_savings({"place_cup.csv": report})
+    assert savings["place_cup"] == pytest.approx(report.saving)
+    assert savings["pick_cup"] == 0
+
+    # Motions of both arms only save the time of the critical arm
+    reports = {
+        name: analysis.Report(name, duration, report.margins, retimed, report.margins)
+        for name, duration, retimed in [
+            ("grasp_faucet.csv", 2.0, 1.0),
+            ("level_cup.csv", 3.0, 2.5),
+            ("pre_grasp_faucet.csv", 1.0, 0.5),
+        ]
+    }
+    savings = analyze.transition_savings(reports)
+    assert savings["close_faucet"] == pytest.approx(0.5 + 0.5)
+    # The files of one arm add up
+    assert savings["pick_cup"] == pytest.approx(0.5 + 1.0)
+
+    argv = ["trinkgelage-analyze", "--data", str(tmp_path), "-o", str(tmp_path / "out")]
+    with mock.patch.object(sys, "argv", argv):
+        analyze.main()
+    np.testing.assert_array_equal(np.load(tmp_path / "out" / "place_cup.npy"), retimed)
+    assert not (tmp_path / "out" / "left_idle.npy").exists()
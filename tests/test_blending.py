@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from trinkgelage.robot import actions, blending, trajectories
+
+
+def test_quintic():
+    q0, q1 = np.zeros(7), np.linspace(0.1, 0.7, 7)
+    dq0, dq1 = np.full(7, 0.1), np.full(7, -0.2)
+    q, dq = blending.quintic(q0, q1, dq0, dq1, 0.5)
+    assert len(q) == 500
+    np.testing.assert_allclose(q[-1], q1)
+    np.testing.assert_allclose(dq[-1], dq1)
+    np.testing.assert_allclose(q[0], q0 + dq0 * 1e-3, atol=1e-6)
+    midpoint = (dq[1:] + dq[:-1]) / 2
+    np.testing.assert_allclose(np.diff(q, axis=0) * 1000, midpoint, atol=1e-3)
+
+
+def test_blend_waypoints():
+    waypoints = [np.zeros(7), np.full(7, 0.2), np.full(7, 0.5), np.full(7, 0.1)]
+    q, dq = blending.blend(waypoints, speed_factor=0.5)
+    np.testing.assert_array_equal(q[0], waypoints[0])
+    np.testing.assert_allclose(q[-1], waypoints[-1])
+    np.testing.assert_array_equal(dq[[0, -1]], 0)
+    via = np.argmin(np.abs(q[:, 0] - 0.2))
+    assert np.all(dq[via] > 0)
+    assert np.abs(np.diff(q, axis=0)).max() < 2.175 * 1e-3
+
+
+def test_blend_trajectories():
+    segments: list[blending.Segment] = [
+        trajectories.store.load_retimed("level_cup.csv"),
+        trajectories.store.load_retimed("place_cup.csv"),
+        np.asarray(trajectories.load("post_place_cup.csv")),
+    ]
+    q, dq = blending.blend(segments)
+    level, place, post_place = segments
+    assert len(q) > len(level[0]) + len(place[0])
+    np.testing.assert_array_equal(q[: len(level[0])], level[0])
+    np.testing.assert_allclose(q[-1], post_place)
+    assert np.abs(np.diff(q, axis=0)).max() < 2.175 * 1e-3
+    tail = slice(-300, None)
+    midpoint = (dq[tail][1:] + dq[tail][:-1]) / 2
+    np.testing.assert_allclose(np.diff(q[tail], axis=0) * 1000, midpoint, atol=1e-3)
+    with pytest.raises(ValueError, match="empty"):
+        blending.blend([])
+
+
+def test_blend_velocity_limits():
+    # A trajectory ending in motion followed by a waypoint behind it
+    t = np.arange(200)[:, None] * 1e-3
+    velocity = np.full(7, 0.4)
+    segment = (velocity * t, np.tile(velocity, (200, 1)))
+    q, dq = blending.blend([segment, np.full(7, -0.3)], speed_factor=0.2)
+    np.testing.assert_allclose(q[-1], -0.3)
+    limit = trajectories.MAX_JOINT_VELOCITY * max(0.2, 0.4 / 2.175)
+    assert np.all(np.abs(dq) <= limit * 1.001)
+
+
+@mock.patch("panda_py.Panda")
+def test_blended_motion(mock_panda):
+    robot = mock_panda.return_value
+    robot.create_context.return_value.__enter__.return_value.ok.return_value = True
+    files = ["pre_grasp_faucet.csv", "level_cup.csv", "grasp_faucet.csv"]
+    with mock.patch("panda_py.controllers.JointPosition"):
+        assert actions.motion_from_file(robot, files, blend=True)
+    robot.start_controller.assert_called_once()
+    robot.move_to_joint_position.assert_called_once()
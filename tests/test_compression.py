@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from trinkgelage.robot import actions, compression, trajectories
+
+
+@pytest.fixture(scope="module")
+def trajectory():
+    return np.asarray(trajectories.load("level_cup.csv"))
+
+
+def test_compress(trajectory):
+    compressed = compression.CompressedTrajectory.compress(trajectory, 1e-4, 1e-2)
+    assert len(compressed) == len(trajectory)
+    assert compressed.nbytes < trajectory.nbytes / 10
+    error = compressed.max_error(trajectory)
+    assert np.all(error[:7] <= 1e-4)
+    assert np.all(error[7:] <= 1e-2)
+    np.testing.assert_array_equal(compressed.q[5:8], compressed.expand(5, 8)[:, :7])
+    np.testing.assert_array_equal(compressed.dq[-1], compressed.expand()[-1, 7:])
+    with pytest.raises(IndexError):
+        compressed.q[len(trajectory)]
+
+
+@pytest.mark.parametrize("time_scale", [0.5, 1.5])
+def test_retime(trajectory, time_scale):
+    compressed = compression.CompressedTrajectory.compress(trajectory)
+    q, dq = trajectories.retime(trajectory[:, :7], trajectory[:, 7:], time_scale)
+    retimed = compressed.retime(time_scale)
+    assert len(retimed) == len(q)
+    np.testing.assert_allclose(retimed.q[:], q, atol=2e-4)
+    np.testing.assert_allclose(retimed.dq[:], dq, atol=2e-2 * time_scale)
+
+
+def test_load_compressed(tmp_path):
+    compressed = trajectories.store.load_compressed("level_cup.csv")
+    assert trajectories.store.load_compressed("level_cup.csv") is compressed
+    compressed.save(tmp_path / "level_cup.npz")
+    store = trajectories.TrajectoryStore(tmp_path, tmp_path / "cache")
+    loaded = store.load_compressed("level_cup.npz")
+    np.testing.assert_array_equal(loaded.values, compressed.values)
+
+
+@mock.patch("panda_py.Panda")
+def test_play_compressed(mock_panda, trajectory):
+    robot = mock_panda.return_value
+    robot.create_context.return_value.__enter__.return_value.ok.return_value = True
+    with mock.patch("panda_py.controllers.JointPosition") as mock_ctrl:
+        assert actions.motion_from_file(robot, "level_cup.csv", tolerance=1e-4)
+    calls = mock_ctrl.return_value.set_control.call_args_list
+    assert len(calls) == len(trajectory)
+    q = np.array([c.args[0] for c in calls])
+    np.testing.assert_allclose(q, trajectory[:, :7], atol=1e-4)
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import inspect
+import re
 import socket
 from unittest import mock
 
 import pytest
 
 from trinkgelage.demo import control
+from trinkgelage.robot import executor, trajectories
 
 
 @mock.patch("panda_py.Panda")
@@ -25,13 +28,62 @@ def test_control(mock_cup_full, mock_gripper, mock_panda):
     assert ctrl.current_state == control.DemoControl.cups_empty
     ctrl.refill_cups()
     assert ctrl.current_state == control.DemoControl.idle
+    model.close()
 
 
 @mock.patch("panda_py.Panda")
 @mock.patch("panda_py.libfranka.Gripper")
 @mock.patch("trinkgelage.demo.control.DemoModel.cup_full", return_value=True)
 def test_gui_connection(mock_cup_full, mock_gripper, mock_panda):
-    del mock_cup_full, mock_gripper, mock_panda
+    del mock_cup_full, mock_panda
+    mock_gripper.return_value.read_once.return_value.width = 0.03
     model = control.DemoModel("left", "right", use_gui=True)
+    control.DemoControl(model).start_demo()
+    assert model.gui is not None
     with pytest.raises(socket.gaierror):
-        control.DemoControl(model).start_demo()
+        model.gui.flush()
+    model.close()
+
+
+@mock.patch("panda_py.Panda")
+@mock.patch("panda_py.libfranka.Gripper")
+@mock.patch("trinkgelage.robot.actions.two_arm_motion_from_files", return_value=False)
+def test_two_arm_failure(mock_motion, mock_gripper, mock_panda):
+    del mock_panda
+    mock_gripper.return_value.read_once.return_value.width = 0.03
+    model = control.DemoModel("left", "right")
+    ctrl = control.DemoControl(model)
+    with pytest.raises(executor.MotionError, match="move_cup_to_faucet"):
+        ctrl.start_demo()
+    mock_motion.assert_called_once()
+    model.close()
+
+
+def test_trajectory_files():
+    handlers = {
+        event: getattr(control.DemoModel, f"on_{event}", None)
+        or getattr(control.DemoModel, event)
+        for event in control.DemoModel.trajectory_files
+    }
+    for event, handler in handlers.items():
+        source = inspect.getsource(handler)
+        for method in re.findall(r"self\.(\w+)", source):
+            if inspect.isfunction(getattr(control.DemoModel, method, None)):
+                source += inspect.getsource(getattr(control.DemoModel, method))
+        used = set(re.findall(r"\"(\w+\.csv)\"", source))
+        assert used == set(control.DemoModel.trajectory_files[event])
+    for files in control.DemoModel.trajectory_files.values():
+        for filename in files:
+            assert (trajectories.DATA_PATH / filename).exists()
+
+
+@mock.patch("panda_py.Panda")
+@mock.patch("panda_py.libfranka.Gripper")
+def test_prefetch(mock_gripper, mock_panda):
+    del mock_gripper, mock_panda
+    model = control.DemoModel("left", "right")
+    files = model.next_trajectory_files(control.DemoControl.holding_filled_cup)
+    assert files == ["place_cup.csv", "post_place_cup.csv"]
+    model.prefetcher.prefetch(files).result()
+    model.prefetcher.shutdown()
+    model.close()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from trinkgelage.demo import control, estimate
+from trinkgelage.robot import actions, sim
+
+
+def test_walk():
+    conditions = estimate.CycleEstimator._conditions(back_to_back=False)
+    assert estimate.walk(control.DemoControl.idle, conditions) == [
+        "start_demo",
+        "pick_cup",
+        "open_faucet",
+        "close_faucet",
+        "place_cup",
+        "return_to_idle",
+    ]
+    conditions = estimate.CycleEstimator._conditions(back_to_back=True)
+    events = estimate.walk(control.DemoControl.waiting_for_user_pickup, conditions)
+    assert events[0] == "next_order"
+    assert events[-1] == "place_cup"
+
+
+def test_plans():
+    # The plans play the files the handlers load
+    for event, steps in estimate.PLANS.items():
+        files = {
+            f
+            for step in steps
+            if isinstance(step, estimate.Motion)
+            for f in step.left + step.right
+        }
+        assert files <= set(control.DemoModel.trajectory_files.get(event, ()))
+
+    estimator = estimate.CycleEstimator()
+    path = estimator.back_to_back(2)
+    (motion,) = [s for s in path.steps if s.event == "pick_cup" and s.critical]
+    assert motion.critical in ("left", "right")
+    assert 0 <= motion.slack <= motion.duration
+    assert sum(path.durations().values()) == pytest.approx(path.duration)
+    assert estimator.cups_per_hour() > 3600 / path.duration / 2
+
+    faster = estimate.CycleEstimator(
+        plans=estimate.with_speed_factor(estimate.PLANS, 0.4)
+    )
+    assert faster.back_to_back(2).duration < path.duration
+
+
+def test_plans_match_handlers(monkeypatch):
+    backend = sim.SimBackend(speed=100.0)
+    model = control.DemoModel(
+        backend.left,
+        backend.right,
+        enforce_rt=False,
+        robot_backend=backend,
+        keg="plans",
+    )
+    model.wait_for()
+    arms = {id(model.left): "left", id(model.right): "right"}
+    arms |= {id(model.left_gripper): "left", id(model.right_gripper): "right"}
+    events: list[str] = []
+    steps: list[tuple[str, estimate.Step]] = []
+    # The actions of the handlers call each other, also on the executors of
+    # the arms, only the outermost call is a step
+    depth = [0]
+    lock = threading.Lock()
+
+    def files(filenames):
+        return (filenames,) if isinstance(filenames, str) else tuple(filenames)
+
+    def step(name, arguments):
+        if name == "motion_from_file":
+            arm = arms[id(arguments["robot"])]
+            return estimate.Motion(
+                **{arm: files(arguments["filenames"])},
+                speed_factor=arguments["speed_factor"],
+            )
+        if name == "two_arm_motion_from_files":
+            assert arguments["left_speed_factor"] == arguments["right_speed_factor"]
+            return estimate.Motion(
+                files(arguments["left_filenames"]),
+                files(arguments["right_filenames"]),
+                arguments["left_speed_factor"],
+            )
+        if name in ("grasp", "release"):
+            return estimate.Gripper(arms[id(arguments["gripper"])], name)
+        slot = model.slots[model.max_cups - model.cups]
+        if name == "play_trajectory":
+            approach = np.array_equal(arguments["q"], slot.approach[0])
+            part = "approach" if approach else "retreat"
+            return estimate.SlotMotion(part, arguments["speed_factor"])
+        slot = model.slots[model.max_cups - model.cups + 1]
+        np.testing.assert_array_equal(arguments["joint_positions"], slot.q[0])
+        return estimate.SlotMotion("next", arguments["speed_factor"])
+
+    def record(name, func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with lock:
+                outermost = depth[0] == 0
+                depth[0] += 1
+            try:
+                if outermost:
+                    arguments = signature.bind(*args, **kwargs)
+                    arguments.apply_defaults()
+                    steps.append((events[-1], step(name, arguments.arguments)))
+                return func(*args, **kwargs)
+            finally:
+                with lock:
+                    depth[0] -= 1
+
+        monkeypatch.setattr(actions, name, wrapper)
+
+    for name in (
+        "motion_from_file",
+        "two_arm_motion_from_files",
+        "play_trajectory",
+        "move_to_joint_position",
+        "grasp",
+        "release",
+    ):
+        record(name, getattr(actions, name))
+    before_transition = control.DemoModel.before_transition
+
+    def transition(self, event, source, target):
+        before_transition(self, event, target)
+        # Like the estimator, skip the transitions staying in a state
+        if source != target:
+            events.append(event)
+
+    monkeypatch.setattr(control.DemoModel, "before_transition", transition)
+    ctrl = control.DemoControl(model)
+
+    # A single cup, then two queued orders served back to back
+    ctrl.start_demo()
+    for _ in range(2):
+        ctrl.order("test")
+    deadline = time.monotonic() + 60
+    while model.dispatching and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(model.orders.served) == 2
+    assert "next_order" in events
+
+    motions = (estimate.Motion, estimate.SlotMotion, estimate.Gripper)
+    expected = [
+        (event, s)
+        for event in events
+        for s in estimate.PLANS[event]
+        if isinstance(s, motions)
+    ]
+    assert steps == expected
+    model.close()
+
+
+def test_matches_sim():
+    backend = sim.SimBackend(speed=10.0)
+    model = control.DemoModel(
+        backend.left,
+        backend.right,
+        enforce_rt=False,
+        robot_backend=backend,
+        keg="estimate",
+    )
+    # The simulation keeps up with the control loop at this speed, but the
+    # overhead of each measurement would add up while pouring
+    model.measure_period = model.pour.period = 0.2
+    model.speed_factor = 0.4
+    plans = estimate.with_speed_factor(estimate.PLANS, model.speed_factor)
+    ctrl = control.DemoControl(model)
+    model.wait_for()
+    estimator = estimate.CycleEstimator(
+        pour_controller=model.pour, plans=plans, measure_period=model.measure_period
+    )
+    expected = estimator.single(1).duration
+    start = backend.clock.time()
+    ctrl.start_demo()
+    assert backend.clock.time() - start == pytest.approx(expected, rel=0.05)
+
+    # The second of two queued orders is served back to back
+    expected = estimator.back_to_back(3).duration
+    for _ in range(2):
+        ctrl.order("test")
+    deadline = time.monotonic() + 120
+    while model.dispatching and time.monotonic() < deadline:
+        time.sleep(0.01)
+    first, second = model.orders.served
+    assert second.served is not None
+    assert first.served is not None
+    assert second.served - first.served == pytest.approx(expected, rel=0.05)
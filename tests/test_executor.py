@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import concurrent.futures
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from trinkgelage.robot import actions, executor, sim
+
+
+@pytest.fixture
+def backend():
+    return sim.SimBackend(speed=100.0)
+
+
+def test_order(backend):
+    arm = executor.ArmExecutor(backend.panda("left", None), "left")
+    calls = []
+    tasks = [
+        arm.submit(lambda i=i: calls.append((i, threading.current_thread().name)))
+        for i in range(5)
+    ]
+    executor.all_of(*tasks)
+    assert calls == [(i, "left") for i in range(5)]
+    arm.shutdown()
+
+
+def test_motion(backend):
+    robot = backend.panda("right", None)
+    arm = executor.get(robot, "right", backend.gripper("right"))
+    assert executor.get(robot, "right") is arm
+    q = actions.load_csv("right_idle.csv")
+    results = executor.all_of(
+        arm.motion(actions.move_to_joint_position, q),
+        arm.gripper_command(actions.grasp),
+    )
+    assert results == [None, None]
+    assert np.allclose(robot.q, q)
+
+    def fail(robot, cancel):
+        del robot, cancel
+        return False
+
+    task = arm.motion(fail)
+    with pytest.raises(executor.MotionError):
+        task.result()
+
+    executor.release(robot)
+    assert not arm._thread.is_alive()
+    assert executor.get(robot, "right") is not arm
+    executor.release(robot)
+
+
+def test_first_failure_cancels(backend):
+    left = executor.ArmExecutor(backend.panda("left", None), "left")
+    right = executor.ArmExecutor(backend.panda("right", None), "right")
+    q = np.tile(left.robot.q, (100000, 1))
+    long_motion = left.motion(actions.play_trajectory, q, np.zeros_like(q))
+    queued = left.submit(time.sleep, 10)
+
+    def fail(robot, cancel):
+        del robot, cancel
+        time.sleep(0.1)
+        return False
+
+    start = time.perf_counter()
+    with pytest.raises(executor.MotionError):
+        executor.all_of(long_motion, queued, right.motion(fail))
+    assert time.perf_counter() - start < 1.0
+    with pytest.raises(concurrent.futures.CancelledError):
+        long_motion.result()
+    assert queued.cancelled()
+    left.shutdown()
+    right.shutdown()
+
+
+def test_timeout(backend):
+    arm = executor.ArmExecutor(backend.panda("left", None), "left")
+    event = threading.Event()
+    with pytest.raises(TimeoutError):
+        executor.all_of(arm.submit(event.wait), timeout=0.01)
+    event.set()
+    arm.shutdown()
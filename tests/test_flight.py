@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import gc
+import types
+import typing
+import weakref
+
+import numpy as np
+import panda_py
+import pytest
+
+from trinkgelage.demo import control
+from trinkgelage.robot import actions, backend, flight, sim, trajectories
+
+
+def state(k: float) -> types.SimpleNamespace:
+    return types.SimpleNamespace(q=[k] * 7, dq=[-k] * 7, O_F_ext_hat_K=[0.0] * 5 + [k])
+
+
+def test_ring_buffer(tmp_path):
+    recorder = flight.FlightRecorder("arm", seconds=0.01, path=tmp_path, keep=2)
+    assert recorder.capacity == 10
+    assert recorder.dump("empty") is None
+    for k in range(25):
+        recorder.record(state(k), np.full(7, k), np.zeros(7), k)
+
+    records = recorder.snapshot()
+    np.testing.assert_array_equal(records[:, 1], np.arange(15, 25))
+    np.testing.assert_array_equal(records[:, 3], np.arange(15, 25))
+    assert (tmp_path / "arm.ring").stat().st_size == records.nbytes
+
+    paths = [recorder.dump(f"dump {k}") for k in range(3)]
+    assert sorted(tmp_path.glob("arm-*.npz")) == paths[1:]
+    assert paths[-1] is not None
+    columns = flight.load(paths[-1])
+    assert str(columns["reason"]) == "dump 2"
+    assert columns["q"].shape == (10, 7)
+    np.testing.assert_array_equal(columns["index"], np.arange(15, 25))
+    np.testing.assert_array_equal(columns["dq"][:, 0], -np.arange(15, 25))
+    np.testing.assert_array_equal(columns["wrench"][:, 5], np.arange(15, 25))
+
+
+def test_reopen(tmp_path):
+    recorder = flight.FlightRecorder("arm", seconds=0.01, path=tmp_path)
+    for k in range(15):
+        recorder.record(state(k), np.zeros(7), np.zeros(7), k)
+    del recorder
+
+    # A restarted recorder continues after the last record
+    recorder = flight.FlightRecorder("arm", seconds=0.01, path=tmp_path)
+    assert recorder.ticks == 15
+    recorder.record(state(15), np.zeros(7), np.zeros(7), 15)
+    np.testing.assert_array_equal(recorder.snapshot()[:, 1], np.arange(6, 16))
+    assert not list(tmp_path.glob("arm-*.npz"))
+    del recorder
+
+    # The ring is dumped before it is replaced by one of another capacity
+    recorder = flight.FlightRecorder("arm", seconds=0.02, path=tmp_path)
+    assert recorder.ticks == 0
+    (path,) = tmp_path.glob("arm-*.npz")
+    columns = flight.load(path)
+    assert str(columns["reason"]) == "previous ring of arm"
+    np.testing.assert_array_equal(columns["index"], np.arange(6, 16))
+
+
+def test_release(monkeypatch):
+    monkeypatch.setattr(flight, "_recorders", weakref.WeakKeyDictionary())
+    world = sim.SimWorld(backend.Clock(1000.0), seed=0)
+    robot = typing.cast(panda_py.Panda, sim.SimPanda("release", world))
+    assert flight.get(robot, "arm").name == "arm"
+    other = typing.cast(panda_py.Panda, sim.SimPanda("other", world))
+    assert flight.get(other, "arm").name == "arm-2"
+
+    # The recorder of a collected robot is released with it
+    del robot
+    gc.collect()
+    assert list(flight._recorders.values()) == [flight.get(other)]
+    robot = typing.cast(panda_py.Panda, sim.SimPanda("release", world))
+    assert flight.get(robot, "arm").name == "arm"
+
+
+def test_station_rings(monkeypatch, tmp_path):
+    monkeypatch.setenv("TRINKGELAGE_CACHE", str(tmp_path))
+    monkeypatch.setattr(flight, "_recorders", weakref.WeakKeyDictionary())
+    # The rings are named after the robots, whatever order the stations
+    # start in
+    for left, right in [("b-left", "b-right"), ("a-left", "a-right")]:
+        robot_backend = sim.SimBackend(left, right, speed=100.0)
+        model = control.DemoModel(
+            left, right, enforce_rt=False, robot_backend=robot_backend, keg="sim"
+        )
+        assert flight.get(model.left).name == left
+        assert flight.get(model.right).name == right
+        model.close()
+    assert sorted(p.name for p in (tmp_path / "flight").glob("*.ring")) == [
+        "a-left.ring",
+        "a-right.ring",
+        "b-left.ring",
+        "b-right.ring",
+    ]
+
+
+def test_recordable():
+    assert flight.recordable(state(0.0))
+    assert not flight.recordable(types.SimpleNamespace(O_F_ext_hat_K=[0.0] * 6))
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_dump_on_error(monkeypatch, enabled):
+    monkeypatch.setattr(flight, "enabled", enabled)
+    monkeypatch.setattr(flight, "_recorders", weakref.WeakKeyDictionary())
+    world = sim.SimWorld(backend.Clock(1000.0), seed=0)
+    sim_robot = sim.SimPanda(f"flight-{enabled}", world)
+    sim_robot.fault_at = 300
+    robot = typing.cast(panda_py.Panda, sim_robot)
+    q, dq = trajectories.store.load_retimed("place_cup.csv", 1.0)
+    assert actions.play_trajectory(robot, q, dq)
+
+    recorder = flight.get(robot)
+    dumps = sorted(recorder.path.glob(f"{recorder.name}-*.npz"))
+    if not enabled:
+        assert not dumps
+        return
+    (path,) = dumps
+    columns = flight.load(path)
+    assert "play_trajectory" in str(columns["reason"])
+    # The dump ends with the sample the robot stopped at
+    assert columns["index"][-1] == 299
+    np.testing.assert_allclose(columns["q_d"][-1], q[299])
+    assert np.all(np.diff(columns["tick"]) == 1)
+
+    # Moves that are not recorded do not dump
+    sim_robot.error = "joint_reflex"
+    assert actions.move_to_joint_position(robot, q[0])
+    assert sorted(recorder.path.glob(f"{recorder.name}-*.npz")) == [path]
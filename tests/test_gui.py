@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import threading
+import time
+from xmlrpc import server
+
+import pytest
+
+from trinkgelage.demo import gui
+
+
+class Display:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, tuple[object, ...]]] = []
+        self.requests = 0
+        self.multicall = False
+        self.url = ""
+
+    def _dispatch(self, method: str, params: tuple[object, ...]) -> bool:
+        if method not in ("play_sound", "render_text", "show_image", "show_text"):
+            if method != "slow":
+                msg = f"{method} is not supported"
+                raise ValueError(msg)
+            time.sleep(0.2)
+        self.calls.append((method, tuple(params)))
+        return True
+
+
+@pytest.fixture(params=[True, False], ids=["multicall", "single"])
+def display(request):
+    srv = server.SimpleXMLRPCServer(("127.0.0.1", 0), logRequests=False)
+    if request.param:
+        srv.register_multicall_functions()
+    disp = Display()
+    disp.multicall = request.param
+    srv.register_instance(disp)
+    handle = srv._marshaled_dispatch
+
+    def count(*args, **kwargs):
+        disp.requests += 1
+        return handle(*args, **kwargs)
+
+    srv._marshaled_dispatch = count  # type: ignore[method-assign]
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    disp.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    yield disp
+    srv.shutdown()
+    srv.server_close()
+    thread.join()
+
+
+def test_batch(display):
+    client = gui.GuiClient(display.url, linger=0.05)
+    client.play_sound("confirm.wav")
+    client.render_text("Hello", 10, (0, 255, 255), 200)
+    client.flush()
+    assert display.calls == [
+        ("play_sound", ("confirm.wav",)),
+        ("render_text", ("Hello", 10, [0, 255, 255], 200)),
+    ]
+    assert display.requests == (1 if display.multicall else 3)
+    client.close()
+
+
+def test_coalesce(display):
+    client = gui.GuiClient(display.url, linger=0)
+    client.slow()
+    time.sleep(0.05)
+    for i in range(10):
+        client.show_text(f"measuring...\n{i}ml")
+    client.show_image("happy.png")
+    client.close()
+    assert display.calls == [
+        ("slow", ()),
+        ("show_text", ("measuring...\n9ml",)),
+        ("show_image", ("happy.png",)),
+    ]
+    with pytest.raises(RuntimeError):
+        client.show_text("closed")
@@ -14,7 +14,19 @@ from trinkgelage.launchers import demo
 @mock.patch(
     "argparse.ArgumentParser.parse_args",
     return_value=argparse.Namespace(
-        gui_hostname="", gui_port=0, start_position=1, gui=True
+        gui_hostname="",
+        gui_port=0,
+        start_position=1,
+        gui=True,
+        trace=None,
+        tick_timing=False,
+        sim=False,
+        sim_speed=10.0,
+        keg="default",
+        pipelined=False,
+        order_port=0,
+        metrics_port=0,
+        tray=(3, 4),
     ),
 )
 def test_launcher(
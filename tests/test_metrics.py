@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+from trinkgelage.monitoring import metrics
+
+
+def test_exposition():
+    registry = metrics.Registry()
+    served = metrics.Counter("served_total", "Cups served.", metrics_registry=registry)
+    cups = metrics.Gauge("cups", "Cups left.", metrics_registry=registry)
+    retries = metrics.Counter(
+        "retries_total", "Retries.", labels=["action"], metrics_registry=registry
+    )
+    latency = metrics.Histogram(
+        "latency_seconds", "Latency.", [0.5, 1], metrics_registry=registry
+    )
+    served.inc()
+    served.inc(2)
+    cups.set(4)
+    cups.inc(-1)
+    retries.inc(action='say "hi"')
+    for value in (0.1, 0.5, 0.7, 3):
+        latency.observe(value)
+
+    assert served.value() == 3
+    assert latency.count() == 4
+    assert latency.total() == pytest.approx(4.3)
+    text = registry.expose()
+    assert "# TYPE served_total counter\nserved_total 3\n" in text
+    assert "cups 3\n" in text
+    assert 'retries_total{action="say \\"hi\\""} 1\n' in text
+    assert 'latency_seconds_bucket{le="0.5"} 2\n' in text
+    assert 'latency_seconds_bucket{le="1"} 3\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "latency_seconds_count 4\n" in text
+
+    with pytest.raises(ValueError, match="expects labels"):
+        retries.inc()
+    with pytest.raises(ValueError, match="only increase"):
+        served.inc(-1)
+    with pytest.raises(ValueError, match="already registered"):
+        metrics.Counter("served_total", "Again.", metrics_registry=registry)
+
+
+def test_server():
+    registry = metrics.Registry()
+    metrics.Counter("served_total", "Cups served.", metrics_registry=registry).inc()
+    server = metrics.MetricsServer(0, metrics_registry=registry)
+    url = f"http://127.0.0.1:{server.port}"
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert b"served_total 1\n" in response.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+    finally:
+        server.close()
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from xmlrpc import client
+
+from trinkgelage.demo import orders
+from trinkgelage.robot import backend
+
+
+def test_queue():
+    clock = backend.Clock(speed=1000.0)
+    queue = orders.OrderQueue(clock)
+    assert queue.take() is None
+    first = queue.put("button")
+    second = queue.put("api")
+    assert len(queue) == 2
+    assert queue.take() is first
+    clock.sleep(10)
+    queue.serve(first)
+    assert first.time_to_serve is not None
+    assert first.time_to_serve >= 10
+    stats = queue.stats()
+    assert stats["pending"] == 1
+    assert stats["served"] == 1
+    assert stats["max_time_to_serve"] == first.time_to_serve
+    third = queue.put("menu")
+    assert queue.take() is second
+    queue.requeue(second)
+    assert queue.take() is second
+    assert queue.take() is third
+    assert not queue
+
+
+def test_api():
+    queue = orders.OrderQueue()
+    api = orders.OrderApi(queue.put, queue, port=0)
+    proxy = client.ServerProxy(f"http://127.0.0.1:{api.port}")
+    assert proxy.order() == 1
+    assert proxy.order("kiosk") == 2
+    stats = proxy.stats()
+    assert isinstance(stats, dict)
+    assert stats["pending"] == 2
+    order = queue.take()
+    assert order is not None
+    assert order.source == "api"
+    api.close()
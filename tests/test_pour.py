@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from trinkgelage.demo import pour
+
+
+def pour_cup(
+    controller: pour.PourController,
+    flow_rate: float,
+    latency: float,
+    rng: np.random.Generator,
+) -> float:
+    controller.start()
+    t = 0.0
+    while True:
+        t += controller.period
+        load = flow_rate * max(0.0, t - 0.5) + rng.normal(0, 0.02)
+        if controller.update(t, load):
+            break
+    final = flow_rate * (t + latency - 0.5)
+    controller.finish(final)
+    return final
+
+
+def test_calibration(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "pour.json"
+    controller = pour.PourController(path=path)
+    errors = [
+        abs(pour_cup(controller, 0.5, 0.6, rng) - controller.target) for _ in range(5)
+    ]
+    assert errors[-1] < errors[0]
+    assert errors[-1] < 0.5 * controller.period
+    assert controller.calibration.cups == 5
+    assert controller.calibration.flow_rate == pytest.approx(0.5, rel=0.05)
+    assert controller.calibration.latency == pytest.approx(0.6, abs=0.1)
+
+    restored = pour.PourController(path=path)
+    assert restored.calibration == controller.calibration
+    assert pour.PourController(path=path, keg="other").calibration.cups == 0
+
+
+def test_shared_calibration(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "pour.json"
+    controllers = [pour.PourController(path=path, keg=keg) for keg in ("a", "b")]
+    for controller in controllers:
+        pour_cup(controller, 0.5, 0.6, rng)
+    # Each station keeps the calibrations stored by the others
+    restored = pour.PourController(path=path, keg="a")
+    assert restored.calibrations.keys() == {"a", "b"}
+    for controller in controllers:
+        assert restored.calibrations[controller.keg] == controller.calibration
+
+
+def test_invalid_calibration(tmp_path):
+    path = tmp_path / "pour.json"
+    path.write_text("{")
+    assert pour.PourController(path=path).calibration == pour.Calibration()
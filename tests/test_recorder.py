@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import sys
+import types
+import typing
+from unittest import mock
+
+import numpy as np
+import panda_py
+
+from trinkgelage.launchers import record
+from trinkgelage.robot import actions, backend, recorder, sim, trajectories
+
+
+class CountingPanda(sim.SimPanda):
+    """Robot whose state counts how often it was read."""
+
+    reads = 0
+
+    def get_state(self) -> types.SimpleNamespace:
+        self.reads += 1
+        return types.SimpleNamespace(q=[self.reads] * 7, dq=[-self.reads] * 7)
+
+
+def test_recorder(tmp_path):
+    world = sim.SimWorld(backend.Clock(10.0), seed=0)
+    left, right = (
+        typing.cast(panda_py.Panda, CountingPanda(name, world))
+        for name in ("left", "right")
+    )
+    paths = [tmp_path / "left_motion.npy", tmp_path / "right_motion.npy"]
+
+    with recorder.Recorder([left, right], paths, chunk_size=64, chunks=2) as rec:
+        world.clock.sleep(1.0)
+    assert rec.samples > 500
+
+    store = trajectories.TrajectoryStore(tmp_path)
+    left_data, right_data = store.load(paths[0].name), store.load(paths[1].name)
+    assert left_data.shape == right_data.shape == (rec.samples, 14)
+    np.testing.assert_array_equal(left_data[:, :7], -left_data[:, 7:])
+    # Both arms are sampled on every tick
+    np.testing.assert_array_equal(left_data, right_data)
+    np.testing.assert_array_equal(left_data[:, 0], np.arange(1, rec.samples + 1))
+
+
+def test_motion(tmp_path):
+    world = sim.SimWorld(backend.Clock(10.0), seed=0)
+    robot = typing.cast(panda_py.Panda, sim.SimPanda("right", world))
+    q, dq = trajectories.store.load_retimed("place_cup.csv", 1.0)
+    robot.move_to_joint_position(q[0], speed_factor=1.0)
+    path = tmp_path / "motion.npy"
+    with recorder.Recorder([robot], [path]):
+        actions.play_trajectory(robot, q[:300], dq[:300])
+    data = trajectories.TrajectoryStore(tmp_path).load(path.name)
+    assert data.shape[1] == 14
+    moving = data[np.any(data[:, 7:] != 0, axis=1)]
+    assert len(moving) > 100
+    # The recorded states are samples of the trajectory
+    samples = np.hstack([q[:300], dq[:300]])
+    distance = np.abs(moving[:, None] - samples[None]).max(axis=2).min(axis=1)
+    np.testing.assert_array_equal(distance, 0)
+
+
+def test_header(tmp_path):
+    for rows in (0, 1, 10**12):
+        header = recorder._header(rows)  # pylint: disable=protected-access
+        assert len(header) == recorder.HEADER_SIZE
+        path = tmp_path / "header.npy"
+        path.write_bytes(header + bytes(8 * 14 * min(rows, 1)))
+        if rows < 10:
+            assert np.load(path).shape == (rows, 14)
+
+
+def test_launcher(tmp_path):
+    argv = ["trinkgelage-record", "motion", "--sim", "--duration", "0.05"]
+    with mock.patch.object(sys, "argv", [*argv, "-o", str(tmp_path)]):
+        record.main()
+    assert (tmp_path / "left_motion.npy").exists()
+    with mock.patch.object(sys, "argv", [*argv, "-o", str(tmp_path), "--arm", "right"]):
+        record.main()
+    assert len(np.load(tmp_path / "motion.npy")) > 0
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from trinkgelage.robot import actions, backend, recovery, sim, trajectories
+
+
+@pytest.fixture
+def robot():
+    world = sim.SimWorld(backend.Clock(1000.0), seed=0)
+    return sim.SimPanda("sim", world)
+
+
+def test_resume_trajectory(robot):
+    q, dq = trajectories.store.load_retimed("place_cup.csv", 1.0)
+    recovery.history.clear()
+    robot.fault_at = 500
+    assert actions.play_trajectory(robot, q, dq)
+    np.testing.assert_allclose(robot.q, q[-1])
+
+    (cost,) = recovery.history
+    assert cost.action == "play_trajectory"
+    assert cost.interrupted_at == 500
+    assert cost.resumed_at == 500 - recovery.policy.backoff + 1
+    assert 0 < cost.reapproach_time < 0.5
+    assert cost.cost < 1.0
+
+
+def test_reentry():
+    q, dq = trajectories.store.load_retimed("place_cup.csv", 1.0)
+    q, dq = np.asarray(q), np.asarray(dq)
+    policy = recovery.RecoveryPolicy(backoff=100, speed_factor=0.5)
+    q_move, dq_move, resume = recovery.reentry(q[1500] + 0.05, q, dq, 1500, 0, policy)
+    assert resume == 1401
+    np.testing.assert_allclose(q_move[-1], q[1400])
+    np.testing.assert_allclose(dq_move[-1], dq[1400])
+    assert np.all(np.abs(dq_move) <= trajectories.MAX_JOINT_VELOCITY * 0.5 * 1.001)
+    ddq_move = np.diff(dq_move, axis=0, prepend=0.0) * 1000
+    assert np.all(np.abs(ddq_move) <= trajectories.MAX_JOINT_ACCELERATION * 1.001)
+    # Integrating the velocities yields the positions
+    np.testing.assert_allclose(
+        np.cumsum(dq_move, axis=0)[-1] / 1000, q[1400] - q[1500] - 0.05, atol=5e-3
+    )
+
+    _, _, resume = recovery.reentry(q[50], q, dq, 50, 20, policy)
+    assert resume == 21
+
+    # Short moves take long enough to keep the acceleration and jerk
+    # within the limits
+    policy.min_duration = 0.0
+    q_rest, dq_rest = np.tile(q[0], (200, 1)), np.zeros((200, 7))
+    offset = np.array([0.0, 0.01, 0.0, 0.0, 0.0, 0.0, 0.0])
+    q_move, _, _ = recovery.reentry(q[0] + offset, q_rest, dq_rest, 150, 0, policy)
+    tf = max(
+        np.sqrt(5.77 * 0.01 / trajectories.MAX_JOINT_ACCELERATION[1]),
+        np.cbrt(60 * 0.01 / trajectories.MAX_JOINT_JERK[1]),
+    )
+    assert len(q_move) == pytest.approx(tf * 1000, abs=1)
+
+
+def test_resume_start(robot):
+    q, dq = trajectories.store.load_retimed("place_cup.csv", 1.0)
+    recovery.history.clear()
+    # The move to the start of the trajectory recovers as well
+    robot.error = "joint_reflex"
+    assert actions.play_trajectory(robot, q, dq)
+    np.testing.assert_allclose(robot.q, q[-1])
+    (cost,) = recovery.history
+    assert cost.action == "move_to_joint_position"
+
+
+def test_retry(robot):
+    recovery.history.clear()
+    robot.error = "joint_reflex"
+    assert actions.move_to_joint_position(robot, sim.START_POSITION)
+    assert robot.error is None
+    assert len(recovery.history) == 1
+
+    failing = mock.MagicMock()
+    failing.move_to_pose.side_effect = RuntimeError("reflex")
+    assert not actions.move_to_pose(failing, np.eye(4), max_retries=2)
+    assert failing.move_to_pose.call_count == 3
+    assert failing.recover.call_count == 2
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from trinkgelage.robot import backend, sensing
+
+
+def test_ring_buffer():
+    buffer = sensing.RingBuffer(4, 2)
+    for i in range(6):
+        buffer.append(i, [i, -i])
+    assert len(buffer) == 4
+    times, values = buffer.last()
+    assert times.tolist() == [2, 3, 4, 5]
+    assert values[:, 1].tolist() == [-2, -3, -4, -5]
+    assert buffer.last(2)[0].tolist() == [4, 5]
+    assert buffer.since(3.5)[0].tolist() == [4, 5]
+    buffer.clear()
+    assert len(buffer.last()[0]) == 0
+
+
+def test_filters():
+    robot = mock.MagicMock()
+    sampler = sensing.ForceSampler(robot, rate=100.0)
+    now = sampler.clock.time()
+    values = np.random.default_rng(0).normal(size=(50, 6))
+    for k, value in enumerate(values):
+        sampler.buffer.append(now - (50 - k) * 0.01, value)
+    window = sampler.window(1.0)
+    assert len(window) == 50
+    np.testing.assert_allclose(sampler.mean(1.0), values.mean(axis=0))
+    np.testing.assert_allclose(sampler.median(1.0), np.median(values, axis=0))
+
+    alpha = 1 - np.exp(-2 * np.pi * 5.0 / sampler.rate)
+    y = values[0]
+    for x in values[1:]:
+        y = y + alpha * (x - y)
+    np.testing.assert_allclose(sampler.lowpass(5.0, 1.0), y)
+
+
+def test_sampler():
+    robot = mock.MagicMock()
+    robot.get_state.return_value.O_F_ext_hat_K = [0.0, 0.0, -1.0, 0.0, 0.0, 0.0]
+    sampler = sensing.ForceSampler(robot, backend.Clock(), rate=1000.0)
+    assert sampler.mean()[2] == -1.0
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    assert not sampler.running
+    assert len(sampler.buffer) > 10
+    assert sampler.median(1.0)[2] == pytest.approx(-1.0)
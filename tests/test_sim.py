@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import logging
+import time
+
+import numpy as np
+import panda_py
+import pytest
+
+from trinkgelage.demo import control
+from trinkgelage.monitoring import metrics
+from trinkgelage.robot import actions, backend, sim, trajectories
+
+
+def test_demo_cycle():
+    # Slow enough that a pause of the test process barely delays closing
+    # the faucet, which would overfill the second cup
+    world = sim.SimWorld(backend.Clock(30.0), seed=0)
+    robot_backend = sim.SimBackend(world=world)
+    model = control.DemoModel(
+        robot_backend.left,
+        robot_backend.right,
+        enforce_rt=False,
+        robot_backend=robot_backend,
+        keg="sim",
+    )
+    ctrl = control.DemoControl(model)
+    ctrl.start_demo()
+
+    assert ctrl.current_state == control.DemoControl.idle
+    assert model.cups == model.max_cups - 1
+    assert model.cup_load() > model.pour.target
+    assert model.pour.calibration.cups == 1
+    assert not world.faucet_open
+    assert not world.holding_cup
+    assert world.clock.time() > 10.0
+
+    # The second cup uses the closing latency learned from the first
+    ctrl.start_demo()
+    assert model.cups == model.max_cups - 2
+    assert model.cup_load() == pytest.approx(model.pour.target, abs=0.1)
+
+
+def test_pipelined():
+    backend = sim.SimBackend(speed=100.0)
+    model = control.DemoModel(
+        backend.left,
+        backend.right,
+        enforce_rt=False,
+        robot_backend=backend,
+        keg="sim",
+        pipelined=True,
+    )
+    ctrl = control.DemoControl(model)
+    ctrl.start_demo()
+
+    # The cycle ends without waiting for pickup and the left arm stays
+    # at the faucet while the right arm approaches the next cup
+    assert ctrl.current_state == control.DemoControl.idle
+    assert not model.place_free.is_set()
+    np.testing.assert_allclose(
+        model.left.q, trajectories.load("pre_grasp_faucet.csv"), atol=1e-6
+    )
+    model.wait_for()
+    pre_grasp_cup, _, _ = model.cup_poses(2)
+    np.testing.assert_allclose(panda_py.fk(model.right.q), pre_grasp_cup, atol=1e-3)
+
+    ctrl.start_demo()
+    model.wait_for()
+    assert model.cups == model.max_cups - 2
+    assert not backend.world.faucet_open
+
+
+def test_orders(caplog):
+    backend = sim.SimBackend(speed=100.0)
+    model = control.DemoModel(
+        backend.left,
+        backend.right,
+        enforce_rt=False,
+        robot_backend=backend,
+        keg="sim",
+    )
+    ctrl = control.DemoControl(model)
+    served = metrics.cups_served.value(station="")
+    cycles = metrics.cycle_time.count(station="")
+    latencies = metrics.order_latency.count(station="", source="test")
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        for _ in range(3):
+            ctrl.order("test")
+        deadline = time.monotonic() + 60
+        while model.dispatching and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # The orders are served back to back without returning to idle
+    assert ctrl.current_state == control.DemoControl.idle
+    assert model.cups == model.max_cups - 3
+    assert not model.orders
+    assert len(model.orders.served) == 3
+    assert caplog.text.count('Action "next_order" triggered') == 2
+    assert caplog.text.count('Entered state "idle"') == 1
+    assert metrics.cups_served.value(station="") == served + 3
+    assert metrics.cycle_time.count(station="") == cycles + 3
+    assert metrics.order_latency.count(station="", source="test") == latencies + 3
+    assert metrics.state_time.value(station="", state="pouring") > 0
+
+
+def test_failed_order(monkeypatch, caplog):
+    backend = sim.SimBackend(speed=100.0)
+    model = control.DemoModel(
+        backend.left,
+        backend.right,
+        enforce_rt=False,
+        robot_backend=backend,
+        keg="sim",
+    )
+    ctrl = control.DemoControl(model)
+    two_arm_motion = actions.two_arm_motion_from_files
+    failures = [True]
+
+    def fail_once(*args, **kwargs):
+        if failures:
+            failures.pop()
+            return False
+        return two_arm_motion(*args, **kwargs)
+
+    monkeypatch.setattr(actions, "two_arm_motion_from_files", fail_once)
+
+    def wait_for_dispatch() -> None:
+        deadline = time.monotonic() + 60
+        while model.dispatching and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not model.dispatching
+
+    # The failed order returns to the head of the queue
+    with caplog.at_level(logging.INFO):
+        first = ctrl.order("test")
+        wait_for_dispatch()
+    assert "Demo cycle failed" in caplog.text
+    assert ctrl.current_state == control.DemoControl.idle
+    assert len(model.orders) == 1
+    assert model.current_order is None
+    assert not model.pending
+
+    # The next order serves both
+    second = ctrl.order("test")
+    wait_for_dispatch()
+    assert ctrl.current_state == control.DemoControl.idle
+    assert not model.orders
+    assert list(model.orders.served) == [first, second]
+
+
+def test_empty_tray():
+    backend = sim.SimBackend(speed=100.0)
+    model = control.DemoModel(
+        backend.left,
+        backend.right,
+        enforce_rt=False,
+        robot_backend=backend,
+        keg="sim",
+    )
+    model.cups = 0
+    ctrl = control.DemoControl(model)
+
+    def wait_for_dispatch() -> None:
+        deadline = time.monotonic() + 60
+        while model.dispatching and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not model.dispatching
+
+    # The order waits for the refill instead of being dropped
+    order = ctrl.order("menu")
+    wait_for_dispatch()
+    assert ctrl.current_state == control.DemoControl.cups_empty
+    assert len(model.orders) == 1
+    assert model.current_order is None
+
+    ctrl.refill_cups()
+    ctrl.serve()
+    wait_for_dispatch()
+    assert ctrl.current_state == control.DemoControl.idle
+    assert model.cups == model.max_cups - 1
+    assert not model.orders
+    assert list(model.orders.served) == [order]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import threading
+import time
+from unittest import mock
+
+from trinkgelage.demo import start_button
+
+
+class Button(start_button.StartButton):
+    def __init__(self, **kwargs) -> None:
+        self.pressed = threading.Event()
+        self.presses = 0
+        super().__init__(**kwargs)
+
+    def handle_event(self) -> None:
+        self.presses += 1
+        self.pressed.set()
+
+
+def wait_for_tty(button: start_button.StartButton) -> None:
+    deadline = time.monotonic() + 5
+    while button._tty is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert button._tty is not None
+
+
+def test_loop():
+    button = Button(port="loop://")
+    wait_for_tty(button)
+    assert button._tty is not None
+    button._tty.write(b"id=start_button,btn=1\nid=start_button,btn=0\n")
+    assert button.pressed.wait(5)
+    assert button.presses == 1
+    assert len(button.latencies) == 1
+    start = time.perf_counter()
+    button.close()
+    assert time.perf_counter() - start < 1
+    assert not button.thread.is_alive()
+
+
+def test_debounce():
+    button = Button(port="loop://", debounce=10.0)
+    button.parse_line("btn=0")
+    button.parse_line("btn=1")
+    button.parse_line("btn=0")
+    assert button.presses == 1
+    button.debounce = 0
+    button.parse_line("btn=1")
+    button.parse_line("btn=0")
+    button.parse_line("btn=x")
+    assert button.presses == 2
+    button.close()
+
+
+def test_find_port():
+    ports = [
+        mock.Mock(device=d) for d in ["/dev/ttyS0", "/dev/ttyACM0", "/dev/ttyACM1"]
+    ]
+    probed = []
+
+    def probe(port, stop=None):
+        del stop
+        probed.append(port)
+        return port == "/dev/ttyACM1"
+
+    button = Button(port="loop://")
+    start_button.get_port_cache_path().unlink(missing_ok=True)
+    with mock.patch(
+        "serial.tools.list_ports.comports", return_value=ports
+    ), mock.patch.object(button, "probe", side_effect=probe):
+        assert button.find_port() == "/dev/ttyACM1"
+        assert sorted(probed) == ["/dev/ttyACM0", "/dev/ttyACM1"]
+        probed.clear()
+        # The cached port is tried first
+        assert button.find_port() == "/dev/ttyACM1"
+        assert probed == ["/dev/ttyACM1"]
+        probed.clear()
+        ports.pop()
+        assert button.find_port() is None
+        assert probed == ["/dev/ttyACM0"]
+    button.close()
+
+
+def test_callback():
+    pressed = threading.Event()
+    button = start_button.CallbackButton(pressed.set, port="loop://")
+    wait_for_tty(button)
+    assert button._tty is not None
+    button._tty.write(b"id=start_button,btn=1\nid=start_button,btn=0\n")
+    assert pressed.wait(5)
+    button.close()
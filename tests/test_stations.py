@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from trinkgelage.demo import control
+from trinkgelage.launchers import stations
+from trinkgelage.monitoring import metrics, tracing
+from trinkgelage.robot import backend, executor, sim
+
+
+class UnreachableBackend(backend.Backend):
+    def panda(self, hostname, realtime_config):
+        del realtime_config
+        msg = f"Unable to connect to {hostname}"
+        raise RuntimeError(msg)
+
+
+def test_load_stations(tmp_path):
+    path = tmp_path / "stations.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"name": "a", "left": "10.0.0.1", "right": "10.0.0.2"},
+                {"name": "b", "left": "10.0.0.3", "right": "10.0.0.4", "keg": "b"},
+            ]
+        )
+    )
+    configs = stations.load_stations(path)
+    assert [c.name for c in configs] == ["a", "b"]
+    assert configs[1].keg == "b"
+    assert configs[0].button is None
+
+    path.write_text(json.dumps([{"name": "a", "left": "x", "right": "y"}] * 2))
+    with pytest.raises(ValueError, match="unique"):
+        stations.load_stations(path)
+
+
+def test_orchestrator():
+    def make_backend(config):
+        if config.name == "broken":
+            return UnreachableBackend()
+        return sim.SimBackend(config.left, config.right, speed=100.0)
+
+    orchestrator = stations.Orchestrator(
+        [
+            stations.StationConfig("a", "a-left", "a-right", keg="sim"),
+            stations.StationConfig("broken", "b-left", "b-right"),
+            stations.StationConfig("c", "c-left", "c-right", keg="sim"),
+        ],
+        backend_factory=make_backend,
+    )
+    ready = orchestrator.connect()
+    assert [s.config.name for s in ready] == ["a", "c"]
+    assert orchestrator["broken"].status.startswith("failed")
+    assert not orchestrator["broken"].send("start_demo")
+
+    assert orchestrator["a"].send("start_demo")
+    assert not orchestrator["a"].send("start_demo")
+    assert orchestrator["c"].send("start_demo")
+    for station in ready:
+        assert station.wait(60)
+        assert station.error is None
+        assert station.control is not None
+        assert station.control.current_state == control.DemoControl.idle
+        assert station.model is not None
+        assert station.model.cups == station.model.max_cups - 1
+    assert "a: idle" in orchestrator.status()
+    models = [station.model for station in ready]
+    orchestrator.close()
+    for model in models:
+        assert model is not None
+        assert not model.right_sampler.running
+        for robot in (model.left, model.right):
+            assert all(key[0] != id(robot) for key in executor._executors)
+
+
+def test_station_orders(tmp_path):
+    orchestrator = stations.Orchestrator(
+        [
+            stations.StationConfig("d", "d-left", "d-right", keg="sim"),
+            stations.StationConfig("e", "e-left", "e-right", keg="sim"),
+        ],
+        backend_factory=lambda c: sim.SimBackend(c.left, c.right, speed=100.0),
+    )
+    tracing.tracer.clear()
+    tracing.tracer.enable()
+    try:
+        orchestrator.connect()
+        # The button and the menu place orders, served back to back
+        orchestrator["d"].button_pressed()
+        assert orchestrator["d"].order("menu")
+        assert orchestrator["e"].order("menu")
+        for station in orchestrator.stations:
+            assert station.wait(60)
+        trace = tmp_path / "trace.json"
+        tracing.tracer.export(trace)
+    finally:
+        tracing.tracer.disable()
+    cycles = list(tracing.tracer.cycles)
+    tracing.tracer.clear()
+    d, e = orchestrator["d"].model, orchestrator["e"].model
+    assert d is not None
+    assert e is not None
+    assert len(d.orders.served) == 2
+    assert len(e.orders.served) == 1
+    orchestrator.close()
+
+    # The metrics and the trace of the stations are kept apart
+    assert metrics.cups_served.value(station="d") == 2
+    assert metrics.cups_served.value(station="e") == 1
+    assert metrics.cups_remaining.value(station="d") < metrics.cups_remaining.value(
+        station="e"
+    )
+    assert metrics.order_latency.count(station="d", source="button") == 1
+    assert sorted(c.process for c in cycles) == ["d", "d", "e"]
+    with trace.open() as f:
+        events = json.load(f)["traceEvents"]
+    processes = {
+        e["args"]["name"]: e["pid"] for e in events if e["name"] == "process_name"
+    }
+    assert {"d", "e"} <= set(processes)
+    assert processes["d"] != processes["e"]
+    pick_cups = [e["pid"] for e in events if e["name"] == "pick_cup"]
+    assert sorted(pick_cups) == sorted([processes["d"]] * 2 + [processes["e"]])
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from unittest import mock
+
+import numpy as np
+
+from trinkgelage.robot import actions, timing
+
+
+def test_report():
+    timer = timing.TickTimer(10)
+    ticks = [0, 1, 2, 5, 6, 7, 8, 9, 10, 11, 12]
+    times = [0.0, 1.0, 2.0, 5.5, 6.0, 7.0, 8.0, 11.0, 12.0, 13.0, 14.0]
+    with mock.patch("time.perf_counter_ns", side_effect=[t * 1e6 for t in times]):
+        for i in ticks:
+            timer.tick(i)
+    assert timer.count == 10
+    report = timer.report()
+    assert report.ticks == 10
+    assert report.overruns == 1
+    np.testing.assert_array_equal(report.overrun_indices, [9])
+    assert report.max_lag == 1.5
+    assert report.percentiles[50] == 1.0
+    assert "overruns at samples [9]" in str(report)
+
+
+@mock.patch("panda_py.Panda")
+def test_play_trajectory(mock_panda):
+    robot = mock_panda.return_value
+    ctx = robot.create_context.return_value.__enter__.return_value
+    ctx.ok.side_effect = [True] * 50 + [RuntimeError("reflex")] + [True] * 200
+    robot.get_state.return_value.q = [0.0] * 7
+    q = np.zeros((100, 7))
+    with mock.patch("panda_py.controllers.JointPosition"), mock.patch.object(
+        timing, "enabled", True
+    ):
+        assert actions.play_trajectory(robot, q, q)
+    report = timing.reports[-1]
+    # Playback resumes at the start, which is less than the backoff before
+    assert report.ticks == 50 + 99
+    assert report.max_lag < 100
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+import threading
+from unittest import mock
+
+import pytest
+
+from trinkgelage.demo import control
+from trinkgelage.monitoring import tracing
+
+
+@pytest.fixture
+def tracer():
+    tracing.tracer.clear()
+    tracing.tracer.enable()
+    yield tracing.tracer
+    tracing.tracer.disable()
+    tracing.tracer.clear()
+
+
+def test_disabled():
+    t = tracing.Tracer()
+    with t.span("span"):
+        pass
+    t.begin("begin")
+    t.end("begin")
+    assert not t.events
+
+
+def test_spans(tracer, tmp_path):
+    @tracer.traced
+    def work():
+        with tracer.span("inner", "test"):
+            pass
+
+    tracer.begin_cycle()
+    work()
+    thread = threading.Thread(target=work, name="worker")
+    thread.start()
+    thread.join()
+    tracer.begin("state", "test")
+    tracer.end_all("test")
+    tracer.end_cycle()
+
+    names = [e.name for e in tracer.events]
+    assert names.count("inner") == 2
+    assert names.count("test_spans.<locals>.work") == 2
+    assert names[-2:] == ["state", "cycle"]
+    assert len({e.thread for e in tracer.events}) == 2
+    summary = dict(tracer.summary(tracer.cycles[0]))
+    assert set(summary) == {"inner", "test_spans.<locals>.work", "state"}
+
+    tracer.export(tmp_path / "trace.json")
+    with (tmp_path / "trace.json").open() as f:
+        trace = json.load(f)
+    assert "worker" in [
+        e["args"]["name"] for e in trace["traceEvents"] if e["ph"] == "M"
+    ]
+    assert len([e for e in trace["traceEvents"] if e["ph"] == "X"]) == len(names)
+    assert len(trace["cycles"]) == 1
+
+
+def test_processes(tracer):
+    barrier = threading.Barrier(2)
+
+    def station(name):
+        tracer.set_process(name)
+        tracer.begin_cycle()
+        barrier.wait()
+        with tracer.span(f"work-{name}", "test"):
+            barrier.wait()
+        tracer.end_cycle()
+
+    threads = [threading.Thread(target=station, args=(n,)) for n in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The cycles of the stations overlap, but only hold their own spans
+    assert sorted(c.process for c in tracer.cycles) == ["a", "b"]
+    for cycle in tracer.cycles:
+        assert [name for name, _ in tracer.summary(cycle)] == [f"work-{cycle.process}"]
+    assert tracer.process == ""
+
+
+@mock.patch("panda_py.Panda")
+@mock.patch("panda_py.libfranka.Gripper")
+@mock.patch("trinkgelage.demo.control.DemoModel.cup_full", return_value=True)
+@mock.patch("trinkgelage.demo.control.DemoModel.user_pickup", return_value=True)
+def test_demo_cycle(mock_pickup, mock_cup_full, mock_gripper, mock_panda, tracer):
+    del mock_pickup, mock_cup_full, mock_panda
+    mock_gripper.return_value.read_once.return_value.width = 0.03
+    model = control.DemoModel("left", "right")
+    ctrl = control.DemoControl(model)
+    ctrl.start_demo()
+
+    assert len(tracer.cycles) == 1
+    summary = dict(tracer.summary(tracer.cycles[0]))
+    for name in ["pick_cup", "place_cup", "motion_from_file", "play_trajectory"]:
+        assert name in summary
+    threads = {tracer.thread_names[e.thread] for e in tracer.events}
+    assert {"left", "right"} <= threads
+    model.close()
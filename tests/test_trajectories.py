@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import os
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from trinkgelage.robot import actions, trajectories
+
+
+@pytest.fixture
+def store(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    np.savetxt(data / "traj.csv", np.arange(28.0).reshape(2, 14), delimiter=",")
+    np.savetxt(data / "pose.csv", np.arange(7.0)[None], delimiter=",")
+    return trajectories.TrajectoryStore(data, tmp_path / "cache")
+
+
+def test_load_binary(store):
+    traj = store.load("traj.csv")
+    assert isinstance(traj, np.memmap)
+    assert not traj.flags.writeable
+    np.testing.assert_array_equal(traj, np.arange(28.0).reshape(2, 14))
+    assert store.load("pose.csv").shape == (7,)
+    assert len(list(store.cache_path.glob("*.npy"))) == 2
+
+    fresh = trajectories.TrajectoryStore(store.data_path, store.cache_path)
+    with mock.patch("numpy.loadtxt") as mock_loadtxt:
+        np.testing.assert_array_equal(fresh.load("traj.csv"), traj)
+        assert fresh.load("traj.csv") is fresh.load("traj.csv")
+    mock_loadtxt.assert_not_called()
+
+
+def test_invalidate(store):
+    store.load("traj.csv")
+    source = store.data_path / "traj.csv"
+    np.savetxt(source, np.ones((3, 14)), delimiter=",")
+    os.utime(source, ns=(0, 0))
+    np.testing.assert_array_equal(store.load("traj.csv"), np.ones((3, 14)))
+    assert len(list(store.cache_path.glob("traj-*.npy"))) == 1
+
+
+def test_write_atomic(tmp_path):
+    path = tmp_path / "cache" / "file.bin"
+    trajectories.write_atomic(path, lambda f: f.write(b"old"))
+
+    def fail(f):
+        f.write(b"partial")
+        msg = "disk full"
+        raise OSError(msg)
+
+    with pytest.raises(OSError, match="disk full"):
+        trajectories.write_atomic(path, fail)
+    assert path.read_bytes() == b"old"
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_load_csv():
+    q = actions.load_csv("grasp_cup_1.csv")
+    assert q.shape == (7,)
+    assert actions.load_csv("place_cup.csv").shape[1] == 14
+
+
+@pytest.mark.parametrize("time_scale", [0.5, 1.0, 2.0, 3.0])
+def test_retime(time_scale):
+    t = np.arange(1001) / 1000.0
+    q = np.repeat(np.sin(t)[:, None], 7, axis=1)
+    dq = np.repeat(np.cos(t)[:, None], 7, axis=1)
+    q_new, dq_new = trajectories.retime(q, dq, time_scale)
+    assert len(q_new) == pytest.approx(1000 / time_scale + 1, abs=1)
+    np.testing.assert_array_equal(q_new[[0, -1]], q[[0, -1]])
+    t_new = np.minimum(np.arange(len(q_new)) * time_scale / 1000.0, 1.0)
+    np.testing.assert_allclose(q_new[:, 0], np.sin(t_new), atol=1e-6)
+    np.testing.assert_allclose(dq_new[:, 0], time_scale * np.cos(t_new), atol=1e-5)
+
+
+def test_load_retimed(store):
+    q, dq = store.load_retimed("traj.csv", 0.5)
+    assert q.shape == (3, 7)
+    assert dq.shape == (3, 7)
+    assert store.load_retimed("traj.csv", 0.5)[0] is q
+    np.testing.assert_array_equal(store.load_retimed("traj.csv")[0], q[[0, 2]])
+    with pytest.raises(ValueError, match="positive"):
+        store.load_retimed("traj.csv", 0.0)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from unittest import mock
+
+import numpy as np
+import panda_py
+import pytest
+
+from trinkgelage.demo import tray
+from trinkgelage.robot import trajectories
+
+
+def test_slot_table(tmp_path):
+    layout = tray.TrayLayout()
+    table = tray.SlotTable.load(layout, tmp_path / "tray.npz")
+    assert len(table) == layout.max_cups == 12
+
+    grasp_1 = panda_py.fk(trajectories.load(layout.reference))
+    for idx in range(1, len(table) + 1):
+        slot = table[idx]
+        np.testing.assert_allclose(slot.poses, layout.poses(idx, grasp_1))
+        for q, pose in zip(slot.q, slot.poses):
+            np.testing.assert_allclose(panda_py.fk(q), pose, atol=1e-3)
+        for (q, dq), start, end in ((slot.approach, 0, 1), (slot.retreat, 1, 2)):
+            np.testing.assert_allclose(q[0], slot.q[start])
+            np.testing.assert_allclose(q[-1], slot.q[end])
+            np.testing.assert_allclose(dq[[0, -1]], 0, atol=1e-9)
+            limit = trajectories.MAX_JOINT_VELOCITY * layout.speed_factor
+            assert np.all(np.abs(dq) <= limit * 1.01)
+            np.testing.assert_allclose(np.diff(q, axis=0), dq[1:] / 1000, atol=1e-3)
+
+    with pytest.raises(IndexError):
+        table[0]
+    with pytest.raises(IndexError):
+        table[13]
+
+
+def test_configurations(tmp_path):
+    layout = tray.TrayLayout()
+    table = tray.SlotTable.load(layout, tmp_path / "tray.npz")
+    # The reference cup is grasped as taught
+    q_1 = np.asarray(trajectories.load(layout.reference))
+    np.testing.assert_allclose(table[1].q[1], q_1, atol=1e-2)
+    # Neighbouring cups are grasped in similar configurations
+    for idx in range(1, len(table) + 1):
+        for other in (idx + 1, idx + layout.columns):
+            if other > len(table) or (other == idx + 1 and idx % layout.columns == 0):
+                continue
+            assert np.max(np.abs(table[idx].q[1] - table[other].q[1])) < 0.5
+
+
+def test_cache(tmp_path):
+    layout = tray.TrayLayout(columns=2, rows=2)
+    path = tmp_path / "tray.npz"
+    table = tray.SlotTable.load(layout, path)
+    assert len(table) == 4
+    assert path.exists()
+    assert path.with_suffix(".npy").exists()
+
+    with mock.patch("trinkgelage.demo.tray.SlotTable.build") as mock_build:
+        cached = tray.SlotTable.load(layout, path)
+    mock_build.assert_not_called()
+    assert isinstance(cached[4].approach[0], np.memmap)
+    for slot, cached_slot in zip(table.slots, cached.slots):
+        for a, b in zip(slot, cached_slot):
+            np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+
+    # A table of another layout is rebuilt
+    assert len(tray.SlotTable.load(tray.TrayLayout(), path)) == 12
+    assert tray.get_slot_table_path(layout) != tray.get_slot_table_path(
+        tray.TrayLayout()
+    )